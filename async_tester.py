@@ -0,0 +1,214 @@
+import asyncio
+import time
+from typing import Callable, List, Optional
+from dataclasses import dataclass
+from tester import APITester, TestResult
+from providers import BaseProvider
+from http_pool import close_async_http_client
+import profiling
+
+@dataclass
+class AsyncTestConfig:
+    """异步测试配置"""
+    max_concurrency: int = 100    # 事件循环上同时进行的最大流数量
+    streams_per_provider: int = 1 # 每个服务商发起的流数量
+    timeout: int = 300            # 单个请求的截止时间（秒），超时后关闭流并返回部分结果
+    run_timeout: Optional[float] = None    # 整轮测试的截止时间（秒）
+    stall_timeout: Optional[float] = None  # 开始输出后两个分块之间允许的最长间隔（秒）
+    metrics_only: bool = False      # 仅保留计数和字符长度，不保存生成文本
+    sink_dir: Optional[str] = None  # 生成文本的落盘目录（每个测试一个文件）
+    prewarm: bool = False           # 计时前在事件循环上为每个服务商建立连接
+    raw_sse: bool = False           # 直接解析 SSE 字节流，跳过 SDK 对象构造
+
+class AsyncAPITester(APITester):
+    """基于 asyncio 的 API 测试器，复用 APITester 的分块处理逻辑"""
+
+    async def test_provider(self, provider, messages, deadline_at=None, max_tokens=None) -> Optional[TestResult]:
+        """
+        在事件循环中测试单个服务商
+
+        Args:
+            provider: Provider instance
+            messages: List of message dictionaries
+            deadline_at: 可选的绝对截止时间（time.perf_counter()），例如整轮测试的截止时间
+            max_tokens: 可选的输出 token 上限
+
+        Returns:
+            TestResult object if successful or cut off by a deadline (partial, with
+            status 'timeout' or 'stalled'), None if failed
+        """
+        self._print_header(provider)
+
+        try:
+            # 客户端在首次使用时创建，放在计时开始之前
+            if provider.async_client is None:
+                provider.setup_async_client()
+            self._start(provider, deadline_at, messages)
+
+            # 创建流式请求；等待响应头的时间同样受截止时间约束
+            if self.raw_sse:
+                request = provider.create_completion_raw_async(messages, timeout=self._time_left(), max_tokens=max_tokens)
+            else:
+                request = provider.create_completion_async(messages, timeout=self._time_left(), max_tokens=max_tokens)
+            self._response = await asyncio.wait_for(request, timeout=self._time_left())
+
+            # 处理每个分块；设置了截止时间时，每次等待分块都以剩余时间为上限
+            chunks = self._response.__aiter__()
+            while True:
+                wait = self._next_wait(time.perf_counter())
+                try:
+                    if wait is None:
+                        chunk = await chunks.__anext__()
+                    else:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=wait)
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    self.status = self._check_deadline(time.perf_counter()) or 'timeout'
+                    break
+                self._on_chunk(chunk)
+
+            return self._finish(provider)
+
+        except asyncio.TimeoutError:
+            self.status = 'timeout'
+            return self._finish(provider)
+
+        except Exception as e:
+            if self.status is None and self._time_left() == 0:
+                # SDK 的请求超时（APITimeoutError / httpx 读超时）先于 wait_for 触发
+                self.status = 'timeout'
+            if self.status is not None:
+                return self._finish(provider)
+            return self._handle_error(provider, e)
+
+        finally:
+            if self.status is not None and self._response is not None:
+                try:
+                    await self._response.close()
+                except Exception:
+                    pass
+            self._response = None
+
+class AsyncParallelAPITester:
+    """异步并发API测试器：所有流运行在同一个事件循环上，不额外占用线程"""
+
+    def __init__(self, config: AsyncTestConfig = None):
+        self.config = config or AsyncTestConfig()
+
+    def test_providers(
+        self,
+        providers: List[BaseProvider],
+        messages: List[dict],
+        max_tokens: Optional[int] = None,
+        on_result: Optional[Callable[[BaseProvider, Optional[TestResult]], None]] = None
+    ):
+        """
+        并发测试多个提供商（同步入口）
+
+        Args:
+            providers: 提供商实例列表
+            messages: 测试消息列表
+            max_tokens: 可选的输出 token 上限
+            on_result: 可选回调，每个流完成时在事件循环线程中以 (服务商, 结果) 调用，失败时结果为 None
+
+        Returns:
+            list: 测试结果列表
+        """
+        return asyncio.run(self.test_providers_async(providers, messages, max_tokens, on_result))
+
+    async def test_providers_async(
+        self,
+        providers: List[BaseProvider],
+        messages: List[dict],
+        max_tokens: Optional[int] = None,
+        on_result: Optional[Callable[[BaseProvider, Optional[TestResult]], None]] = None
+    ):
+        """并发测试多个提供商（协程版本）"""
+        results = []
+        active_providers = [p for p in providers if p.is_available()]
+
+        if not active_providers:
+            print("没有可用的服务商")
+            return results
+
+        # 每个事件循环有独立的连接池，开始时所有服务商均为冷启动
+        if self.config.prewarm:
+            await self._prewarm(active_providers)
+        # 客户端（以及首次使用时的 openai 导入）会阻塞事件循环，在计时开始前创建
+        for provider in active_providers:
+            if provider.async_client is None:
+                provider.setup_async_client()
+
+        deadline_at = time.perf_counter() + self.config.run_timeout if self.config.run_timeout else None
+        semaphore = asyncio.Semaphore(self.config.max_concurrency)
+        monitor = profiling.start_loop_monitor()
+        tasks = [
+            self._test_single_provider(provider, messages, semaphore, deadline_at, max_tokens, on_result)
+            for provider in active_providers
+            for _ in range(self.config.streams_per_provider)
+        ]
+
+        try:
+            for result in await asyncio.gather(*tasks):
+                if result:
+                    results.append(result)
+        finally:
+            profiling.stop_loop_monitor(monitor)
+            # 异步客户端绑定当前事件循环，结束时关闭
+            for provider in active_providers:
+                await provider.close_async_client()
+            await close_async_http_client()
+
+        return sorted(results, key=lambda x: x.provider)  # 按提供商名称排序
+
+    async def _prewarm(self, providers: List[BaseProvider]):
+        """在计时前为每个服务商建立 streams_per_provider 个连接"""
+        print("\n正在预热连接...")
+        connections = min(self.config.streams_per_provider, self.config.max_concurrency)
+        elapsed = await asyncio.gather(
+            *(provider.warmup_async(connections) for provider in providers),
+            return_exceptions=True
+        )
+        for provider, result in zip(providers, elapsed):
+            if isinstance(result, Exception):
+                print(f"预热服务商 {provider.name} 时发生错误：{result}")
+            elif result is not None:
+                print(f"服务商 {provider.name} 已建立 {connections} 个连接，用时 {result:.2f} 秒")
+            else:
+                print(f"服务商 {provider.name} 连接失败，后续请求将按冷启动计时")
+
+    async def _test_single_provider(
+        self,
+        provider: BaseProvider,
+        messages: List[dict],
+        semaphore: asyncio.Semaphore,
+        deadline_at: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        on_result: Optional[Callable[[BaseProvider, Optional[TestResult]], None]] = None
+    ):
+        """测试单个提供商（在事件循环中运行）"""
+        async with semaphore:
+            print(f"\n准备测试服务商：{provider.name}")
+
+            # 每个流使用独立的带缓冲测试器，截止时间由测试器在流内部执行
+            tester = AsyncAPITester(
+                buffer_output=True,
+                metrics_only=self.config.metrics_only,
+                sink_dir=self.config.sink_dir,
+                raw_sse=self.config.raw_sse,
+                timeout=self.config.timeout,
+                stall_timeout=self.config.stall_timeout
+            )
+            result = await tester.test_provider(provider, messages, deadline_at, max_tokens)
+
+            if result and result.status != 'ok':
+                print(f"\n服务商 {provider.name} 测试被中断（{result.status}），已保留部分结果")
+            elif result:
+                print(f"\n完成测试服务商：{provider.name}")
+            else:
+                print(f"\n服务商 {provider.name} 测试失败")
+
+            if on_result:
+                on_result(provider, result)
+            return result
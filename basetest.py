@@ -1,12 +1,33 @@
 import datetime
-import pytz
+import fnmatch
+import os
 import time
 import argparse
-from typing import List, Optional, Tuple
-from providers import AVAILABLE_PROVIDERS, BaseProvider
-from parallel_tester import ParallelAPITester, ParallelTestConfig
-from tester import APITester
-from reporter import TestReporter
+from typing import TYPE_CHECKING, Iterator, List, Optional, Tuple
+from config import get_env_var
+from providers import BaseProvider, ConfiguredProvider, ProviderSpec, load_providers
+from workload import WorkloadItem, cache_prompts, iter_workload, length_sweep, parse_lengths
+from results_store import DEFAULT_STORE_PATH
+from http_pool import HTTPPoolConfig, configure as configure_http_pool
+import timeline
+import traces
+
+# 各测试模式、报告和统计模块（numpy、jinja2 等）在用到时才导入，缩短单个服务商快速探测的启动时间
+if TYPE_CHECKING:
+    from load_tester import LoadStage
+    from scheduler import SchedulerConfig
+    from daemon import DaemonConfig
+
+MODE_NAMES = {
+    'multi': '并行',
+    'seq': '串行',
+    'async': '异步并发',
+    'load': '开环负载',
+    'adaptive': '自适应并发',
+    'daemon': '持续探测',
+    'dist': '分布式',
+    'goodput': 'SLO 有效吞吐扫描',
+}
 
 def parse_args():
     """解析命令行参数"""
@@ -15,9 +36,30 @@ def parse_args():
     # 测试模式
     parser.add_argument(
         '--mode', 
-        choices=['multi', 'seq'], 
+        choices=['multi', 'seq', 'async', 'load', 'adaptive', 'daemon', 'dist', 'goodput'], 
         default='seq',
-        help='测试模式：multi(并行) 或 seq(串行)'
+        help='测试模式：multi(并行)、seq(串行)、async(异步并发)、load(开环负载)、adaptive(自适应并发)、daemon(持续探测) 、dist(多进程/多主机分布式) 或 goodput(SLO 有效吞吐扫描)'
+    )
+    
+    parser.add_argument(
+        '--providers',
+        type=str,
+        default=None,
+        help='只测试指定的服务商，逗号分隔的服务商或服务商/模型组合简称，例如 "deepseek,aliyun"；未选中的服务商不读取配置（默认：全部）'
+    )
+    
+    parser.add_argument(
+        '--models',
+        type=str,
+        default=None,
+        help='只测试模型名匹配的组合，逗号分隔，支持 * 通配符，例如 "*r1*"（默认：全部）'
+    )
+    
+    parser.add_argument(
+        '--registry',
+        type=str,
+        default=None,
+        help='服务商注册表（TOML）路径（默认：providers.toml）'
     )
     
     # 并行测试的参数
@@ -25,14 +67,304 @@ def parse_args():
         '--workers',
         type=int,
         default=3,
-        help='并行测试时的工作线程数（默认：3）'
+        help='并行测试时的工作线程数；分布式测试时为每个工作进程同时进行的请求数（默认：3）'
+    )
+    
+    # 异步测试的参数
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=100,
+        help='异步测试时事件循环上的最大并发流数（默认：100）'
+    )
+    
+    parser.add_argument(
+        '--streams',
+        type=int,
+        default=1,
+        help='异步测试时每个服务商发起的流数量（默认：1）'
+    )
+    
+    # 分布式测试的参数
+    parser.add_argument(
+        '--processes',
+        type=int,
+        default=os.cpu_count() or 1,
+        help='分布式测试时本机启动的工作进程数，0 表示只使用其他主机上的工作进程（默认：CPU 核数）'
+    )
+    
+    parser.add_argument(
+        '--queue-dir',
+        type=str,
+        default=None,
+        help='分布式测试的任务队列目录；放在共享文件系统上时，其他主机可用 python distributed.py <目录> 加入（默认：临时目录，仅本机）'
+    )
+    
+    # 开环负载测试的参数
+    parser.add_argument(
+        '--rps',
+        type=float,
+        default=1.0,
+        help='负载测试时每个服务商的目标请求速率（默认：1.0）'
+    )
+    
+    parser.add_argument(
+        '--duration',
+        type=float,
+        default=60,
+        help='负载测试的持续时间（秒）（默认：60）'
+    )
+    
+    parser.add_argument(
+        '--stages',
+        type=str,
+        default=None,
+        help='负载阶段，格式为 rps:秒数 并以逗号分隔，例如 "1:30,2:30,5:60"；指定后忽略 --rps 和 --duration'
+    )
+    
+    parser.add_argument(
+        '--arrival',
+        choices=['poisson', 'constant'],
+        default='poisson',
+        help='请求到达过程：poisson(泊松) 或 constant(匀速)（默认：poisson）'
+    )
+    
+    parser.add_argument(
+        '--max-in-flight',
+        type=int,
+        default=32,
+        help='负载测试时每个服务商最大在途请求数（默认：32）'
+    )
+    
+    # 自适应并发测试的参数
+    parser.add_argument(
+        '--max-concurrency',
+        type=int,
+        default=32,
+        help='自适应并发测试时每个服务商的并发上限（默认：32）'
+    )
+    
+    parser.add_argument(
+        '--window',
+        type=float,
+        default=20,
+        help='自适应并发测试时每个并发等级的测量窗口（秒）（默认：20）'
+    )
+    
+    parser.add_argument(
+        '--rate-limit',
+        type=float,
+        default=None,
+        help='自适应并发测试时每个服务商的请求配额（请求/秒），按令牌桶发送（默认：不限制）'
+    )
+    
+    parser.add_argument(
+        '--latency-tolerance',
+        type=float,
+        default=1.5,
+        help='首 token 时间中位数超过基线的倍数时视为退化并降低并发（默认：1.5）'
+    )
+    
+    parser.add_argument(
+        '--max-error-rate',
+        type=float,
+        default=0.1,
+        help='测量窗口内错误率超过该值时视为退化并降低并发（默认：0.1）'
+    )
+    
+    # SLO 有效吞吐扫描的参数
+    parser.add_argument(
+        '--levels',
+        type=str,
+        default='1,2,4,8,16',
+        help='SLO 有效吞吐扫描时依次测量的并发等级，逗号分隔（默认：1,2,4,8,16）'
+    )
+    
+    parser.add_argument(
+        '--rounds',
+        type=int,
+        default=4,
+        help='SLO 有效吞吐扫描时每个并发等级发送 并发数 × rounds 个请求（默认：4）'
+    )
+    
+    parser.add_argument(
+        '--slo-ttft',
+        type=float,
+        default=2.0,
+        help='首 token 时间 SLO（秒）（默认：2.0）'
+    )
+    
+    parser.add_argument(
+        '--slo-tpot',
+        type=float,
+        default=0.1,
+        help='首个 token 之后每个输出 token 的平均时间 SLO（秒）（默认：0.1）'
+    )
+    
+    parser.add_argument(
+        '--slo-attainment',
+        type=float,
+        default=0.9,
+        help='满足 SLO 的请求比例低于该值的并发等级视为拐点（默认：0.9）'
+    )
+    
+    # 持续探测的参数
+    parser.add_argument(
+        '--probe-interval',
+        type=float,
+        default=60,
+        help='持续探测时每个服务商的探测间隔（秒）（默认：60）'
+    )
+    
+    parser.add_argument(
+        '--metrics-window',
+        type=float,
+        default=3600,
+        help='持续探测时滚动窗口指标的窗口长度（秒）（默认：3600）'
+    )
+    
+    parser.add_argument(
+        '--metrics-host',
+        type=str,
+        default='127.0.0.1',
+        help='持续探测时 /metrics 端点的监听地址（默认：127.0.0.1）'
+    )
+    
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        default=9464,
+        help='持续探测时 /metrics 端点的监听端口（默认：9464）'
     )
     
     parser.add_argument(
         '--timeout',
         type=int,
         default=300,
-        help='单个测试的超时时间（秒）（默认：300）'
+        help='单个请求的截止时间（秒），超时后关闭连接并保留部分结果（默认：300）'
+    )
+    
+    parser.add_argument(
+        '--run-timeout',
+        type=float,
+        default=None,
+        help='每轮试验的总截止时间（秒），到期后仍在进行的请求被中断并保留部分结果；分布式测试中为整个运行的截止时间（默认：不限制）'
+    )
+    
+    parser.add_argument(
+        '--stall-timeout',
+        type=float,
+        default=None,
+        help='开始输出后两个分块之间允许的最长间隔（秒），超过则判定为停顿并中断（默认：不限制）'
+    )
+    
+    parser.add_argument(
+        '--raw-sse',
+        action='store_true',
+        help='直接解析 SSE 字节流，跳过 SDK 的分块对象构造，降低高速率下的客户端开销'
+    )
+    
+    # 测试框架自身的性能记录
+    parser.add_argument(
+        '--instrument',
+        action='store_true',
+        help='记录测试框架处理每个分块的耗时、解析 CPU 时间、线程/事件循环阻塞时间和锁等待，附在每个结果后'
+    )
+    
+    parser.add_argument(
+        '--tracemalloc',
+        action='store_true',
+        help='用 tracemalloc 统计本次运行的内存分配峰值和分配最多的位置（会明显拖慢分配）'
+    )
+    
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='用 cProfile 记录本次运行的所有线程，打印热点函数并保存 .prof 文件（开销很大，测得的延迟仅供参考）'
+    )
+    
+    # 重复试验与统计排名
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=1,
+        help='每个服务商的正式试验次数，大于 1 时报告均值、中位数和置信区间（默认：1）'
+    )
+    
+    parser.add_argument(
+        '--warmup',
+        type=int,
+        default=0,
+        help='正式试验前的预热试验次数，结果不计入统计（默认：0）'
+    )
+    
+    parser.add_argument(
+        '--rank-by',
+        choices=['tokens_per_second', 'ttft'],
+        default='tokens_per_second',
+        help='多次试验时的排名指标：tokens_per_second(生成速度) 或 ttft(首 token 时间)'
+    )
+    
+    # 输出控制
+    parser.add_argument(
+        '--metrics-only',
+        action='store_true',
+        help='仅记录指标（计数和字符长度），不保存和打印生成文本，内存占用与输出长度无关'
+    )
+    
+    parser.add_argument(
+        '--sink-dir',
+        type=str,
+        default=None,
+        help='将生成文本分块写入该目录，每个服务商每次测试一个文件'
+    )
+    
+    parser.add_argument(
+        '--trace-dir',
+        type=str,
+        default=None,
+        help='为每个流写入二进制轨迹（分块时间、增量长度、阶段和 usage，不含文本），可用 replay.py 离线重新计算结果和报告'
+    )
+    
+    # 连接池与预热
+    parser.add_argument(
+        '--prewarm',
+        action='store_true',
+        help='计时前先建立到每个服务商的连接（DNS/TCP/TLS），使首 token 时间反映模型服务延迟'
+    )
+    
+    parser.add_argument(
+        '--pool-size',
+        type=int,
+        default=100,
+        help='共享连接池的最大连接数（默认：100）'
+    )
+    
+    parser.add_argument(
+        '--keepalive',
+        type=float,
+        default=120.0,
+        help='空闲连接的保持时间（秒）（默认：120）'
+    )
+    
+    parser.add_argument(
+        '--http2',
+        action='store_true',
+        help='启用 HTTP/2（需要安装 h2）'
+    )
+    
+    # 历史结果库
+    parser.add_argument(
+        '--store',
+        type=str,
+        default=str(DEFAULT_STORE_PATH),
+        help=f'测试结果历史库路径（默认：{DEFAULT_STORE_PATH}）'
+    )
+    
+    parser.add_argument(
+        '--no-store',
+        action='store_true',
+        help='不将本次结果写入历史库'
     )
     
     # 测试内容
@@ -43,42 +375,179 @@ def parse_args():
         help='测试用的提示词'
     )
     
+    # 工作负载
+    parser.add_argument(
+        '--workload',
+        type=str,
+        default=None,
+        help='JSONL 工作负载文件，每行一个请求（prompt 或 messages，可选 id、max_tokens、tags），逐行读取'
+    )
+    
+    parser.add_argument(
+        '--prompt-field',
+        type=str,
+        default='prompt',
+        help='工作负载中提示词文本所在的字段名（默认：prompt）'
+    )
+    
+    parser.add_argument(
+        '--tags',
+        type=str,
+        default=None,
+        help='只运行带有这些标签之一的工作负载请求，逗号分隔'
+    )
+    
+    parser.add_argument(
+        '--limit',
+        type=int,
+        default=None,
+        help='最多运行的工作负载请求数'
+    )
+    
+    parser.add_argument(
+        '--sweep',
+        type=str,
+        default=None,
+        help='输入长度扫描，逗号分隔的目标输入 token 数，例如 "128,1024,8192,32768"；报告首 token 时间随输入长度的变化'
+    )
+    
+    parser.add_argument(
+        '--cache',
+        type=int,
+        default=None,
+        help='前缀缓存测试，共享前缀的目标 token 数，例如 4096；每轮先发送一次新前缀（冷），再发送前缀相同的请求（热），报告两者的首 token 时间和缓存命中 tokens'
+    )
+    
+    parser.add_argument(
+        '--cache-warm',
+        type=int,
+        default=3,
+        help='前缀缓存测试中每轮的热请求数（默认：3）'
+    )
+    
+    parser.add_argument(
+        '--cache-wait',
+        type=float,
+        default=5.0,
+        help='前缀缓存测试中冷请求之后、热请求之前的等待时间（秒），留给服务商建立缓存（默认：5）'
+    )
+    
+    parser.add_argument(
+        '--max-tokens',
+        type=int,
+        default=None,
+        help='每个请求的输出 token 上限（长度扫描和缓存测试默认 64，其余默认不限制）'
+    )
+    
     return parser.parse_args()
 
-def initialize_providers() -> List[BaseProvider]:
-    """初始化所有提供商"""
+def select_providers(
+    specs: List[ProviderSpec],
+    selection: Optional[str] = None,
+    models: Optional[str] = None
+) -> List[ProviderSpec]:
+    """
+    按 --providers 和 --models 过滤注册表展开后的服务商/模型组合
+
+    --providers 匹配服务商简称（选中其全部模型）或组合简称，--models 按模型名匹配通配符，
+    均不区分大小写。只比较注册表中的字段，不实例化服务商，也不读取任何密钥。
+    """
+    selected = list(specs)
+    if selection:
+        wanted = [part.strip().lower() for part in selection.split(',') if part.strip()]
+        selected = []
+        for name in wanted:
+            matches = [spec for spec in specs if name in (spec.key.lower(), spec.group.lower())]
+            if not matches:
+                choices = ', '.join(spec.key for spec in specs)
+                raise SystemExit(f"未知的服务商：{name}（可选：{choices}）")
+            selected.extend(spec for spec in matches if spec not in selected)
+    
+    if models:
+        patterns = [part.strip().lower() for part in models.split(',') if part.strip()]
+        
+        def model_matches(spec):
+            # 模型名来自环境变量的组合（如火山引擎接入点）只读取这一项配置
+            model = spec.model or (get_env_var(spec.model_env, required=False) if spec.model_env else None)
+            return model is not None and any(fnmatch.fnmatchcase(model.lower(), pattern) for pattern in patterns)
+        
+        selected = [spec for spec in selected if model_matches(spec)]
+        if not selected:
+            raise SystemExit(f"没有服务商提供匹配 {models} 的模型")
+    return selected
+
+def initialize_providers(
+    selection: Optional[str] = None,
+    models: Optional[str] = None,
+    registry: Optional[str] = None
+) -> List[BaseProvider]:
+    """从服务商注册表初始化选中的服务商/模型组合；客户端在首次请求时才创建"""
     providers = []
-    for provider_class in AVAILABLE_PROVIDERS:
+    for spec in select_providers(load_providers(registry), selection, models):
         try:
-            provider = provider_class()
+            provider = ConfiguredProvider(spec)
             if not provider.is_available():
                 print(f"\n跳过服务商 {provider.name}：API密钥未配置")
                 continue
             providers.append(provider)
         except Exception as e:
-            print(f"初始化服务商 {provider_class.__name__} 时发生错误：{e}")
+            print(f"初始化服务商 {spec.name} 时发生错误：{e}")
     
     if not providers:
         raise ValueError("没有可用的服务商，测试终止")
     
     return providers
 
+def start_profiler(args):
+    """按 --instrument、--tracemalloc、--profile 启动测试框架自身的性能记录，未指定时返回 None"""
+    if not (args.instrument or args.tracemalloc or args.profile):
+        return None
+    from profiling import HarnessProfiler
+    return HarnessProfiler(instrument=args.instrument, allocations=args.tracemalloc, profile=args.profile).start()
+
+def finish_profiler(profiler, results):
+    """停止性能记录，打印测试框架自身开销并保存 cProfile 数据"""
+    if profiler is None:
+        return
+    from reporter import REPORT_DIR
+    profiler.stop()
+    profiler.report(results, REPORT_DIR)
+
+def tester_options(args) -> dict:
+    """从命令行参数中提取 APITester 的通用选项"""
+    return dict(
+        metrics_only=args.metrics_only,
+        sink_dir=args.sink_dir,
+        raw_sse=args.raw_sse,
+        stall_timeout=args.stall_timeout
+    )
+
 def run_sequential_test(
     providers: List[BaseProvider], 
-    messages: List[dict]
+    messages: List[dict],
+    timeout: Optional[int] = None,
+    run_timeout: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+    on_result=None,
+    **options
 ) -> List:
-    """运行串行测试"""
+    """运行串行测试，options 为 APITester 的通用选项；on_result 在每个测试完成时以 (服务商, 结果) 调用"""
+    from tester import APITester
     print("\n开始串行测试...")
     results = []
-    tester = APITester(buffer_output=True)
+    tester = APITester(buffer_output=True, timeout=timeout, **options)
+    deadline_at = time.perf_counter() + run_timeout if run_timeout else None
     
     for provider in sorted(providers, key=lambda x: x.name):
         try:
-            result = tester.test_provider(provider, messages)
+            result = tester.test_provider(provider, messages, deadline_at, max_tokens)
             if result:
                 results.append(result)
         except Exception as e:
+            result = None
             print(f"测试服务商 {provider.name} 时发生错误：{e}")
+        if on_result:
+            on_result(provider, result)
     
     return results
 
@@ -86,47 +555,481 @@ def run_parallel_test(
     providers: List[BaseProvider], 
     messages: List[dict],
     workers: int,
-    timeout: int
+    timeout: int,
+    run_timeout: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+    on_result=None,
+    **options
 ) -> List:
     """运行并行测试"""
+    from parallel_tester import ParallelAPITester, ParallelTestConfig
     print("\n开始并行测试...")
-    config = ParallelTestConfig(max_workers=workers, timeout=timeout)
+    config = ParallelTestConfig(max_workers=workers, timeout=timeout, run_timeout=run_timeout, **options)
     tester = ParallelAPITester(config)
+    return tester.test_providers(providers, messages, max_tokens, on_result)
+
+def run_async_test(
+    providers: List[BaseProvider], 
+    messages: List[dict],
+    concurrency: int,
+    streams: int,
+    timeout: int,
+    prewarm: bool = False,
+    run_timeout: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+    on_result=None,
+    **options
+) -> List:
+    """运行异步并发测试"""
+    from async_tester import AsyncParallelAPITester, AsyncTestConfig
+    print("\n开始异步并发测试...")
+    config = AsyncTestConfig(
+        max_concurrency=concurrency,
+        streams_per_provider=streams,
+        timeout=timeout,
+        run_timeout=run_timeout,
+        prewarm=prewarm,
+        **options
+    )
+    tester = AsyncParallelAPITester(config)
+    return tester.test_providers(providers, messages, max_tokens, on_result)
+
+def run_load_test(
+    providers: List[BaseProvider], 
+    messages: List[dict],
+    stages: List['LoadStage'],
+    arrival: str,
+    max_in_flight: int,
+    raw_sse: bool = False,
+    timeout: Optional[float] = None,
+    stall_timeout: Optional[float] = None
+) -> List:
+    """运行开环负载测试"""
+    from load_tester import LoadAPITester, LoadTestConfig
+    print("\n开始开环负载测试...")
+    config = LoadTestConfig(
+        stages=stages,
+        arrival=arrival,
+        max_in_flight=max_in_flight,
+        raw_sse=raw_sse,
+        timeout=timeout,
+        stall_timeout=stall_timeout
+    )
+    tester = LoadAPITester(config)
     return tester.test_providers(providers, messages)
 
+def run_adaptive_test(
+    providers: List[BaseProvider], 
+    messages: List[dict],
+    config: 'SchedulerConfig'
+) -> List:
+    """运行自适应并发测试"""
+    from scheduler import AdaptiveScheduler
+    print("\n开始自适应并发测试...")
+    scheduler = AdaptiveScheduler(config)
+    return scheduler.test_providers(providers, messages)
+
+def run_daemon(
+    providers: List[BaseProvider], 
+    messages: List[dict],
+    config: 'DaemonConfig'
+):
+    """运行持续探测，直到 Ctrl+C"""
+    from daemon import ProbeDaemon
+    print("\n开始持续探测...")
+    ProbeDaemon(config).run(providers, messages)
+
+def prewarm_providers(providers: List[BaseProvider], connections: int):
+    """在计时前为每个服务商建立连接"""
+    print("\n正在预热连接...")
+    for provider in providers:
+        try:
+            elapsed = provider.warmup(connections)
+            if elapsed is not None:
+                print(f"服务商 {provider.name} 已建立 {connections} 个连接，用时 {elapsed:.2f} 秒")
+            else:
+                print(f"服务商 {provider.name} 连接失败，后续请求将按冷启动计时")
+        except Exception as e:
+            print(f"预热服务商 {provider.name} 时发生错误：{e}")
+
+def run_trial(
+    args,
+    providers: List[BaseProvider],
+    messages: List[dict],
+    max_tokens: Optional[int] = None,
+    on_result=None
+) -> List:
+    """按测试模式执行一次试验"""
+    options = tester_options(args)
+    options.update(run_timeout=args.run_timeout, max_tokens=max_tokens, on_result=on_result)
+    if args.mode == 'multi':
+        return run_parallel_test(providers, messages, args.workers, args.timeout, **options)
+    if args.mode == 'async':
+        return run_async_test(
+            providers, messages, args.concurrency, args.streams, args.timeout,
+            prewarm=args.prewarm, **options
+        )
+    return run_sequential_test(providers, messages, args.timeout, **options)
+
+def distributed_jobs(args, providers: List[BaseProvider], prompts: Optional[dict] = None) -> List[dict]:
+    """
+    把预热和正式试验中的 服务商 × 请求 展开为分布式任务
+
+    Args:
+        prompts: 可选，收集正式试验的 {workload_id: 提示词}，用于写入历史库
+    """
+    jobs = []
+    for trial in range(args.warmup + args.repeat):
+        warmup = trial < args.warmup
+        for item in workload_items(args):
+            if prompts is not None and not warmup:
+                prompts[item.id] = item.prompt
+            for provider in sorted(providers, key=lambda x: x.name):
+                jobs.append({
+                    'id': f'{len(jobs):08d}',
+                    'provider': provider.name,
+                    'warmup': warmup,
+                    'messages': item.messages,
+                    'max_tokens': item.max_tokens,
+                    'workload_id': item.id,
+                    'tags': ','.join(item.tags or ()) or None,
+                })
+    return jobs
+
+def run_distributed_test(
+    args,
+    providers: List[BaseProvider],
+    prompts: Optional[dict] = None,
+    on_result=None
+) -> List:
+    """
+    运行分布式测试：预热和正式试验的全部任务交给工作进程，结果汇总到同一份报告
+
+    工作进程按同样的 --providers、--models、--registry 自行初始化服务商，API 密钥从各自主机读取。
+    """
+    from distributed import Coordinator, DistributedConfig
+    print("\n开始分布式测试...")
+    run = {
+        'providers': args.providers,
+        'models': args.models,
+        'registry': args.registry,
+        'tester': dict(timeout=args.timeout, **tester_options(args)),
+        'pool': dict(
+            max_connections=args.pool_size,
+            max_keepalive_connections=args.pool_size,
+            keepalive_expiry=args.keepalive,
+            http2=args.http2
+        ),
+        'prewarm': args.prewarm,
+        'timelines': True,
+        'trace_dir': args.trace_dir,
+        # 协调端时钟的截止时间，工作进程按测得的时钟偏差换算
+        'deadline': time.time() + args.run_timeout if args.run_timeout else None,
+    }
+    config = DistributedConfig(processes=args.processes, threads=args.workers, queue_dir=args.queue_dir)
+    results = []
+    
+    def on_job(job, result):
+        # 预热任务的结果直接丢弃
+        if job['warmup']:
+            return
+        if result:
+            results.append(result)
+        if on_result:
+            on_result(job['provider'], result)
+    
+    Coordinator(config, run).execute(distributed_jobs(args, providers, prompts), on_job)
+    return results
+
+def workload_items(args) -> Iterator[WorkloadItem]:
+    """
+    按命令行参数生成本轮试验的请求
+
+    每轮试验重新生成：JSONL 语料按需逐行读取，长度扫描每轮使用新的随机前缀以避开前缀缓存。
+    """
+    if args.sweep:
+        return length_sweep(parse_lengths(args.sweep), max_tokens=args.max_tokens or 64)
+    if args.cache:
+        return cache_prompts(args.cache, args.cache_warm, args.cache_wait, max_tokens=args.max_tokens or 64)
+    if args.workload:
+        tags = [tag.strip() for tag in args.tags.split(',')] if args.tags else None
+        return iter_workload(args.workload, args.prompt_field, tags, args.limit, args.max_tokens)
+    return iter([WorkloadItem(id=None, messages=[{'role': 'user', 'content': args.prompt}], max_tokens=args.max_tokens)])
+
+def run_workload_trial(
+    args,
+    providers: List[BaseProvider],
+    prompts: Optional[dict] = None,
+    on_result=None
+) -> List:
+    """
+    对工作负载中的每条请求执行一次试验
+
+    Args:
+        prompts: 可选，收集 {workload_id: 提示词}，用于写入历史库
+        on_result: 可选回调，每个测试完成时以 (服务商, 结果) 调用，结果已标注工作负载
+    """
+    results = []
+    for item in workload_items(args):
+        if item.id is not None:
+            print(f"\n工作负载请求：{item.id}" + (f"（标签：{', '.join(item.tags)}）" if item.tags else ""))
+        traces.set_context(workload_id=item.id, tags=','.join(item.tags or ()) or None)
+        if item.wait:
+            print(f"\n等待 {item.wait:g} 秒后发送 {item.id}")
+            time.sleep(item.wait)
+        
+        def label(result):
+            if result:
+                result.workload_id = item.id
+                result.tags = ','.join(item.tags) or None
+        
+        def on_item_result(provider, result):
+            label(result)
+            on_result(provider, result)
+        
+        callback = on_item_result if on_result else None
+        if item.salts is None:
+            item_results = run_trial(args, providers, item.messages, item.max_tokens, callback)
+        else:
+            # 按服务商加盐的请求每个服务商的消息不同，逐个服务商发送
+            item_results = []
+            for provider in sorted(providers, key=lambda x: x.name):
+                item_results.extend(run_trial(args, [provider], item.messages_for(provider.name), item.max_tokens, callback))
+        for result in item_results:
+            label(result)
+        if prompts is not None:
+            prompts[item.id] = item.prompt
+        results.extend(item_results)
+    return results
+
 def main() -> Tuple[Optional[List], Optional[str]]:
     """主函数"""
     args = parse_args()
     
-    # 准备测试消息
+    # 准备测试消息；负载和自适应模式使用单条提示词
     messages = [
         {
             'role': 'user',
             'content': args.prompt
         }
     ]
+    if (args.workload or args.sweep or args.cache) and args.mode in ('load', 'adaptive', 'daemon', 'goodput'):
+        raise SystemExit(f"--workload、--sweep 和 --cache 不支持 {MODE_NAMES[args.mode]}模式")
+    if sum(bool(option) for option in (args.workload, args.sweep, args.cache)) > 1:
+        raise SystemExit("--workload、--sweep 和 --cache 只能指定一个")
+    # 热请求必须在同一服务商的冷请求完成之后发送，分布式模式不保证任务的先后
+    if args.cache and args.mode == 'dist':
+        raise SystemExit("--cache 不支持分布式模式")
+    levels = None
+    if args.mode == 'goodput':
+        from goodput import parse_levels
+        try:
+            levels = parse_levels(args.levels)
+        except ValueError as e:
+            raise SystemExit(str(e))
 
+    import pytz
     start_time = time.time()
     print(f"本次测试开始于中国时间：{datetime.datetime.now(pytz.timezone('Asia/Shanghai')).strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"测试模式：{'并行' if args.mode == 'parallel' else '串行'}")
-    if args.mode == 'parallel':
+    print(f"测试模式：{MODE_NAMES[args.mode]}")
+    if args.mode == 'multi':
         print(f"并行工作线程数：{args.workers}")
-        print(f"单个测试超时时间：{args.timeout}秒")
-    print(f"测试提示词：{args.prompt}")
+    elif args.mode == 'async':
+        print(f"异步最大并发流数：{args.concurrency}")
+        print(f"每个服务商流数量：{args.streams}")
+    elif args.mode == 'dist':
+        print(f"本机工作进程数：{args.processes}，每个进程同时进行的请求数：{args.workers}")
+        if args.queue_dir:
+            print(f"任务队列目录：{args.queue_dir}")
+    elif args.mode == 'load':
+        print(f"到达过程：{args.arrival}")
+        print(f"每个服务商最大在途请求数：{args.max_in_flight}")
+    elif args.mode == 'adaptive':
+        print(f"每个服务商并发上限：{args.max_concurrency}")
+        print(f"测量窗口：{args.window}秒")
+        if args.rate_limit:
+            print(f"每个服务商请求配额：{args.rate_limit} 请求/秒")
+    elif args.mode == 'goodput':
+        print(f"并发等级：{args.levels}，每个等级发送 并发数 × {args.rounds} 个请求")
+        print(f"SLO：首 token 时间 ≤ {args.slo_ttft} 秒，TPOT ≤ {args.slo_tpot * 1000:g} 毫秒，满足率目标 {args.slo_attainment:.0%}")
+    print(f"单个请求截止时间：{args.timeout}秒")
+    if args.run_timeout:
+        print(f"每轮试验截止时间：{args.run_timeout}秒")
+    if args.stall_timeout:
+        print(f"分块停顿上限：{args.stall_timeout}秒")
+    if args.mode not in ('load', 'adaptive', 'daemon', 'goodput') and (args.repeat > 1 or args.warmup > 0):
+        print(f"预热试验次数：{args.warmup}，正式试验次数：{args.repeat}")
+    if args.sweep:
+        print(f"输入长度扫描：{args.sweep} tokens")
+    elif args.cache:
+        print(f"前缀缓存测试：共享前缀约 {args.cache} tokens，每轮 1 次冷请求、{args.cache_warm} 次热请求，间隔 {args.cache_wait} 秒")
+    elif args.workload:
+        print(f"工作负载：{args.workload}")
+    else:
+        print(f"测试提示词：{args.prompt}")
 
+    profiler = start_profiler(args)
+    recorder = traces.TraceRecorder(args.trace_dir).start() if args.trace_dir else None
+    # 逐请求的 token 时间线只用于 HTML 报告中的图表；负载、自适应、守护和有效吞吐模式不生成逐请求的图表
+    timeline.enable(args.mode not in ('load', 'adaptive', 'daemon', 'goodput'))
+    results = None
     try:
+        # 配置共享连接池，必须在创建客户端之前
+        configure_http_pool(HTTPPoolConfig(
+            max_connections=args.pool_size,
+            max_keepalive_connections=args.pool_size,
+            keepalive_expiry=args.keepalive,
+            http2=args.http2
+        ))
+        
         # 初始化提供商
-        providers = initialize_providers()
+        providers = initialize_providers(args.providers, args.models, args.registry)
+        
+        # 异步模式在各自的事件循环内预热，分布式模式由各工作进程预热，有效吞吐扫描总是在测量每个服务商之前预热
+        if args.prewarm and args.mode not in ('async', 'dist', 'goodput'):
+            connections = {'load': args.max_in_flight, 'adaptive': args.max_concurrency}.get(args.mode, 1)
+            prewarm_providers(providers, connections)
+        
+        # 负载模式按阶段汇总，单独生成报告
+        if args.mode == 'load':
+            from load_tester import LoadStage, parse_stages
+            from reporter import LoadTestReporter
+            stages = parse_stages(args.stages) if args.stages else [LoadStage(rps=args.rps, duration=args.duration)]
+            results = run_load_test(
+                providers, messages, stages, args.arrival, args.max_in_flight,
+                raw_sse=args.raw_sse, timeout=args.timeout, stall_timeout=args.stall_timeout
+            )
+            reporter = LoadTestReporter(results, messages[0]['content'])
+            report_path = reporter.create_report()
+            
+            total_time = time.time() - start_time
+            print(f"\n所有测试完成，总耗时：{total_time:.2f}秒")
+            
+            return results, report_path
         
-        # 根据模式执行测试
-        if args.mode == 'parallel':
-            results = run_parallel_test(providers, messages, args.workers, args.timeout)
+        # 持续探测模式不生成报告，指标通过 /metrics 端点暴露
+        if args.mode == 'daemon':
+            from daemon import DaemonConfig
+            run_daemon(providers, messages, DaemonConfig(
+                interval=args.probe_interval,
+                window=args.metrics_window,
+                host=args.metrics_host,
+                port=args.metrics_port,
+                timeout=args.timeout,
+                stall_timeout=args.stall_timeout,
+                raw_sse=args.raw_sse,
+                max_tokens=args.max_tokens
+            ))
+            return [], None
+        
+        # 自适应并发模式报告每个服务商的最大可持续并发
+        if args.mode == 'adaptive':
+            from scheduler import SchedulerConfig
+            from reporter import SchedulerReporter
+            config = SchedulerConfig(
+                max_concurrency=args.max_concurrency,
+                window=args.window,
+                rate_limit=args.rate_limit,
+                latency_tolerance=args.latency_tolerance,
+                max_error_rate=args.max_error_rate,
+                timeout=args.timeout,
+                stall_timeout=args.stall_timeout,
+                raw_sse=args.raw_sse
+            )
+            results = run_adaptive_test(providers, messages, config)
+            reporter = SchedulerReporter(results, messages[0]['content'])
+            report_path = reporter.create_report()
+            
+            total_time = time.time() - start_time
+            print(f"\n所有测试完成，总耗时：{total_time:.2f}秒")
+            
+            return results, report_path
+        
+        # SLO 有效吞吐扫描按可持续有效吞吐排名
+        if args.mode == 'goodput':
+            from goodput import GoodputConfig, GoodputSweep
+            from reporter import GoodputReporter
+            config = GoodputConfig(
+                levels=levels,
+                rounds=args.rounds,
+                ttft_slo=args.slo_ttft,
+                tpot_slo=args.slo_tpot,
+                attainment=args.slo_attainment,
+                timeout=args.timeout,
+                stall_timeout=args.stall_timeout,
+                raw_sse=args.raw_sse
+            )
+            print("\n开始 SLO 有效吞吐扫描...")
+            results = GoodputSweep(config).test_providers(providers, messages, args.max_tokens)
+            reporter = GoodputReporter(
+                results,
+                f"{messages[0]['content']}（SLO：首 token 时间 ≤ {args.slo_ttft} 秒，TPOT ≤ {args.slo_tpot * 1000:g} 毫秒）"
+            )
+            report_path = reporter.create_report()
+            
+            total_time = time.time() - start_time
+            print(f"\n所有测试完成，总耗时：{total_time:.2f}秒")
+            
+            return results, report_path
+        
+        # 预热试验的结果直接丢弃；分布式模式的预热试验与正式试验一起分发
+        if args.mode != 'dist':
+            traces.set_context(warmup=True)
+            for trial in range(args.warmup):
+                print(f"\n预热试验 {trial + 1}/{args.warmup}（结果不计入统计）")
+                run_workload_trial(args, providers)
+            traces.set_context(warmup=None)
+        
+        # 正式试验；每个结果完成时立即写入结果文件，中途出错也不会丢失
+        from reporter import TestReporter, SweepReporter, CacheReporter, StreamingReporter
+        streams = args.streams if args.mode == 'async' else 1
+        expected = None if (args.workload or args.sweep or args.cache) else args.repeat * streams * len(providers)
+        prefix = 'sweep_report' if args.sweep else 'cache_report' if args.cache else 'test_report'
+        stream = StreamingReporter(expected, prefix=prefix)
+        results = []
+        prompts = {}
+        try:
+            if args.mode == 'dist':
+                results = run_distributed_test(args, providers, prompts, on_result=stream.add)
+            else:
+                for trial in range(args.repeat):
+                    if args.repeat > 1:
+                        print(f"\n正式试验 {trial + 1}/{args.repeat}")
+                    results.extend(run_workload_trial(args, providers, prompts, on_result=stream.add))
+        finally:
+            stream.close()
+        
+        # 生成汇总报告和 HTML；长度扫描按 (服务商, 输入长度) 汇总，缓存测试按服务商对比冷、热请求
+        if args.sweep:
+            reporter = SweepReporter(results, f"输入长度扫描：{args.sweep}")
+        elif args.cache:
+            reporter = CacheReporter(results, f"前缀缓存测试：共享前缀约 {args.cache} tokens")
         else:
-            results = run_sequential_test(providers, messages)
+            reporter = TestReporter(
+                results,
+                args.workload or messages[0]['content'],
+                trials=args.repeat * streams * max(1, len(prompts)),
+                providers=[p.name for p in providers],
+                rank_by=args.rank_by
+            )
+        report_path = stream.finish(reporter)
         
-        # 生成测试报告
-        reporter = TestReporter(results, messages[0]['content'])
-        report_path = reporter.create_report()
+        # 追加到历史结果库，run_id 与报告文件名对应；工作负载按请求分别记录提示词
+        if not args.no_store:
+            from results_store import ResultStore
+            store = ResultStore(args.store)
+            try:
+                count = 0
+                for workload_id, prompt in prompts.items():
+                    count += store.append(
+                        [r for r in results if r.workload_id == workload_id],
+                        prompt,
+                        run_id=report_path.name,
+                        mode=args.mode
+                    )
+            finally:
+                store.close()
+            print(f"已将 {count} 条结果写入历史库：{args.store}")
         
         total_time = time.time() - start_time
         print(f"\n所有测试完成，总耗时：{total_time:.2f}秒")
@@ -136,6 +1039,12 @@ def main() -> Tuple[Optional[List], Optional[str]]:
     except Exception as e:
         print(f"测试过程中发生错误：{e}")
         return None, None
+    
+    finally:
+        finish_profiler(profiler, results)
+        if recorder is not None:
+            recorder.stop()
+            print(f"轨迹已保存到：{args.trace_dir}（python replay.py {args.trace_dir}）")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
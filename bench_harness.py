@@ -0,0 +1,142 @@
+import argparse
+import contextlib
+import io
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List
+from tabulate import tabulate
+from mock_server import MockProvider
+from parallel_tester import ParallelAPITester, ParallelTestConfig
+from tester import APITester
+
+MESSAGES = [{'role': 'user', 'content': 'benchmark'}]
+
+def start_mock_server(args: List[str]):
+    """
+    在子进程中启动模拟服务端，避免其 CPU 开销计入测试框架
+
+    Returns:
+        (进程对象, 服务地址)
+    """
+    process = subprocess.Popen(
+        [sys.executable, str(Path(__file__).parent / 'mock_server.py'), '--port', '0'] + args,
+        stdout=subprocess.PIPE,
+        text=True
+    )
+    line = process.stdout.readline()
+    if '：' not in line:
+        process.kill()
+        raise RuntimeError(f"模拟服务端启动失败：{line!r}")
+    return process, line.strip().split('：', 1)[1]
+
+def bench_sequential(url: str, repeats: int, ttft: float, rate: float, metrics_only: bool, raw_sse: bool = False) -> dict:
+    """单流基准：测量首 token 误差、token 间隔误差和每分块的客户端 CPU 开销"""
+    provider = MockProvider(url)
+    tester = APITester(buffer_output=True, verbose=False, metrics_only=metrics_only, raw_sse=raw_sse)
+
+    # 预热一次，排除连接建立和 SDK 懒加载的开销
+    tester.test_provider(provider, MESSAGES)
+
+    ttft_errors, itl_errors, cpu_per_chunk = [], [], []
+    for _ in range(repeats):
+        cpu_start = time.thread_time()
+        result = tester.test_provider(provider, MESSAGES)
+        cpu_used = time.thread_time() - cpu_start
+        if not result:
+            continue
+        ttft_errors.append(result.first_token_time - ttft)
+        if result.itl_p50 is not None:
+            itl_errors.append(result.itl_p50 - 1 / rate)
+        cpu_per_chunk.append(cpu_used / max(tester.chunk_count, 1))
+
+    return _summary(ttft_errors, itl_errors, cpu_per_chunk, repeats)
+
+def bench_parallel(url: str, repeats: int, ttft: float, rate: float, concurrency: int) -> dict:
+    """多线程基准：concurrency 个流同时运行时的误差和每分块 CPU 开销"""
+    providers = [MockProvider(url, name=f"Mock-{i}") for i in range(concurrency)]
+    tester = ParallelAPITester(ParallelTestConfig(max_workers=concurrency, metrics_only=True))
+
+    ttft_errors, itl_errors, cpu_per_chunk = [], [], []
+    # ParallelAPITester 会打印每个服务商的进度，基准中不需要
+    with contextlib.redirect_stdout(io.StringIO()):
+        tester.test_providers(providers, MESSAGES)
+    for _ in range(repeats):
+        cpu_start = time.process_time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = tester.test_providers(providers, MESSAGES)
+        cpu_used = time.process_time() - cpu_start
+        chunks = sum(r.reasoning_tokens + r.content_tokens for r in results) or 1
+        for result in results:
+            ttft_errors.append(result.first_token_time - ttft)
+            if result.itl_p50 is not None:
+                itl_errors.append(result.itl_p50 - 1 / rate)
+        cpu_per_chunk.append(cpu_used / chunks)
+
+    return _summary(ttft_errors, itl_errors, cpu_per_chunk, repeats * concurrency)
+
+def _summary(ttft_errors, itl_errors, cpu_per_chunk, attempts) -> dict:
+    def mean(values):
+        return sum(values) / len(values) if values else None
+
+    return {
+        'samples': f"{len(ttft_errors)}/{attempts}",
+        'ttft_error': mean(ttft_errors),
+        'itl_error': mean(itl_errors),
+        'cpu_per_chunk': mean(cpu_per_chunk),
+    }
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='测试框架自身开销基准（基于本地模拟服务端）')
+    parser.add_argument('--rates', type=str, default='50,200,1000,5000', help='生成速度列表（tokens/s），逗号分隔')
+    parser.add_argument('--ttft', type=float, default=0.1, help='模拟服务端的首 token 延迟（秒）')
+    parser.add_argument('--duration', type=float, default=2.0, help='每个流的生成时长（秒）')
+    parser.add_argument('--concurrency', type=int, default=8, help='并行基准的并发流数')
+    parser.add_argument('--repeats', type=int, default=5, help='每项基准的重复次数')
+    return parser.parse_args()
+
+def main():
+    """命令行入口"""
+    args = parse_args()
+    rows = []
+
+    for rate in [float(r) for r in args.rates.split(',')]:
+        tokens = max(20, int(rate * args.duration))
+        process, url = start_mock_server([
+            '--ttft', str(args.ttft),
+            '--tps', str(rate),
+            '--reasoning-tokens', str(tokens // 2),
+            '--content-tokens', str(tokens - tokens // 2),
+        ])
+        try:
+            cases = [
+                ('APITester', lambda: bench_sequential(url, args.repeats, args.ttft, rate, metrics_only=False)),
+                ('APITester metrics-only', lambda: bench_sequential(url, args.repeats, args.ttft, rate, metrics_only=True)),
+                ('APITester raw-sse', lambda: bench_sequential(url, args.repeats, args.ttft, rate, metrics_only=True, raw_sse=True)),
+                (f'ParallelAPITester x{args.concurrency}', lambda: bench_parallel(url, args.repeats, args.ttft, rate, args.concurrency)),
+            ]
+            for name, run in cases:
+                summary = run()
+                rows.append([
+                    f"{rate:g}",
+                    name,
+                    summary['samples'],
+                    f"{summary['ttft_error'] * 1000:.2f}" if summary['ttft_error'] is not None else "-",
+                    f"{summary['itl_error'] * 1000:.3f}" if summary['itl_error'] is not None else "-",
+                    f"{summary['cpu_per_chunk'] * 1e6:.1f}" if summary['cpu_per_chunk'] is not None else "-",
+                ])
+        finally:
+            process.terminate()
+            process.wait()
+
+    print("\n测试框架开销（测量值 - 模拟服务端设定值）：")
+    print(tabulate(
+        rows,
+        headers=['Tokens/s', 'Harness', 'Samples', 'TTFT Error (ms)', 'ITL P50 Error (ms)', 'Client CPU (µs/chunk)'],
+        tablefmt='grid'
+    ))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List, Tuple
+from tabulate import tabulate
+from bench_harness import start_mock_server
+
+ROOT = Path(__file__).parent
+
+# 子进程使用的占位密钥，使所有服务商都视为已配置；启动基准不发送真实请求
+DUMMY_KEYS = {
+    'DEEPSEEK_API_KEY': 'bench',
+    'ALIYUN_API_KEY': 'bench',
+    'QIANFAN_API_KEY': 'bench',
+    'SILICONFLOW_API_KEY': 'bench',
+    'VOLCES_API_KEY': 'bench',
+    'VOLCES_ENDPOINT': 'bench',
+    'TENCENTCLOUD_API_KEY': 'bench',
+}
+
+# 单服务商快速探测：从进程启动到收到首 token 的时间
+PROBE = """
+import os
+import sys
+import time
+import basetest
+from mock_server import MockProvider
+from tester import APITester
+providers = basetest.initialize_providers('deepseek')
+provider = MockProvider(sys.argv[1])
+tester = APITester(buffer_output=True, verbose=False, metrics_only=True)
+started = time.time()
+result = tester.test_provider(provider, [{'role': 'user', 'content': 'startup'}])
+print(started - float(os.environ['BENCH_LAUNCHED_AT']) + result.first_token_time - float(sys.argv[2]))
+"""
+
+CASES = [
+    ('python -c pass', ['-c', 'pass']),
+    ('import basetest', ['-c', 'import basetest']),
+    ('basetest.py --help', [str(ROOT / 'basetest.py'), '--help']),
+    ('initialize_providers()', ['-c', 'import basetest; basetest.initialize_providers()']),
+    ('initialize_providers(1)', ['-c', "import basetest; basetest.initialize_providers('deepseek')"]),
+    ('all clients built', ['-c', 'import basetest; [p.client for p in basetest.initialize_providers()]']),
+]
+
+def run_once(args: List[str]) -> Tuple[float, str]:
+    """在新解释器中运行一次，返回 (墙钟时间, 标准输出)"""
+    env = dict(os.environ, **DUMMY_KEYS)
+    env['BENCH_LAUNCHED_AT'] = repr(time.time())
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable] + args,
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} 运行失败：{completed.stderr.strip()}")
+    return elapsed, completed.stdout
+
+def import_profile(top: int) -> List[list]:
+    """用 -X importtime 统计 import basetest 时累计耗时最多的模块"""
+    env = dict(os.environ, **DUMMY_KEYS)
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import basetest'],
+        cwd=ROOT,
+        env=env,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    # 每行格式：import time: 自身耗时 | 累计耗时 | 模块名（微秒）
+    modules = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, cumulative, name = line[len('import time:'):].split('|')
+        modules.append((int(cumulative), name.rstrip(), int(self_time)))
+    modules.sort(reverse=True)
+    return [[name, f"{cumulative / 1000:.1f}", f"{self_time / 1000:.1f}"] for cumulative, name, self_time in modules[:top]]
+
+def summarize(samples: List[float]) -> List[str]:
+    return [
+        f"{statistics.median(samples) * 1000:.1f}",
+        f"{min(samples) * 1000:.1f}",
+        f"{max(samples) * 1000:.1f}",
+    ]
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='启动时间基准：每项在新的解释器进程中测量')
+    parser.add_argument('--repeats', type=int, default=5, help='每项的重复次数（默认：5）')
+    parser.add_argument('--ttft', type=float, default=0.05, help='模拟服务端的首 token 延迟（秒），从探测结果中扣除')
+    parser.add_argument('--top', type=int, default=15, help='列出 import basetest 耗时最多的模块数，0 表示不列出')
+    return parser.parse_args()
+
+def main():
+    """命令行入口"""
+    args = parse_args()
+    rows = []
+
+    for name, case_args in CASES:
+        samples = [run_once(case_args)[0] for _ in range(args.repeats)]
+        rows.append([name] + summarize(samples))
+
+    process, url = start_mock_server(['--ttft', str(args.ttft), '--reasoning-tokens', '5', '--content-tokens', '5'])
+    try:
+        samples = [float(run_once(['-c', PROBE, url, str(args.ttft)])[1]) for _ in range(args.repeats)]
+        rows.append(['single-provider probe (launch → first token - TTFT)'] + summarize(samples))
+    finally:
+        process.terminate()
+        process.wait()
+
+    print("\n启动时间（毫秒，每次均为新进程）：")
+    print(tabulate(rows, headers=['Case', 'Median (ms)', 'Min (ms)', 'Max (ms)'], tablefmt='grid'))
+
+    if args.top:
+        print("\nimport basetest 累计耗时最多的模块：")
+        print(tabulate(import_profile(args.top), headers=['Module', 'Cumulative (ms)', 'Self (ms)'], tablefmt='grid'))
+
+if __name__ == "__main__":
+    main()
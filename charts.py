@@ -0,0 +1,353 @@
+from collections import Counter
+from typing import List, Optional
+from tester import LatencyHistogram
+from timeline import POINTS, lttb
+
+CHART_POINT_BUDGET = 40000      # 整个报告中 token 时间线的总点数上限，报告体积与服务商和试验次数无关
+MIN_STREAM_POINTS = 32          # 每条时间线至少保留的点数
+MAX_STREAMS_PER_PROVIDER = 50   # 每个服务商最多绘制的时间线条数（均匀抽取）；首 token 和 token 间隔分布使用全部结果
+
+def _itl_buckets(counts: Counter) -> List[list]:
+    """把 LatencyHistogram 的桶计数转换为 [下界 ms, 上界 ms, 占比]"""
+    total = sum(counts.values())
+    buckets = []
+    for index in sorted(counts):
+        lower = 0.0 if index == 0 else LatencyHistogram.MIN_VALUE * LatencyHistogram.GROWTH ** (index - 1)
+        upper = LatencyHistogram.MIN_VALUE * LatencyHistogram.GROWTH ** index
+        buckets.append([round(lower * 1000, 4), round(upper * 1000, 4), counts[index] / total])
+    return buckets
+
+def _sample(items: list, limit: int) -> list:
+    """均匀抽取最多 limit 个元素"""
+    if len(items) <= limit:
+        return items
+    step = len(items) / limit
+    return [items[int(i * step)] for i in range(limit)]
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 4)
+
+def chart_data(results) -> Optional[dict]:
+    """
+    生成 HTML 报告图表所需的数据
+
+    Args:
+        results: TestResult 列表；没有时间线的结果（例如负载测试的阶段汇总）会被忽略
+
+    Returns:
+        dict，没有任何时间线时返回 None
+    """
+    results = [r for r in results if getattr(r, 'timeline', None) is not None]
+    if not results:
+        return None
+
+    grouped = {}
+    for result in results:
+        grouped.setdefault(result.provider, []).append(result)
+
+    drawn = sum(min(len(group), MAX_STREAMS_PER_PROVIDER) for group in grouped.values())
+    per_stream = max(MIN_STREAM_POINTS, min(POINTS, CHART_POINT_BUDGET // drawn))
+
+    providers = []
+    for name, group in grouped.items():
+        itl = Counter()
+        for result in group:
+            itl.update(result.timeline.itl_buckets)
+
+        streams = []
+        for index in _sample(list(range(len(group))), MAX_STREAMS_PER_PROVIDER):
+            result = group[index]
+            timeline = result.timeline
+            times, tokens = lttb(timeline.times, timeline.tokens, per_stream)
+            streams.append({
+                'trial': index + 1,
+                'status': result.status,
+                't': [round(t, 4) for t in times],
+                'y': [round(y, 1) for y in tokens],
+                'reasoningEnd': _round(timeline.reasoning_end),
+                'contentStart': _round(timeline.content_start),
+            })
+
+        providers.append({
+            'name': name,
+            'streams': streams,
+            'ttft': [round(r.first_token_time, 4) for r in group if r.first_token_time is not None],
+            'itl': _itl_buckets(itl),
+        })
+
+    return {'providers': providers}
+
+CHART_STYLE = """
+.charts h2 { margin-top: 32px; }
+.charts .note { color: #666; font-size: 13px; }
+.charts .legend label { margin-right: 16px; cursor: pointer; white-space: nowrap; }
+.charts .legend .swatch { display: inline-block; width: 12px; height: 12px; margin: 0 4px -1px 2px; }
+.charts .grid { display: flex; flex-wrap: wrap; gap: 16px; }
+.charts .panel h3 { font-size: 14px; margin: 8px 0 4px; }
+.charts canvas { border: 1px solid #eee; }
+#chart-tooltip { position: fixed; pointer-events: none; background: rgba(0, 0, 0, 0.8); color: #fff;
+    font-size: 12px; padding: 4px 8px; border-radius: 3px; display: none; white-space: pre; }
+"""
+
+CHART_SCRIPT = """
+(function () {
+  const data = CHART_DATA;
+  const palette = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf'];
+  const REASONING_FILL = 'rgba(255, 159, 64, 0.15)';
+  const CONTENT_FILL = 'rgba(54, 162, 235, 0.15)';
+  const PAD = {left: 56, right: 16, top: 12, bottom: 40};
+  const tooltip = document.getElementById('chart-tooltip');
+  const hidden = new Set();
+  const charts = [];
+  data.providers.forEach((p, i) => { p.color = palette[i % palette.length]; });
+
+  function setup(canvas, width, height) {
+    const ratio = window.devicePixelRatio || 1;
+    canvas.width = width * ratio;
+    canvas.height = height * ratio;
+    canvas.style.width = width + 'px';
+    canvas.style.height = height + 'px';
+    const ctx = canvas.getContext('2d');
+    ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+    return {canvas, ctx, width, height};
+  }
+
+  function niceTicks(max, count) {
+    if (!(max > 0)) return [0];
+    const raw = max / count;
+    const magnitude = Math.pow(10, Math.floor(Math.log10(raw)));
+    const step = [1, 2, 5, 10].map(m => m * magnitude).find(s => s >= raw);
+    const ticks = [];
+    for (let v = 0; v <= max + step / 2; v += step) ticks.push(+v.toPrecision(6));
+    return ticks;
+  }
+
+  function frame(c, xScale, yScale, xTicks, yTicks, xLabel, yLabel, formatX) {
+    const ctx = c.ctx;
+    ctx.clearRect(0, 0, c.width, c.height);
+    ctx.strokeStyle = '#eee';
+    ctx.fillStyle = '#555';
+    ctx.font = '11px Arial';
+    ctx.lineWidth = 1;
+    ctx.textAlign = 'center';
+    xTicks.forEach(v => {
+      const x = xScale(v);
+      ctx.beginPath(); ctx.moveTo(x, PAD.top); ctx.lineTo(x, c.height - PAD.bottom); ctx.stroke();
+      ctx.fillText(formatX ? formatX(v) : v, x, c.height - PAD.bottom + 14);
+    });
+    ctx.textAlign = 'right';
+    yTicks.forEach(v => {
+      const y = yScale(v);
+      ctx.beginPath(); ctx.moveTo(PAD.left, y); ctx.lineTo(c.width - PAD.right, y); ctx.stroke();
+      ctx.fillText(v, PAD.left - 6, y + 4);
+    });
+    ctx.textAlign = 'center';
+    ctx.fillText(xLabel, (PAD.left + c.width - PAD.right) / 2, c.height - 6);
+    ctx.save();
+    ctx.translate(12, (PAD.top + c.height - PAD.bottom) / 2);
+    ctx.rotate(-Math.PI / 2);
+    ctx.fillText(yLabel, 0, 0);
+    ctx.restore();
+  }
+
+  function linear(domainMax, rangeStart, rangeEnd) {
+    return v => rangeStart + (rangeEnd - rangeStart) * (domainMax > 0 ? v / domainMax : 0);
+  }
+
+  function showTooltip(event, text) {
+    tooltip.textContent = text;
+    tooltip.style.left = (event.clientX + 12) + 'px';
+    tooltip.style.top = (event.clientY + 12) + 'px';
+    tooltip.style.display = 'block';
+  }
+
+  function hover(c, points) {
+    c.canvas.addEventListener('mousemove', event => {
+      const rect = c.canvas.getBoundingClientRect();
+      const mx = event.clientX - rect.left, my = event.clientY - rect.top;
+      let best = null, bestDistance = 144;
+      points().forEach(p => {
+        const d = (p.x - mx) * (p.x - mx) + (p.y - my) * (p.y - my);
+        if (d < bestDistance) { best = p; bestDistance = d; }
+      });
+      if (best) showTooltip(event, best.text); else tooltip.style.display = 'none';
+    });
+    c.canvas.addEventListener('mouseleave', () => { tooltip.style.display = 'none'; });
+  }
+
+  // 累计 token 时间线：每个服务商一个面板，坐标轴统一便于比较；推理阶段和输出阶段以不同底色区分
+  const timelineGrid = document.getElementById('timeline-grid');
+  const streams = data.providers.flatMap(p => p.streams);
+  const tMax = Math.max(...streams.map(s => s.t[s.t.length - 1]));
+  const yMax = Math.max(...streams.map(s => s.y[s.y.length - 1]));
+  data.providers.forEach(p => {
+    const panel = document.createElement('div');
+    panel.className = 'panel';
+    panel.dataset.provider = p.name;
+    const title = document.createElement('h3');
+    title.textContent = p.name;
+    panel.appendChild(title);
+    const canvas = document.createElement('canvas');
+    panel.appendChild(canvas);
+    timelineGrid.appendChild(panel);
+    const c = setup(canvas, 460, 260);
+    const x = linear(tMax, PAD.left, c.width - PAD.right);
+    const y = linear(yMax, c.height - PAD.bottom, PAD.top);
+    let points = [];
+
+    function fill(s, from, to, color) {
+      if (to - from < 1) return;
+      const ctx = c.ctx;
+      ctx.beginPath();
+      ctx.moveTo(x(s.t[from]), y(0));
+      for (let i = from; i < to; i++) ctx.lineTo(x(s.t[i]), y(s.y[i]));
+      ctx.lineTo(x(s.t[to - 1]), y(0));
+      ctx.closePath();
+      ctx.fillStyle = color;
+      ctx.fill();
+    }
+
+    function draw() {
+      frame(c, x, y, niceTicks(tMax, 6), niceTicks(yMax, 5), 'Time since request (s)', 'Cumulative tokens');
+      points = [];
+      p.streams.forEach(s => {
+        // 推理阶段到最后一个推理分块为止，输出阶段从第一个输出分块开始
+        let split = s.reasoningEnd === null ? 0 : s.t.findIndex(t => t > s.reasoningEnd);
+        if (split < 0) split = s.t.length;
+        fill(s, 0, Math.min(split + 1, s.t.length), REASONING_FILL);
+        fill(s, Math.max(split - 1, 0), s.t.length, CONTENT_FILL);
+        const ctx = c.ctx;
+        ctx.beginPath();
+        s.t.forEach((t, i) => { if (i) ctx.lineTo(x(t), y(s.y[i])); else ctx.moveTo(x(t), y(s.y[i])); });
+        ctx.strokeStyle = p.color;
+        ctx.lineWidth = 1.5;
+        ctx.setLineDash(s.status === 'ok' ? [] : [4, 3]);
+        ctx.stroke();
+        ctx.setLineDash([]);
+        s.t.forEach((t, i) => points.push({
+          x: x(t), y: y(s.y[i]),
+          text: `${p.name} #${s.trial}${s.status === 'ok' ? '' : ' (' + s.status + ')'}\\n` +
+                `${t.toFixed(3)} s, ${Math.round(s.y[i])} tokens\\n` +
+                (s.reasoningEnd !== null && t <= s.reasoningEnd ? 'reasoning' : 'content')
+        }));
+      });
+    }
+    hover(c, () => points);
+    charts.push(draw);
+  });
+
+  // 首 token 时间分布：每个服务商一行，每个点为一次请求，竖线为中位数
+  (function () {
+    const canvas = document.getElementById('ttft-chart');
+    const rowHeight = 36;
+    const c = setup(canvas, 940, PAD.top + PAD.bottom + rowHeight * data.providers.length);
+    const all = data.providers.flatMap(p => p.ttft);
+    const max = Math.max(...all, 0) * 1.05;
+    const x = linear(max, PAD.left + 120, c.width - PAD.right);
+    let points = [];
+    charts.push(() => {
+      frame(c, x, v => v, niceTicks(max, 8), [], 'Time to first token (s)', '');
+      points = [];
+      const ctx = c.ctx;
+      data.providers.forEach((p, row) => {
+        const center = PAD.top + rowHeight * (row + 0.5);
+        ctx.fillStyle = '#333';
+        ctx.textAlign = 'right';
+        ctx.fillText(p.name, PAD.left + 112, center + 4);
+        if (hidden.has(p.name)) return;
+        const sorted = [...p.ttft].sort((a, b) => a - b);
+        p.ttft.forEach((v, i) => {
+          const jitter = ((i * 7919) % 13 - 6) * 1.6;
+          ctx.beginPath();
+          ctx.arc(x(v), center + jitter, 3, 0, 2 * Math.PI);
+          ctx.fillStyle = p.color;
+          ctx.globalAlpha = 0.6;
+          ctx.fill();
+          ctx.globalAlpha = 1;
+          points.push({x: x(v), y: center + jitter, text: `${p.name}\\nTTFT ${v.toFixed(3)} s`});
+        });
+        if (sorted.length) {
+          const median = sorted[Math.floor((sorted.length - 1) / 2)];
+          ctx.beginPath();
+          ctx.moveTo(x(median), center - rowHeight / 2 + 4);
+          ctx.lineTo(x(median), center + rowHeight / 2 - 4);
+          ctx.strokeStyle = p.color;
+          ctx.lineWidth = 2;
+          ctx.stroke();
+          points.push({x: x(median), y: center - rowHeight / 2 + 4, text: `${p.name}\\nmedian TTFT ${median.toFixed(3)} s (n=${sorted.length})`});
+        }
+      });
+    });
+    hover(c, () => points);
+  })();
+
+  // token 间隔分布：对数横轴，每个服务商一条阶梯线，纵轴为间隔落入各桶的比例
+  (function () {
+    const canvas = document.getElementById('itl-chart');
+    const c = setup(canvas, 940, 320);
+    const buckets = data.providers.flatMap(p => p.itl);
+    if (!buckets.length) { canvas.parentNode.style.display = 'none'; return; }
+    const low = Math.max(Math.min(...buckets.map(b => b[1])) / 1.05, 0.01);
+    const high = Math.max(...buckets.map(b => b[1]));
+    const yMax = Math.max(...buckets.map(b => b[2])) * 1.1;
+    const logLow = Math.log10(low), logHigh = Math.log10(high);
+    const x = v => PAD.left + (c.width - PAD.left - PAD.right) * (Math.log10(Math.max(v, low)) - logLow) / (logHigh - logLow || 1);
+    const y = linear(yMax, c.height - PAD.bottom, PAD.top);
+    const ticks = [];
+    for (let e = Math.floor(logLow); e <= Math.ceil(logHigh); e++) {
+      [1, 2, 5].forEach(m => { const v = m * Math.pow(10, e); if (v >= low && v <= high) ticks.push(v); });
+    }
+    let points = [];
+    charts.push(() => {
+      frame(c, x, y, ticks, niceTicks(yMax * 100, 5).map(v => v / 100), 'Inter-token latency (ms, log scale)', 'Share of gaps', v => v);
+      points = [];
+      const ctx = c.ctx;
+      data.providers.forEach(p => {
+        if (hidden.has(p.name) || !p.itl.length) return;
+        ctx.beginPath();
+        let previousEnd = null;
+        p.itl.forEach(b => {
+          const x0 = x(b[0]), x1 = x(b[1]), top = y(b[2]);
+          // 相邻的桶连成阶梯，中间有空桶时先回到零
+          if (previousEnd === null || b[0] > previousEnd * 1.0001) {
+            if (previousEnd !== null) ctx.lineTo(x(previousEnd), y(0));
+            ctx.moveTo(x0, y(0));
+          }
+          ctx.lineTo(x0, top);
+          ctx.lineTo(x1, top);
+          previousEnd = b[1];
+          points.push({x: (x0 + x1) / 2, y: top, text: `${p.name}\\n${b[0].toFixed(2)}–${b[1].toFixed(2)} ms: ${(b[2] * 100).toFixed(1)}%`});
+        });
+        if (previousEnd !== null) ctx.lineTo(x(previousEnd), y(0));
+        ctx.strokeStyle = p.color;
+        ctx.lineWidth = 1.5;
+        ctx.stroke();
+      });
+    });
+    hover(c, () => points);
+  })();
+
+  // 图例：勾选框控制服务商的显示
+  const legend = document.getElementById('chart-legend');
+  data.providers.forEach(p => {
+    const label = document.createElement('label');
+    const box = document.createElement('input');
+    box.type = 'checkbox';
+    box.checked = true;
+    box.addEventListener('change', () => {
+      if (box.checked) hidden.delete(p.name); else hidden.add(p.name);
+      document.querySelectorAll('#timeline-grid .panel').forEach(panel => {
+        panel.style.display = hidden.has(panel.dataset.provider) ? 'none' : '';
+      });
+      charts.forEach(draw => draw());
+    });
+    const swatch = document.createElement('span');
+    swatch.className = 'swatch';
+    swatch.style.background = p.color;
+    label.append(box, swatch, document.createTextNode(p.name));
+    legend.appendChild(label);
+  });
+
+  charts.forEach(draw => draw());
+})();
+"""
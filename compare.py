@@ -0,0 +1,379 @@
+import argparse
+import csv
+import json
+import re
+import sys
+from dataclasses import dataclass, asdict, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+from results_store import DEFAULT_STORE_PATH
+from stats import difference_ci, rate_increase_p_value
+
+# 结果文件中需要转换为数值的列（CSV 中均为字符串）
+_FLOAT_COLUMNS = ('first_token_time', 'total_time')
+_INT_COLUMNS = ('total_tokens', 'reasoning_tokens', 'content_tokens')
+
+@dataclass
+class RegressionThresholds:
+    """退化判定阈值"""
+    ttft_increase: float = 0.10           # 首 token 时间均值允许的最大相对增幅
+    tps_decrease: float = 0.10            # 生成速度均值允许的最大相对降幅
+    error_rate_increase: float = 0.05     # 错误率允许的最大增幅（绝对值，0.05 即 5 个百分点）
+    confidence: float = 0.95              # 显著性检验的置信水平
+    require_significance: bool = True     # 只有差异在统计上显著时才判定为退化
+    fail_on_missing: bool = False         # 基线中的服务商在候选运行中缺失时判定为退化
+
+@dataclass
+class MetricDelta:
+    """单个指标在基线和候选运行之间的变化"""
+    baseline: Optional[float]
+    candidate: Optional[float]
+    change: Optional[float]               # 相对变化；错误率为绝对变化
+    significant: Optional[bool]           # 样本不足无法检验时为 None
+    regressed: bool = False
+
+@dataclass
+class ProviderComparison:
+    """单个服务商的对比结果"""
+    provider: str
+    baseline_requests: int
+    candidate_requests: int
+    ttft: Optional[MetricDelta] = None
+    tokens_per_second: Optional[MetricDelta] = None
+    error_rate: Optional[MetricDelta] = None
+    missing: Optional[str] = None         # 只出现在一侧时为缺失的一侧：'baseline' 或 'candidate'
+    regressions: List[str] = field(default_factory=list)
+
+def _convert(row: dict) -> dict:
+    """把 CSV 行中的数值列转换为数值，空字符串转换为 None"""
+    row = {key: (None if value == '' else value) for key, value in row.items()}
+    for column in _FLOAT_COLUMNS:
+        if row.get(column) is not None:
+            row[column] = float(row[column])
+    for column in _INT_COLUMNS:
+        if row.get(column) is not None:
+            row[column] = int(float(row[column]))
+    return row
+
+def load_results_file(path) -> List[dict]:
+    """读取 StreamingReporter 写出的 _results.jsonl 或 _results.csv（包含失败的请求）"""
+    path = Path(path)
+    with open(path, encoding='utf-8', newline='') as f:
+        if path.suffix == '.csv':
+            return [_convert(row) for row in csv.DictReader(f)]
+        return [json.loads(line) for line in f if line.strip()]
+
+# 结果文件名中的时间戳，例如 test_report_20250201_120000_results.jsonl
+_TIMESTAMP = re.compile(r'(\d{8}_\d{6})_results\.jsonl$')
+
+def _result_files(report_dir: Path) -> List[Path]:
+    """
+    报告目录中的结果文件，按文件名中的时间戳排序
+
+    不同模式的前缀不同（test_report_、replay_report_ 等），按完整文件名排序会把
+    较新的其他前缀的运行排在较早的 test_report_ 之前；没有时间戳的文件排在最前。
+    """
+    def timestamp(path: Path):
+        match = _TIMESTAMP.search(path.name)
+        return (match.group(1) if match else '', path.name)
+    return sorted(report_dir.glob('*_results.jsonl'), key=timestamp)
+
+def load_run(source: str, db=DEFAULT_STORE_PATH, report_dir=None) -> Tuple[str, List[dict]]:
+    """
+    加载一次运行的结果
+
+    Args:
+        source: 可以是
+            - 结果文件路径（_results.jsonl 或 _results.csv）
+            - 报告路径或前缀（test_reports/test_report_20250201_120000[.html]）
+            - latest / previous：报告目录中最新 / 次新的一次运行
+            - 历史库中的 run_id（与报告文件名相同）
+        db: 历史库路径
+        report_dir: 报告目录，默认为 test_reports
+
+    Returns:
+        (运行名称, 结果行列表)
+
+    Raises:
+        ValueError: 找不到对应的运行
+    """
+    if report_dir is None:
+        from reporter import REPORT_DIR
+        report_dir = REPORT_DIR
+    report_dir = Path(report_dir)
+
+    if source in ('latest', 'previous'):
+        files = _result_files(report_dir)
+        index = -1 if source == 'latest' else -2
+        if len(files) < -index:
+            raise ValueError(f"{report_dir} 中没有足够的运行结果用于 {source}")
+        path = files[index]
+        return path.name[:-len('_results.jsonl')], load_results_file(path)
+
+    path = Path(source)
+    if path.suffix in ('.jsonl', '.csv') and path.exists():
+        return path.stem.replace('_results', ''), load_results_file(path)
+
+    # 报告路径或前缀：去掉扩展名后查找对应的结果文件；也可以只写文件名前缀
+    prefix = path.with_suffix('') if path.suffix in ('.html', '.csv') else path
+    for base in (prefix, report_dir / prefix.name):
+        for suffix in ('_results.jsonl', '_results.csv'):
+            candidate = base.parent / f"{base.name}{suffix}"
+            if candidate.exists():
+                return base.name, load_results_file(candidate)
+
+    # 历史库只保存返回了结果的请求，失败的请求不计入错误率
+    if Path(db).exists():
+        from results_store import ResultStore
+        store = ResultStore(db)
+        try:
+            rows = store.query(run_id=source)
+        finally:
+            store.close()
+        if rows:
+            return source, rows
+
+    raise ValueError(f"找不到运行：{source}")
+
+def _group(rows: Sequence[dict]) -> Dict[str, List[dict]]:
+    grouped: Dict[str, List[dict]] = {}
+    for row in rows:
+        grouped.setdefault(row['provider'], []).append(row)
+    return grouped
+
+def _mean(values: Sequence[float]) -> Optional[float]:
+    return sum(values) / len(values) if values else None
+
+def _tokens_per_second(row: dict) -> Optional[float]:
+    """生成速度：推理和正文 tokens / 总耗时，不含输入 tokens"""
+    if row.get('total_time') and row.get('reasoning_tokens') is not None and row.get('content_tokens') is not None:
+        return (row['reasoning_tokens'] + row['content_tokens']) / row['total_time']
+    return None
+
+def _metric_delta(
+    baseline: Sequence[float],
+    candidate: Sequence[float],
+    confidence: float
+) -> MetricDelta:
+    """均值的相对变化，以及均值差的 bootstrap 置信区间是否不含 0"""
+    baseline = [v for v in baseline if v is not None]
+    candidate = [v for v in candidate if v is not None]
+    baseline_mean, candidate_mean = _mean(baseline), _mean(candidate)
+    change = None
+    if baseline_mean and candidate_mean is not None:
+        change = (candidate_mean - baseline_mean) / baseline_mean
+    interval = difference_ci(candidate, baseline, confidence)
+    significant = None if interval is None else (interval[0] > 0 or interval[1] < 0)
+    return MetricDelta(baseline_mean, candidate_mean, change, significant)
+
+def _significant_enough(delta: MetricDelta, thresholds: RegressionThresholds) -> bool:
+    return delta.significant is True or not thresholds.require_significance
+
+def compare_provider(
+    provider: str,
+    baseline: List[dict],
+    candidate: List[dict],
+    thresholds: RegressionThresholds
+) -> ProviderComparison:
+    """对比单个服务商在两次运行中的首 token 时间、生成速度和错误率"""
+    comparison = ProviderComparison(provider, len(baseline), len(candidate))
+    if not baseline or not candidate:
+        comparison.missing = 'baseline' if not baseline else 'candidate'
+        if comparison.missing == 'candidate' and thresholds.fail_on_missing:
+            comparison.regressions.append('missing')
+        return comparison
+
+    # 被截止时间或停顿中断的结果只计入错误率，与排名统计一致
+    baseline_ok = [r for r in baseline if r.get('status') == 'ok']
+    candidate_ok = [r for r in candidate if r.get('status') == 'ok']
+
+    # 两次运行都有已预热连接的样本时只比较预热样本，避免冷启动比例不同造成偏差
+    baseline_warm = [r for r in baseline_ok if r.get('connection') != 'cold']
+    candidate_warm = [r for r in candidate_ok if r.get('connection') != 'cold']
+    if baseline_warm and candidate_warm:
+        baseline_ttft, candidate_ttft = baseline_warm, candidate_warm
+    else:
+        baseline_ttft, candidate_ttft = baseline_ok, candidate_ok
+
+    comparison.ttft = _metric_delta(
+        [r.get('first_token_time') for r in baseline_ttft],
+        [r.get('first_token_time') for r in candidate_ttft],
+        thresholds.confidence
+    )
+    comparison.tokens_per_second = _metric_delta(
+        [_tokens_per_second(r) for r in baseline_ok],
+        [_tokens_per_second(r) for r in candidate_ok],
+        thresholds.confidence
+    )
+
+    baseline_failures = len(baseline) - len(baseline_ok)
+    candidate_failures = len(candidate) - len(candidate_ok)
+    baseline_rate = baseline_failures / len(baseline)
+    candidate_rate = candidate_failures / len(candidate)
+    p_value = rate_increase_p_value(baseline_failures, len(baseline), candidate_failures, len(candidate))
+    comparison.error_rate = MetricDelta(
+        baseline_rate,
+        candidate_rate,
+        candidate_rate - baseline_rate,
+        p_value < 1 - thresholds.confidence
+    )
+
+    ttft, tps, errors = comparison.ttft, comparison.tokens_per_second, comparison.error_rate
+    if ttft.change is not None and ttft.change > thresholds.ttft_increase and _significant_enough(ttft, thresholds):
+        ttft.regressed = True
+        comparison.regressions.append('ttft')
+    if tps.change is not None and tps.change < -thresholds.tps_decrease and _significant_enough(tps, thresholds):
+        tps.regressed = True
+        comparison.regressions.append('tokens_per_second')
+    if errors.change > thresholds.error_rate_increase and _significant_enough(errors, thresholds):
+        errors.regressed = True
+        comparison.regressions.append('error_rate')
+
+    return comparison
+
+def compare_runs(
+    baseline: List[dict],
+    candidate: List[dict],
+    thresholds: RegressionThresholds = None
+) -> List[ProviderComparison]:
+    """
+    按服务商对比两次运行
+
+    Args:
+        baseline: 基线运行的结果行
+        candidate: 候选运行的结果行
+        thresholds: 退化判定阈值
+
+    Returns:
+        按服务商名称排序的 ProviderComparison 列表；regressions 非空即为退化
+    """
+    thresholds = thresholds or RegressionThresholds()
+    baseline_groups, candidate_groups = _group(baseline), _group(candidate)
+    return [
+        compare_provider(provider, baseline_groups.get(provider, []), candidate_groups.get(provider, []), thresholds)
+        for provider in sorted(set(baseline_groups) | set(candidate_groups))
+    ]
+
+def _format_delta(delta: Optional[MetricDelta], value_format: str, percent_points: bool = False) -> List[str]:
+    """基线值、候选值和变化（显著时标 *，判定为退化时标 !）"""
+    if delta is None:
+        return ["-", "-", "-"]
+
+    def value(v):
+        return format(v, value_format) if v is not None else "-"
+
+    if delta.change is None:
+        change = "-"
+    elif percent_points:
+        change = f"{delta.change * 100:+.1f}pp"
+    else:
+        change = f"{delta.change:+.1%}"
+    if delta.significant:
+        change += " *"
+    if delta.regressed:
+        change += " !"
+    return [value(delta.baseline), value(delta.candidate), change]
+
+def print_comparison(baseline_name: str, candidate_name: str, comparisons: List[ProviderComparison]):
+    """打印对比表格和退化列表"""
+    from tabulate import tabulate
+
+    rows = []
+    for c in comparisons:
+        if c.missing:
+            status = f"仅{'候选' if c.missing == 'baseline' else '基线'}运行中有"
+        else:
+            status = "退化" if c.regressions else "正常"
+        if c.regressions == ['missing']:
+            status = "缺失"
+        rows.append(
+            [c.provider, f"{c.baseline_requests}/{c.candidate_requests}"]
+            + _format_delta(c.ttft, '.3f')
+            + _format_delta(c.tokens_per_second, '.2f')
+            + _format_delta(c.error_rate, '.1%', percent_points=True)
+            + [status]
+        )
+
+    print(f"\n基线：{baseline_name}\n候选：{candidate_name}")
+    print(tabulate(
+        rows,
+        headers=[
+            'Provider', 'Requests',
+            'TTFT Base (s)', 'TTFT Cand (s)', 'TTFT Δ',
+            'Tokens/s Base', 'Tokens/s Cand', 'Tokens/s Δ',
+            'Errors Base', 'Errors Cand', 'Errors Δ',
+            'Verdict'
+        ],
+        tablefmt='grid'
+    ))
+    print("注：* 表示差异显著（均值差的 bootstrap 置信区间不含 0；错误率为单侧 Fisher 精确检验），! 表示超过阈值判定为退化")
+    if any(c.ttft and c.ttft.significant is None for c in comparisons):
+        print("注：部分服务商每次运行只有 1 个样本，无法检验显著性；用 --repeat 增加样本，或用 --ignore-significance 只按阈值判定")
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description='对比两次运行，按服务商计算首 token 时间、生成速度和错误率的变化；'
+                    '超过退化阈值时以退出码 1 结束，便于定时任务报警'
+    )
+    parser.add_argument('baseline', help='基线运行：结果文件、报告路径、latest/previous 或历史库中的 run_id')
+    parser.add_argument('candidate', nargs='?', default='latest', help='候选运行（默认：latest）')
+    parser.add_argument('--db', type=str, default=str(DEFAULT_STORE_PATH), help='历史库路径，用于按 run_id 查找')
+    parser.add_argument('--report-dir', type=str, default=None, help='报告目录（默认：test_reports）')
+    parser.add_argument('--max-ttft-increase', type=float, default=10.0, help='首 token 时间均值允许的最大增幅（百分比，默认：10）')
+    parser.add_argument('--max-tps-decrease', type=float, default=10.0, help='生成速度均值允许的最大降幅（百分比，默认：10）')
+    parser.add_argument('--max-error-increase', type=float, default=5.0, help='错误率允许的最大增幅（百分点，默认：5）')
+    parser.add_argument('--confidence', type=float, default=0.95, help='显著性检验的置信水平（默认：0.95）')
+    parser.add_argument('--ignore-significance', action='store_true', help='只按阈值判定退化，不要求差异显著')
+    parser.add_argument('--fail-on-missing', action='store_true', help='基线中的服务商在候选运行中缺失时判定为退化')
+    parser.add_argument('--json', type=str, default=None, help='把对比结果写入 JSON 文件')
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    """
+    命令行入口
+
+    Returns:
+        int: 退出码，0 表示没有退化，1 表示存在退化，2 表示找不到运行
+    """
+    args = parse_args(argv)
+    thresholds = RegressionThresholds(
+        ttft_increase=args.max_ttft_increase / 100,
+        tps_decrease=args.max_tps_decrease / 100,
+        error_rate_increase=args.max_error_increase / 100,
+        confidence=args.confidence,
+        require_significance=not args.ignore_significance,
+        fail_on_missing=args.fail_on_missing
+    )
+
+    try:
+        baseline_name, baseline = load_run(args.baseline, args.db, args.report_dir)
+        candidate_name, candidate = load_run(args.candidate, args.db, args.report_dir)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    comparisons = compare_runs(baseline, candidate, thresholds)
+    print_comparison(baseline_name, candidate_name, comparisons)
+
+    regressed = [c for c in comparisons if c.regressions]
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'baseline': baseline_name,
+                'candidate': candidate_name,
+                'thresholds': asdict(thresholds),
+                'regressed': bool(regressed),
+                'providers': [asdict(c) for c in comparisons],
+            }, f, ensure_ascii=False, indent=2)
+
+    if regressed:
+        print("\n检测到退化：")
+        for c in regressed:
+            print(f"  {c.provider}: {', '.join(c.regressions)}")
+        return 1
+    print("\n未检测到退化")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
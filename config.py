@@ -1,10 +1,17 @@
 import os
 from pathlib import Path
-from dotenv import load_dotenv
 
-# Load environment variables from .env file
 env_path = Path(__file__).parent / '.env'
-load_dotenv(env_path)
+REGISTRY_PATH = Path(__file__).parent / 'providers.toml'
+_env_loaded = False
+
+def load_env():
+    """Load environment variables from the .env file, once, on first use"""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv(env_path)
+        _env_loaded = True
 
 def get_env_var(key: str, default: str = None, required: bool = True) -> str:
     """
@@ -21,6 +28,7 @@ def get_env_var(key: str, default: str = None, required: bool = True) -> str:
     Raises:
         ValueError: If key not found and required is True and no default provided
     """
+    load_env()
     value = os.getenv(key)
     if value is None:
         if not required:
@@ -31,38 +39,29 @@ def get_env_var(key: str, default: str = None, required: bool = True) -> str:
         raise ValueError(f"Environment variable {key} not found. Please check your .env file.")
     return value
 
-# API Keys Configuration
-API_KEYS = {
-    'deepseek': get_env_var('DEEPSEEK_API_KEY', required=True),
-    'aliyun': get_env_var('ALIYUN_API_KEY', required=True),
-    'qianfan': get_env_var('QIANFAN_API_KEY', required=False),
-    'siliconflow': get_env_var('SILICONFLOW_API_KEY', required=True),
-    'volces': get_env_var('VOLCES_API_KEY', required=False),
-    'tencentcloud': get_env_var('TENCENTCLOUD_API_KEY', required=False),
-}
-
-# Endpoint Configuration
-ENDPOINTS = {
-    'volces': get_env_var('VOLCES_ENDPOINT', required=False),
-}
-
-# Base URLs
-BASE_URLS = {
-    'deepseek': 'https://api.deepseek.com',
-    'aliyun': 'https://dashscope.aliyuncs.com/compatible-mode/v1',
-    'qianfan': 'https://qianfan.baidubce.com/v2',
-    'siliconflow': 'https://api.siliconflow.cn/v1',
-    'volces': 'https://ark.cn-beijing.volces.com/api/v3',
-    'tencentcloud': 'https://api.lkeap.cloud.tencent.com/v1',
-}
-
-# Model names
-MODELS = {
-    'deepseek': 'deepseek-reasoner',
-    'aliyun': 'deepseek-r1',
-    'qianfan': 'deepseek-r1',
-    'siliconflow': 'deepseek-ai/DeepSeek-R1',
-    'siliconflow_pro': 'Pro/deepseek-ai/DeepSeek-R1',
-    'volces': None,  # Will be set from ENDPOINTS['volces']
-    'tencentcloud': 'deepseek-r1',
-}
+def load_registry(path=None) -> dict:
+    """
+    Read the provider registry (TOML)
+    
+    Args:
+        path: Registry file, defaults to providers.toml next to this module
+    
+    Returns:
+        dict: Parsed registry
+    
+    Raises:
+        ValueError: If the file is missing or is not valid TOML
+    """
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11
+        import tomli as tomllib
+    
+    path = Path(path) if path else REGISTRY_PATH
+    try:
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    except FileNotFoundError:
+        raise ValueError(f"Provider registry {path} not found.") from None
+    except tomllib.TOMLDecodeError as e:
+        raise ValueError(f"Provider registry {path} is not valid TOML: {e}") from e
@@ -0,0 +1,307 @@
+import bisect
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence
+from tester import APITester, TestResult, percentile
+from providers import BaseProvider
+
+METRIC_PREFIX = 'api_ranking'
+
+# 累计直方图的桶边界（Prometheus 的 le 标签）
+TTFT_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
+TPS_BUCKETS = (5.0, 10.0, 20.0, 30.0, 50.0, 75.0, 100.0, 150.0, 200.0, 300.0)
+QUANTILES = (0.5, 0.9, 0.99)
+
+@dataclass
+class DaemonConfig:
+    """持续探测配置"""
+    interval: float = 60.0                # 每个服务商的探测间隔（秒）
+    window: float = 3600.0                # 滚动窗口长度（秒）
+    max_window_samples: int = 10000       # 每个滚动窗口最多保留的样本数，保证长期运行时内存有界
+    host: str = '127.0.0.1'
+    port: int = 9464                      # /metrics 监听端口
+    timeout: Optional[float] = 120.0      # 单个请求的截止时间（秒）
+    stall_timeout: Optional[float] = None # 开始输出后两个分块之间允许的最长间隔（秒）
+    raw_sse: bool = False                 # 直接解析 SSE 字节流，跳过 SDK 对象构造
+    max_tokens: Optional[int] = None      # 探测请求的输出 token 上限
+
+class CumulativeHistogram:
+    """自启动以来的累计直方图，桶数固定"""
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(le, 累计计数) 列表，最后一项为 +Inf"""
+        total = 0
+        buckets = []
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            buckets.append((bound, total))
+        return buckets
+
+class RollingWindow:
+    """
+    滚动时间窗口内的样本
+
+    按时间淘汰超出窗口的样本，并以 maxlen 限制样本数，长期运行内存有界。
+    """
+
+    def __init__(self, window: float, maxlen: int):
+        self.window = window
+        self.samples = deque(maxlen=maxlen)
+
+    def add(self, value: float, now: float):
+        self.samples.append((now, value))
+
+    def values(self, now: float) -> List[float]:
+        cutoff = now - self.window
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+        return [value for _, value in self.samples]
+
+class ProviderMetrics:
+    """单个服务商的探测指标"""
+
+    def __init__(self, config: DaemonConfig):
+        self.requests: Dict[str, int] = {}
+        self.ttft = CumulativeHistogram(TTFT_BUCKETS)
+        self.tokens_per_second = CumulativeHistogram(TPS_BUCKETS)
+        self.window_ttft = RollingWindow(config.window, config.max_window_samples)
+        self.window_tokens_per_second = RollingWindow(config.window, config.max_window_samples)
+        self.window_status = RollingWindow(config.window, config.max_window_samples)
+        self.last_success: Optional[float] = None
+        self.last_probe: Optional[float] = None
+
+    def record(self, result: Optional[TestResult], now: float, wall_time: float):
+        """记录一次探测结果；result 为 None 表示请求失败"""
+        status = result.status if result else 'error'
+        self.requests[status] = self.requests.get(status, 0) + 1
+        self.window_status.add(0.0 if status == 'ok' else 1.0, now)
+        self.last_probe = wall_time
+        if status != 'ok':
+            return
+
+        self.last_success = wall_time
+        if result.first_token_time is not None:
+            self.ttft.observe(result.first_token_time)
+            self.window_ttft.add(result.first_token_time, now)
+        if result.total_time > 0:
+            speed = (result.reasoning_tokens + result.content_tokens) / result.total_time
+            self.tokens_per_second.observe(speed)
+            self.window_tokens_per_second.add(speed, now)
+
+def _escape(value) -> str:
+    """转义 Prometheus 标签值中的反斜杠、双引号和换行"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels) -> str:
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class MetricsRegistry:
+    """所有服务商指标的线程安全容器，并负责生成 Prometheus 文本格式"""
+
+    def __init__(self, config: DaemonConfig):
+        self.config = config
+        self._providers: Dict[str, ProviderMetrics] = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, result: Optional[TestResult]):
+        with self._lock:
+            metrics = self._providers.get(provider)
+            if metrics is None:
+                metrics = self._providers[provider] = ProviderMetrics(self.config)
+            metrics.record(result, time.monotonic(), time.time())
+
+    def render(self) -> str:
+        """生成 Prometheus 文本格式（version 0.0.4）"""
+        now = time.monotonic()
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+
+        def sample(name, value, **labels):
+            lines.append(f"{METRIC_PREFIX}_{name}{_labels(**labels) if labels else ''} {_format_value(value)}")
+
+        with self._lock:
+            providers = sorted(self._providers.items())
+
+            header('probe_requests_total', 'counter', 'Probe requests by outcome (ok, timeout, stalled, error).')
+            for name, metrics in providers:
+                for status, count in sorted(metrics.requests.items()):
+                    sample('probe_requests_total', count, provider=name, status=status)
+
+            for metric, attribute, help_text in (
+                ('ttft_seconds', 'ttft', 'Time to first token of successful probes.'),
+                ('tokens_per_second', 'tokens_per_second', 'Output tokens per second of successful probes.'),
+            ):
+                header(metric, 'histogram', help_text)
+                for name, metrics in providers:
+                    histogram = getattr(metrics, attribute)
+                    for bound, count in histogram.cumulative():
+                        sample(f'{metric}_bucket', count, provider=name, le=_format_value(float(bound)))
+                    sample(f'{metric}_sum', histogram.sum, provider=name)
+                    sample(f'{metric}_count', histogram.count, provider=name)
+
+            window = f'over the last {self.config.window:g} seconds'
+            for metric, attribute, help_text in (
+                ('window_ttft_seconds', 'window_ttft', f'Time to first token quantiles {window}.'),
+                ('window_tokens_per_second', 'window_tokens_per_second', f'Output tokens per second quantiles {window}.'),
+            ):
+                header(metric, 'gauge', help_text)
+                for name, metrics in providers:
+                    values = getattr(metrics, attribute).values(now)
+                    for quantile in QUANTILES:
+                        if values:
+                            sample(metric, percentile(values, quantile * 100), provider=name, quantile=quantile)
+
+            header('window_requests', 'gauge', f'Probe requests {window}.')
+            statuses = {name: metrics.window_status.values(now) for name, metrics in providers}
+            for name, values in statuses.items():
+                sample('window_requests', len(values), provider=name)
+            header('window_error_ratio', 'gauge', f'Share of failed or interrupted probes {window}.')
+            for name, values in statuses.items():
+                if values:
+                    sample('window_error_ratio', sum(values) / len(values), provider=name)
+
+            header('last_success_timestamp_seconds', 'gauge', 'Unix time of the last successful probe.')
+            for name, metrics in providers:
+                if metrics.last_success is not None:
+                    sample('last_success_timestamp_seconds', metrics.last_success, provider=name)
+            header('last_probe_timestamp_seconds', 'gauge', 'Unix time of the last probe.')
+            for name, metrics in providers:
+                if metrics.last_probe is not None:
+                    sample('last_probe_timestamp_seconds', metrics.last_probe, provider=name)
+
+        return '\n'.join(lines) + '\n'
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """只提供 GET /metrics"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0].rstrip('/') != '/metrics':
+            self.send_error(404)
+            return
+        data = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class MetricsServer(ThreadingHTTPServer):
+    """Prometheus 抓取端点"""
+
+    daemon_threads = True
+
+    def __init__(self, registry: MetricsRegistry, host: str, port: int):
+        super().__init__((host, port), _MetricsHandler)
+        self.registry = registry
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+class ProbeDaemon:
+    """
+    持续探测守护进程
+
+    每个服务商一个探测线程，按固定间隔用 APITester 发送请求，结果写入
+    MetricsRegistry，由 /metrics 端点以 Prometheus 文本格式暴露。
+    """
+
+    def __init__(self, config: DaemonConfig = None):
+        self.config = config or DaemonConfig()
+        self.registry = MetricsRegistry(self.config)
+        self._stop = threading.Event()
+        self._server = None
+
+    def run(self, providers: List[BaseProvider], messages: List[dict]):
+        """启动探测和 /metrics 端点，直到 stop() 或 Ctrl+C"""
+        active_providers = [p for p in providers if p.is_available()]
+        if not active_providers:
+            print("没有可用的服务商")
+            return
+
+        # 关闭 SDK 内部重试，让错误如实计入指标，而不是变成更长的首 token 时间；
+        # 使用副本，不改变调用方的服务商实例
+        active_providers = [provider.without_retries() for provider in active_providers]
+
+        self._server = MetricsServer(self.registry, self.config.host, self.config.port)
+        server_thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        server_thread.start()
+        print(f"\n指标端点已启动：{self._server.url}")
+        print(f"探测间隔：{self.config.interval} 秒，滚动窗口：{self.config.window} 秒")
+
+        # 各服务商的首次探测在一个间隔内错开，避免同时发起
+        threads = [
+            threading.Thread(
+                target=self._probe_loop,
+                args=(provider, messages, index * self.config.interval / len(active_providers)),
+                daemon=True
+            )
+            for index, provider in enumerate(active_providers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while not self._stop.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            print("\n正在停止探测...")
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            self._server.shutdown()
+            self._server.server_close()
+
+    def stop(self):
+        self._stop.set()
+
+    def _probe_loop(self, provider: BaseProvider, messages: List[dict], offset: float):
+        """单个服务商的探测循环（在独立线程中运行）"""
+        # 复用同一个测试器：每次测试前重置状态，只保留计数，内存不随运行时间增长
+        tester = APITester(
+            buffer_output=True,
+            verbose=False,
+            metrics_only=True,
+            raw_sse=self.config.raw_sse,
+            timeout=self.config.timeout,
+            stall_timeout=self.config.stall_timeout
+        )
+        next_run = time.monotonic() + offset
+        while not self._stop.wait(max(0.0, next_run - time.monotonic())):
+            result = tester.test_provider(provider, messages, max_tokens=self.config.max_tokens)
+            self.registry.record(provider.name, result)
+            if result is None:
+                print(f"服务商 {provider.name} 探测失败：{tester.last_error}")
+
+            # 按固定节拍调度；单次探测超过间隔时跳过错过的节拍
+            next_run += self.config.interval
+            now = time.monotonic()
+            if next_run < now:
+                next_run += ((now - next_run) // self.config.interval + 1) * self.config.interval
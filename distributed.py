@@ -0,0 +1,440 @@
+"""
+多进程、多主机分布式测试
+
+协调端把 服务商 × 请求 × 试验 展开为任务文件放入队列目录，工作进程通过重命名认领任务
+（rename 是原子操作，同一任务只会被一个工作进程拿到），每完成一个任务就向自己的结果文件
+追加一行 JSON；协调端持续读取这些文件，把结果汇总到同一份报告。本机的工作进程由进程池启动，
+每个进程有自己的 GIL 和连接池；队列目录位于共享文件系统（如 NFS）时，在其他主机上运行
+python distributed.py <队列目录> 即可加入同一次运行。
+
+队列目录结构：
+    run.json                 本次运行的配置（服务商选择、测试选项、截止时间），最后写入
+    jobs/                    待认领的任务
+    claimed/<工作进程>/       已认领的任务；工作进程失联时移回 jobs/
+    results/<工作进程>.jsonl  工作进程写出的结果，每行一个
+    clock/                   时钟偏差测量的请求和应答
+    workers/<工作进程>.json   工作进程的心跳
+    stop                     协调端结束时写入，工作进程看到后退出
+
+时钟偏差：工作进程启动时与协调端交换几次时间戳（Cristian 算法，取往返最短的一次），得到本机时钟
+相对协调端的偏差。结果中的 started_at 和心跳时间换算到协调端时钟，协调端给出的截止时间也换算到
+本机时钟。各项延迟指标本身是同一进程内单调时钟的差值，不受偏差影响。
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from tester import APITester, TestResult
+from timeline import StreamTimeline
+import timeline
+import traces
+
+POLL_INTERVAL = 0.01          # 协调端轮询结果和时钟请求的间隔（秒），也决定了时钟偏差的测量精度
+WORKER_CHECK_INTERVAL = 0.5   # 协调端检查工作进程心跳的间隔（秒）
+IDLE_INTERVAL = 0.1           # 工作进程没有待认领任务时的等待间隔（秒）
+HEARTBEAT_INTERVAL = 2.0      # 工作进程写心跳的间隔（秒）
+CLOCK_SAMPLES = 8             # 时钟偏差测量的往返次数
+CLOCK_TIMEOUT = 30.0          # 等待协调端应答时钟请求的最长时间（秒）
+
+_QUEUE_ENTRIES = ('run.json', 'stop', 'jobs', 'claimed', 'results', 'clock', 'workers')
+
+@dataclass
+class DistributedConfig:
+    """分布式测试配置"""
+    processes: int = 1                # 本机启动的工作进程数；0 表示只使用其他主机上的工作进程
+    threads: int = 3                  # 每个工作进程同时进行的请求数
+    queue_dir: Optional[str] = None   # 队列目录，多主机时应位于共享文件系统（默认：临时目录）
+    worker_timeout: float = 60.0      # 心跳中断超过该时间（秒）的工作进程视为失联，其认领的任务重新排队
+
+def _write_json(path: Path, data):
+    """先写临时文件再重命名，读取方不会看到写了一半的文件"""
+    temporary = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    temporary.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+    os.replace(temporary, path)
+
+def _read_json(path: Path):
+    """读取 JSON 文件，文件不存在时返回 None"""
+    try:
+        return json.loads(path.read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        return None
+
+def result_to_dict(result: TestResult) -> dict:
+    """TestResult 转为可 JSON 序列化的 dict，时间线一并保留"""
+    data = {f.name: getattr(result, f.name) for f in fields(TestResult)}
+    if result.timeline is not None:
+        data['timeline'] = result.timeline.to_dict()
+    return data
+
+def result_from_dict(data: dict) -> TestResult:
+    """result_to_dict 的逆操作"""
+    data = dict(data)
+    if data.get('timeline') is not None:
+        data['timeline'] = StreamTimeline.from_dict(data['timeline'])
+    return TestResult(**data)
+
+# ---------------------------------------------------------------- 工作进程
+
+def measure_clock_offset(queue: Path, worker_id: str) -> Tuple[float, float]:
+    """
+    测量本机时钟相对协调端时钟的偏差
+
+    每次往返：写出请求文件并记下本机时间 t1，协调端应答其当前时间 tc，收到应答时本机时间为 t2，
+    偏差估计为 tc - (t1 + t2) / 2，误差不超过往返时间的一半。取往返最短的一次。
+
+    Returns:
+        (偏差, 误差上限)，单位秒；协调端时间 = 本机时间 + 偏差
+    """
+    clock = queue / 'clock'
+    best = None
+    for sample in range(CLOCK_SAMPLES):
+        request = clock / f'{worker_id}-{sample}.req'
+        response = clock / f'{worker_id}-{sample}.resp'
+        t1 = time.time()
+        request.touch()
+        while not response.exists():
+            if time.time() - t1 > CLOCK_TIMEOUT:
+                raise TimeoutError(f"协调端 {CLOCK_TIMEOUT:.0f} 秒内没有应答时钟请求：{queue}")
+            time.sleep(0.002)
+        t2 = time.time()
+        tc = float(response.read_text())
+        response.unlink()
+        if best is None or t2 - t1 < best[1] * 2:
+            best = (tc - (t1 + t2) / 2, (t2 - t1) / 2)
+    return best
+
+class _WorkerTester(APITester):
+    """工作进程中的测试器；同一进程的多个线程同时执行不同任务，任务信息直接写入各自的轨迹"""
+
+    trace_context: dict = {}
+
+    def _start(self, provider, deadline_at=None, messages=None):
+        super()._start(provider, deadline_at, messages)
+        if self._trace is not None:
+            self._trace.meta.update({key: value for key, value in self.trace_context.items() if value is not None})
+
+class _JobQueue:
+    """工作进程一侧的任务认领，由进程内的所有线程共享"""
+
+    def __init__(self, queue: Path, worker_id: str):
+        self.jobs = queue / 'jobs'
+        self.claimed = queue / 'claimed' / worker_id
+        self.claimed.mkdir(parents=True, exist_ok=True)
+        self.stop_file = queue / 'stop'
+        self._lock = threading.Lock()
+        self._names: List[str] = []
+
+    def claim(self) -> Optional[dict]:
+        """认领下一个任务；暂时没有任务时等待，协调端结束后返回 None"""
+        while not self.stop_file.exists():
+            with self._lock:
+                # 缓存目录列表，依次尝试重命名；被其他进程抢先的任务跳过，列表用完再重新列出
+                if not self._names:
+                    self._names = sorted(name for name in os.listdir(self.jobs) if name.endswith('.json'))
+                while self._names:
+                    name = self._names.pop(0)
+                    try:
+                        os.replace(self.jobs / name, self.claimed / name)
+                    except FileNotFoundError:
+                        continue
+                    return _read_json(self.claimed / name)
+            time.sleep(IDLE_INTERVAL)
+        return None
+
+    def done(self, job: dict):
+        (self.claimed / f"{job['id']}.json").unlink(missing_ok=True)
+
+def run_worker(queue_dir, threads: Optional[int] = None, quiet: bool = False) -> int:
+    """
+    工作进程入口：认领并执行任务，直到协调端结束
+
+    Args:
+        queue_dir: 队列目录
+        threads: 同时进行的请求数（默认：使用协调端的设置）
+        quiet: 不打印每个任务的结果（本机进程池中的工作进程由协调端打印进度）
+
+    Returns:
+        int: 完成的任务数
+    """
+    from basetest import initialize_providers, prewarm_providers
+    from http_pool import HTTPPoolConfig, configure as configure_http_pool
+
+    queue = Path(queue_dir)
+    # 其他主机上的工作进程可能先于协调端启动，等待本次运行的配置写入
+    while not (queue / 'run.json').exists() or (queue / 'stop').exists():
+        time.sleep(IDLE_INTERVAL)
+    run = _read_json(queue / 'run.json')
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    threads = threads or run['threads']
+    offset, uncertainty = measure_clock_offset(queue, worker_id)
+
+    heartbeat = {
+        'worker': worker_id,
+        'host': socket.gethostname(),
+        'pid': os.getpid(),
+        'threads': threads,
+        'offset': offset,
+        'uncertainty': uncertainty,
+        'completed': 0,
+    }
+
+    def beat(**values):
+        heartbeat.update(values, time=time.time() + offset)
+        _write_json(queue / 'workers' / f'{worker_id}.json', heartbeat)
+
+    try:
+        configure_http_pool(HTTPPoolConfig(**run['pool']))
+        providers = {p.name: p for p in initialize_providers(run['providers'], run['models'], run['registry'])}
+        if run['prewarm']:
+            prewarm_providers(list(providers.values()), threads)
+    except BaseException as e:
+        beat(error=f"{type(e).__name__}: {e}")
+        raise
+
+    timeline.enable(run['timelines'])
+    recorder = traces.TraceRecorder(Path(run['trace_dir']) / worker_id).start() if run['trace_dir'] else None
+    # 协调端给出的截止时间换算为本机的 perf_counter 时间
+    deadline_at = None
+    if run['deadline'] is not None:
+        deadline_at = time.perf_counter() + (run['deadline'] - offset - time.time())
+
+    jobs = _JobQueue(queue, worker_id)
+    output = open(queue / 'results' / f'{worker_id}.jsonl', 'a', encoding='utf-8')
+    output_lock = threading.Lock()
+    completed = 0
+
+    def work():
+        nonlocal completed
+        tester = _WorkerTester(buffer_output=True, verbose=False, **run['tester'])
+        while True:
+            job = jobs.claim()
+            if job is None:
+                return
+            provider = providers.get(job['provider'])
+            record = {'job': job['id'], 'provider': job['provider'], 'worker': worker_id, 'result': None}
+            if provider is None:
+                record['error'] = "服务商在该工作进程上不可用（API 密钥未配置？）"
+            else:
+                tester.trace_context = {'workload_id': job['workload_id'], 'tags': job['tags'], 'warmup': job['warmup'] or None}
+                result = tester.test_provider(provider, job['messages'], deadline_at, job['max_tokens'])
+                if result:
+                    result.workload_id = job['workload_id']
+                    result.tags = job['tags']
+                    result.worker = worker_id
+                    result.started_at += offset
+                    record['result'] = result_to_dict(result)
+                elif tester.last_error is not None:
+                    record['error'] = str(tester.last_error)
+            with output_lock:
+                output.write(json.dumps(record, ensure_ascii=False) + '\n')
+                output.flush()
+                completed += 1
+            jobs.done(job)
+            if not quiet:
+                status = record['result']['status'] if record['result'] else f"失败：{record.get('error')}"
+                print(f"[{worker_id}] {job['id']} {job['provider']}：{status}")
+
+    try:
+        with ThreadPoolExecutor(threads) as pool:
+            futures = [pool.submit(work) for _ in range(threads)]
+            while True:
+                beat(completed=completed)
+                if not wait(futures, timeout=HEARTBEAT_INTERVAL).not_done:
+                    break
+            for future in futures:
+                future.result()
+    finally:
+        output.close()
+        if recorder is not None:
+            recorder.stop()
+    return completed
+
+# ---------------------------------------------------------------- 协调端
+
+class Coordinator:
+    """
+    协调端：写出任务，启动本机工作进程，汇总结果
+
+    Args:
+        config: 分布式测试配置
+        run: 写入 run.json 的运行配置，见 basetest.run_distributed_test
+    """
+
+    def __init__(self, config: DistributedConfig, run: dict):
+        self.config = config
+        self.run = dict(run, run_id=uuid.uuid4().hex[:12], threads=config.threads)
+        self._temporary = config.queue_dir is None
+        self.queue = Path(tempfile.mkdtemp(prefix='api_ranking_queue_') if self._temporary else config.queue_dir)
+        self.workers: Dict[str, dict] = {}
+        self._lost = set()
+        self._offsets: Dict[Path, int] = {}
+        self._pending: Dict[Path, bytes] = {}
+
+    def _prepare(self, jobs: List[dict]):
+        """清理上一次运行留下的内容，写出任务，最后写出 run.json 让工作进程开始"""
+        self.queue.mkdir(parents=True, exist_ok=True)
+        for name in _QUEUE_ENTRIES:
+            path = self.queue / name
+            if path.is_dir():
+                shutil.rmtree(path)
+            elif path.exists():
+                path.unlink()
+        for name in ('jobs', 'claimed', 'results', 'clock', 'workers'):
+            (self.queue / name).mkdir()
+        for job in jobs:
+            _write_json(self.queue / 'jobs' / f"{job['id']}.json", job)
+        _write_json(self.queue / 'run.json', self.run)
+
+    def _answer_clock(self):
+        """应答工作进程的时钟请求"""
+        clock = self.queue / 'clock'
+        for name in os.listdir(clock):
+            if name.endswith('.req'):
+                response = clock / (name[:-len('.req')] + '.resp')
+                temporary = clock / ('.' + response.name)
+                temporary.write_text(repr(time.time()))
+                os.replace(temporary, response)
+                (clock / name).unlink()
+
+    def _read_results(self) -> List[dict]:
+        """读取各结果文件中新增的完整行"""
+        records = []
+        for path in (self.queue / 'results').glob('*.jsonl'):
+            with open(path, 'rb') as f:
+                f.seek(self._offsets.get(path, 0))
+                data = self._pending.pop(path, b'') + f.read()
+                self._offsets[path] = f.tell()
+            complete, _, rest = data.rpartition(b'\n')
+            if rest:
+                self._pending[path] = rest
+            if complete:
+                records.extend(json.loads(line) for line in complete.split(b'\n'))
+        return records
+
+    def _check_workers(self, done: set):
+        """打印新加入的工作进程，把失联工作进程认领的任务重新排队"""
+        now = time.time()
+        for path in (self.queue / 'workers').glob('*.json'):
+            info = _read_json(path)
+            if info is None:
+                continue
+            worker = info['worker']
+            if worker not in self.workers:
+                if info.get('error'):
+                    print(f"工作进程 {worker} 启动失败：{info['error']}")
+                else:
+                    print(
+                        f"工作进程 {worker} 已加入：{info['threads']} 个线程，"
+                        f"时钟偏差 {info['offset'] * 1000:+.1f} ms（±{info['uncertainty'] * 1000:.1f} ms）"
+                    )
+            self.workers[worker] = info
+            if worker in self._lost or info.get('error') or now - info['time'] <= self.config.worker_timeout:
+                continue
+            self._lost.add(worker)
+            requeued = 0
+            for job in (self.queue / 'claimed' / worker).glob('*.json'):
+                if job.stem not in done:
+                    os.replace(job, self.queue / 'jobs' / job.name)
+                    requeued += 1
+            print(f"工作进程 {worker} 已失联 {now - info['time']:.0f} 秒，{requeued} 个任务重新排队")
+
+    def _alive(self) -> int:
+        """心跳未中断的工作进程数"""
+        now = time.time()
+        return sum(
+            1 for info in self.workers.values()
+            if not info.get('error') and now - info['time'] <= self.config.worker_timeout
+        )
+
+    def execute(
+        self,
+        jobs: List[dict],
+        on_result: Optional[Callable[[dict, Optional[TestResult]], None]] = None
+    ) -> List[Tuple[dict, Optional[TestResult]]]:
+        """
+        执行全部任务
+
+        Args:
+            jobs: 任务列表，每个任务为 dict：id、provider、messages、max_tokens、workload_id、tags、warmup
+            on_result: 可选回调，每个任务完成时以 (任务, 结果) 调用，失败时结果为 None
+
+        Returns:
+            list: 按完成顺序排列的 (任务, 结果)
+        """
+        by_id = {job['id']: job for job in jobs}
+        self._prepare(jobs)
+        print(f"已写出 {len(jobs)} 个任务：{self.queue}")
+        if self.config.processes == 0:
+            print(f"等待其他主机上的工作进程：python distributed.py {self.queue}")
+
+        pool = ProcessPoolExecutor(self.config.processes) if self.config.processes else None
+        local = [pool.submit(run_worker, str(self.queue), self.config.threads, True) for _ in range(self.config.processes)]
+        completed = []
+        done = set()
+        next_check = time.monotonic()
+        try:
+            while len(done) < len(jobs):
+                self._answer_clock()
+                for record in self._read_results():
+                    if record['job'] in done:
+                        continue
+                    done.add(record['job'])
+                    job = by_id[record['job']]
+                    result = result_from_dict(record['result']) if record['result'] else None
+                    if result is None and record.get('error'):
+                        print(f"服务商 {job['provider']} 在 {record['worker']} 上测试失败：{record['error']}")
+                    completed.append((job, result))
+                    if on_result:
+                        on_result(job, result)
+
+                # 心跳只需偶尔检查；时钟请求和结果每次轮询都处理，以免拉大时钟偏差的测量误差
+                if time.monotonic() >= next_check:
+                    next_check = time.monotonic() + WORKER_CHECK_INTERVAL
+                    self._check_workers(done)
+                    # 本机工作进程都已退出（只会因出错），又没有其他主机的工作进程时无法继续
+                    if local and all(f.done() for f in local) and not self._alive():
+                        errors = {repr(f.exception()) for f in local if f.exception()}
+                        raise RuntimeError(f"所有工作进程均已退出，{len(jobs) - len(done)} 个任务未完成：{'; '.join(errors)}")
+                time.sleep(POLL_INTERVAL)
+        finally:
+            (self.queue / 'stop').touch()
+            if pool is not None:
+                pool.shutdown(wait=True)
+            if self._temporary:
+                shutil.rmtree(self.queue, ignore_errors=True)
+        return completed
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description='分布式测试的工作进程：认领队列目录中的任务并写回结果。'
+                    '协调端由 basetest.py --mode dist --queue-dir <目录> 启动；'
+                    'API 密钥从本机的环境变量或 .env 读取'
+    )
+    parser.add_argument('queue_dir', help='与协调端共享的队列目录')
+    parser.add_argument('--processes', type=int, default=1, help='本机启动的工作进程数（默认：1）')
+    parser.add_argument('--threads', type=int, default=None, help='每个工作进程同时进行的请求数（默认：与协调端一致）')
+    return parser.parse_args()
+
+def main():
+    """命令行入口"""
+    args = parse_args()
+    if args.processes <= 1:
+        completed = run_worker(args.queue_dir, args.threads)
+    else:
+        with ProcessPoolExecutor(args.processes) as pool:
+            futures = [pool.submit(run_worker, args.queue_dir, args.threads) for _ in range(args.processes)]
+            completed = sum(f.result() for f in futures)
+    print(f"协调端已结束，本机共完成 {completed} 个任务")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+from parallel_tester import ParallelAPITester, ParallelTestConfig
+from providers import BaseProvider
+from tester import TestResult, percentile
+
+@dataclass
+class GoodputConfig:
+    """SLO 有效吞吐扫描配置"""
+    levels: List[int] = field(default_factory=lambda: [1, 2, 4, 8, 16])  # 依次测量的并发等级
+    rounds: int = 4                       # 每个并发等级每个并发槽依次发送的请求数
+    ttft_slo: float = 2.0                 # 首 token 时间上限（秒）
+    tpot_slo: float = 0.1                 # 首个 token 之后每个输出 token 的平均时间上限（秒）
+    attainment: float = 0.9               # 满足 SLO 的请求比例不低于该值时视为可持续
+    stop_at_knee: bool = True             # 出现拐点后不再测量更高的并发等级
+    timeout: Optional[float] = None       # 单个请求的截止时间（秒）
+    stall_timeout: Optional[float] = None # 开始输出后两个分块之间允许的最长间隔（秒）
+    raw_sse: bool = False                 # 直接解析 SSE 字节流，跳过 SDK 对象构造
+
+@dataclass
+class GoodputLevel:
+    """单个并发等级的测量结果"""
+    concurrency: int
+    elapsed: float
+    sent: int
+    completed: int                # 完整结束的请求数（不含失败、超时和停顿中断）
+    good: int                     # 同时满足首 token 时间和 TPOT SLO 的请求数
+    good_tokens: int              # 满足 SLO 的请求的输出 tokens
+    ttft_p50: Optional[float]
+    ttft_p90: Optional[float]
+    tpot_p50: Optional[float]
+    tpot_p90: Optional[float]
+    throughput: float             # 全部请求的输出 tokens / 测量时长
+
+    @property
+    def attainment(self) -> float:
+        """满足 SLO 的请求占已发送请求的比例；失败的请求计为不满足"""
+        return self.good / self.sent if self.sent else 0
+
+    @property
+    def goodput(self) -> float:
+        """每秒满足 SLO 的请求数"""
+        return self.good / self.elapsed if self.elapsed > 0 else 0
+
+    @property
+    def goodput_tokens(self) -> float:
+        """每秒满足 SLO 的请求的输出 tokens"""
+        return self.good_tokens / self.elapsed if self.elapsed > 0 else 0
+
+@dataclass
+class GoodputResult:
+    """单个服务商的 SLO 有效吞吐扫描结果"""
+    provider: str
+    levels: List[GoodputLevel] = field(default_factory=list)
+    knee: Optional[GoodputLevel] = None  # 满足率首次低于目标的并发等级，None 表示测到最高等级仍未出现
+    best: Optional[GoodputLevel] = None  # 拐点之前有效吞吐最高的等级，即可持续有效吞吐
+
+    @property
+    def sustainable_goodput(self) -> float:
+        return self.best.goodput if self.best else 0
+
+def parse_levels(value: str) -> List[int]:
+    """解析并发等级列表，例如 "1,2,4,8,16" """
+    try:
+        levels = sorted({int(part) for part in value.split(',') if part.strip()})
+    except ValueError:
+        levels = []
+    if not levels or levels[0] <= 0:
+        raise ValueError(f"无效的并发等级列表：{value}")
+    return levels
+
+def meets_slo(result: Optional[TestResult], ttft_slo: float, tpot_slo: float) -> bool:
+    """
+    判断单个请求是否满足 SLO
+
+    只有完整结束的请求才可能满足；只输出一个 token 时没有 TPOT，只检查首 token 时间。
+    """
+    if result is None or result.status != 'ok' or result.first_token_time is None:
+        return False
+    if result.first_token_time > ttft_slo:
+        return False
+    return result.tpot is None or result.tpot <= tpot_slo
+
+class GoodputSweep:
+    """
+    SLO 有效吞吐（goodput）扫描
+
+    对每个服务商按并发等级从低到高依次测量：每个等级通过 ParallelAPITester
+    以固定并发闭环发送 并发数 × rounds 个请求，统计同时满足首 token 时间和
+    TPOT SLO 的请求比例和速率。满足率首次低于目标的等级即为拐点，拐点之前
+    有效吞吐最高的等级为可持续有效吞吐，服务商按它排名，而不是按单请求速度。
+    服务商逐个测量，互不争用客户端的线程和连接；每个服务商测量前先按最高并发等级预热连接。
+    """
+
+    def __init__(self, config: GoodputConfig = None):
+        self.config = config or GoodputConfig()
+
+    def test_providers(
+        self,
+        providers: List[BaseProvider],
+        messages: List[dict],
+        max_tokens: Optional[int] = None
+    ) -> List[GoodputResult]:
+        """
+        依次对每个提供商执行扫描
+
+        Args:
+            providers: 提供商实例列表
+            messages: 测试消息列表
+            max_tokens: 可选的输出 token 上限
+
+        Returns:
+            list: 按可持续有效吞吐从高到低排列的扫描结果
+        """
+        active_providers = [p for p in providers if p.is_available()]
+
+        if not active_providers:
+            print("没有可用的服务商")
+            return []
+
+        # SDK 内部重试会把 429 的退避时间计入首 token 时间，被限流的请求直接计为不满足 SLO；
+        # 使用关闭重试的副本，不改变调用方的服务商实例
+        active_providers = [provider.without_retries() for provider in active_providers]
+
+        results = [
+            self._sweep(provider, messages, max_tokens)
+            for provider in sorted(active_providers, key=lambda x: x.name)
+        ]
+        return sorted(results, key=lambda r: r.sustainable_goodput, reverse=True)
+
+    def _sweep(self, provider: BaseProvider, messages: List[dict], max_tokens: Optional[int]) -> GoodputResult:
+        """按并发等级从低到高测量单个服务商"""
+        config = self.config
+        result = GoodputResult(provider=provider.name)
+        self._warmup(provider, max(config.levels))
+        for concurrency in config.levels:
+            print(f"\n服务商 {provider.name} 开始测量：并发 {concurrency}，共 {concurrency * config.rounds} 个请求")
+            level = self._run_level(provider, messages, concurrency, max_tokens)
+            result.levels.append(level)
+            print(
+                f"服务商 {provider.name} 并发 {concurrency}：SLO 满足率 {level.attainment:.1%}，"
+                f"有效吞吐 {level.goodput:.2f} 请求/s（{level.goodput_tokens:.1f} tokens/s）"
+            )
+
+            if level.attainment < config.attainment:
+                result.knee = level
+                print(f"服务商 {provider.name} 在并发 {concurrency} 下 SLO 满足率低于 {config.attainment:.0%}，视为拐点")
+                if config.stop_at_knee:
+                    break
+            elif result.knee is None and (result.best is None or level.goodput > result.best.goodput):
+                result.best = level
+
+        if result.best:
+            print(
+                f"\n服务商 {provider.name} 可持续有效吞吐：{result.best.goodput:.2f} 请求/s"
+                f"（并发 {result.best.concurrency}）"
+            )
+        else:
+            print(f"\n服务商 {provider.name} 在最低并发下也未达到 SLO 满足率目标")
+        return result
+
+    def _warmup(self, provider: BaseProvider, connections: int):
+        """
+        在计时前创建客户端并建立最高并发等级所需的连接
+
+        否则第一个等级会计入客户端创建、TCP/TLS 握手以及首次导入 openai 的时间，
+        使其有效吞吐偏低，进而影响最佳等级、拐点和排名。
+        """
+        try:
+            provider.client
+            elapsed = provider.warmup(connections)
+            if elapsed is not None:
+                print(f"服务商 {provider.name} 已建立 {connections} 个连接，用时 {elapsed:.2f} 秒")
+            else:
+                print(f"服务商 {provider.name} 预热连接失败，第一个并发等级将包含建立连接的时间")
+        except Exception as e:
+            print(f"预热服务商 {provider.name} 时发生错误：{e}")
+
+    def _run_level(
+        self,
+        provider: BaseProvider,
+        messages: List[dict],
+        concurrency: int,
+        max_tokens: Optional[int]
+    ) -> GoodputLevel:
+        """以固定并发闭环发送 concurrency × rounds 个请求并汇总"""
+        config = self.config
+        tester = ParallelAPITester(ParallelTestConfig(
+            max_workers=concurrency,
+            timeout=config.timeout,
+            metrics_only=True,
+            raw_sse=config.raw_sse,
+            stall_timeout=config.stall_timeout,
+            verbose=False
+        ))
+        sent = concurrency * config.rounds
+        start = time.perf_counter()
+        results = tester.test_providers([provider] * sent, messages, max_tokens)
+        elapsed = time.perf_counter() - start
+
+        completed = [r for r in results if r.status == 'ok']
+        good = [r for r in completed if meets_slo(r, config.ttft_slo, config.tpot_slo)]
+        ttfts = [r.first_token_time for r in completed if r.first_token_time is not None]
+        tpots = [r.tpot for r in completed if r.tpot is not None]
+        return GoodputLevel(
+            concurrency=concurrency,
+            elapsed=elapsed,
+            sent=sent,
+            completed=len(completed),
+            good=len(good),
+            good_tokens=sum(r.reasoning_tokens + r.content_tokens for r in good),
+            ttft_p50=percentile(ttfts, 50),
+            ttft_p90=percentile(ttfts, 90),
+            tpot_p50=percentile(tpots, 50),
+            tpot_p90=percentile(tpots, 90),
+            throughput=sum(r.reasoning_tokens + r.content_tokens for r in results) / elapsed if elapsed > 0 else 0
+        )
@@ -0,0 +1,112 @@
+import asyncio
+import threading
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+@dataclass
+class HTTPPoolConfig:
+    """共享 HTTP 连接池配置"""
+    max_connections: int = 100            # 所有服务商合计的最大连接数
+    max_keepalive_connections: int = 50   # 保持空闲的最大连接数
+    keepalive_expiry: float = 120.0       # 空闲连接保持时间（秒）
+    http2: bool = False                   # 启用 HTTP/2（需要安装 h2）
+
+_config = HTTPPoolConfig()
+_client: Optional['httpx.Client'] = None
+_async_clients: Dict[asyncio.AbstractEventLoop, 'httpx.AsyncClient'] = {}
+_lock = threading.Lock()
+# 当前线程或协程任务中新建的连接数，由 track_connections() 开始记录
+_opened_connections: ContextVar[Optional[list]] = ContextVar('opened_connections', default=None)
+
+def track_connections() -> list:
+    """
+    开始记录当前线程或协程任务中通过共享客户端新建的连接
+
+    Returns:
+        list: 每新建一个连接追加一项；请求结束后为空说明复用了连接池中已有的连接
+    """
+    opened = []
+    _opened_connections.set(opened)
+    return opened
+
+def _trace(event: str, info: dict):
+    """httpcore 的 trace 回调：建立 TCP/Unix 连接时记录"""
+    if event.startswith('connection.connect_') and event.endswith('.started'):
+        opened = _opened_connections.get()
+        if opened is not None:
+            opened.append(event)
+
+async def _async_trace(event: str, info: dict):
+    _trace(event, info)
+
+def _on_request(request):
+    request.extensions['trace'] = _trace
+
+async def _on_async_request(request):
+    request.extensions['trace'] = _async_trace
+
+def _http2_enabled() -> bool:
+    """检查 HTTP/2 是否可用，不可用时回退到 HTTP/1.1"""
+    if not _config.http2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        print("警告：未安装 h2，HTTP/2 不可用，回退到 HTTP/1.1（pip install 'httpx[http2]'）")
+        _config.http2 = False
+        return False
+    return True
+
+def _client_kwargs() -> dict:
+    import httpx
+    return dict(
+        limits=httpx.Limits(
+            max_connections=_config.max_connections,
+            max_keepalive_connections=_config.max_keepalive_connections,
+            keepalive_expiry=_config.keepalive_expiry
+        ),
+        http2=_http2_enabled(),
+        follow_redirects=True
+    )
+
+def configure(config: HTTPPoolConfig):
+    """
+    设置连接池配置
+
+    应在创建任何服务商客户端之前调用；已创建的共享客户端会被关闭并在下次使用时重建。
+    """
+    global _config, _client
+    with _lock:
+        _config = config
+        if _client is not None:
+            _client.close()
+            _client = None
+
+def get_http_client() -> 'httpx.Client':
+    """获取所有服务商共享的同步 HTTP 客户端（线程安全）"""
+    import httpx
+    global _client
+    with _lock:
+        if _client is None:
+            _client = httpx.Client(**_client_kwargs(), event_hooks={'request': [_on_request]})
+        return _client
+
+def get_async_http_client() -> 'httpx.AsyncClient':
+    """获取当前事件循环共享的异步 HTTP 客户端"""
+    import httpx
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(**_client_kwargs(), event_hooks={'request': [_on_async_request]})
+            _async_clients[loop] = client
+        return client
+
+async def close_async_http_client():
+    """关闭当前事件循环的共享异步客户端（在事件循环结束前调用）"""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.pop(loop, None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,278 @@
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Tuple
+from dataclasses import dataclass, field
+from tester import APITester, TestResult, percentile
+from providers import BaseProvider
+import profiling
+
+@dataclass
+class LoadStage:
+    """负载阶段：在 duration 秒内以 rps 的目标到达率发送请求"""
+    rps: float
+    duration: float
+
+@dataclass
+class LoadTestConfig:
+    """开环负载测试配置"""
+    stages: List[LoadStage]
+    arrival: str = 'poisson'        # 到达过程：poisson(泊松) 或 constant(匀速)
+    max_in_flight: int = 32         # 每个服务商最大在途请求数，超出的到达记为丢弃
+    seed: Optional[int] = None      # 随机种子，便于复现到达序列
+    raw_sse: bool = False           # 直接解析 SSE 字节流，跳过 SDK 对象构造
+    timeout: Optional[float] = None        # 单个请求的截止时间（秒）
+    stall_timeout: Optional[float] = None  # 开始输出后两个分块之间允许的最长间隔（秒）
+
+@dataclass
+class StageResult:
+    """单个服务商在单个负载阶段的统计结果"""
+    provider: str
+    stage: int
+    target_rps: float
+    duration: float
+    sent: int
+    completed: int
+    errors: int
+    dropped: int
+    peak_in_flight: int
+    ttft_mean: Optional[float]
+    ttft_p50: Optional[float]
+    ttft_p90: Optional[float]
+    tokens_per_second: Optional[float]   # 单请求平均输出速度
+    throughput: float                    # 阶段内总输出 tokens / 阶段时长
+
+    @property
+    def achieved_rps(self) -> float:
+        return self.sent / self.duration if self.duration > 0 else 0
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.sent if self.sent else 0
+
+class _InFlightCounter:
+    """服务商级别的在途请求计数器"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.in_flight >= self.limit:
+                return False
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def reset_peak(self) -> None:
+        with self._lock:
+            self.peak = self.in_flight
+
+@dataclass
+class _StageSamples:
+    """单个 (服务商, 阶段) 收集到的原始样本"""
+    sent: int = 0
+    dropped: int = 0
+    errors: int = 0
+    peak_in_flight: int = 0
+    results: List[TestResult] = field(default_factory=list)
+
+class LoadAPITester:
+    """开环负载测试器：按目标到达率发送请求，不等待前一个请求完成"""
+
+    def __init__(self, config: LoadTestConfig):
+        self.config = config
+        self._lock = profiling.lock('LoadAPITester._lock')  # 保护样本收集；--instrument 时记录等待时间
+
+    def test_providers(self, providers: List[BaseProvider], messages: List[dict]) -> List[StageResult]:
+        """
+        对多个提供商同时施加开环负载
+
+        Args:
+            providers: 提供商实例列表
+            messages: 测试消息列表
+
+        Returns:
+            list: 每个 (服务商, 阶段) 的统计结果
+        """
+        active_providers = [p for p in providers if p.is_available()]
+
+        if not active_providers:
+            print("没有可用的服务商")
+            return []
+
+        samples: Dict[Tuple[str, int], _StageSamples] = {
+            (provider.name, index): _StageSamples()
+            for provider in active_providers
+            for index in range(len(self.config.stages))
+        }
+        counters = {
+            provider.name: _InFlightCounter(self.config.max_in_flight)
+            for provider in active_providers
+        }
+
+        pool_size = self.config.max_in_flight * len(active_providers)
+        with ThreadPoolExecutor(max_workers=pool_size) as executor:
+            dispatchers = [
+                threading.Thread(
+                    target=self._dispatch,
+                    args=(provider, messages, executor, counters[provider.name], samples, seed_offset),
+                    daemon=True
+                )
+                for seed_offset, provider in enumerate(active_providers)
+            ]
+            for dispatcher in dispatchers:
+                dispatcher.start()
+            for dispatcher in dispatchers:
+                dispatcher.join()
+            # 退出 with 时等待所有在途请求结束
+
+        return [
+            self._summarize(provider.name, index, samples[(provider.name, index)])
+            for provider in sorted(active_providers, key=lambda x: x.name)
+            for index in range(len(self.config.stages))
+        ]
+
+    def _intervals(self, rng: random.Random, rps: float):
+        """生成到达间隔序列"""
+        while True:
+            if self.config.arrival == 'constant':
+                yield 1.0 / rps
+            else:
+                yield rng.expovariate(rps)
+
+    def _dispatch(
+        self,
+        provider: BaseProvider,
+        messages: List[dict],
+        executor: ThreadPoolExecutor,
+        counter: _InFlightCounter,
+        samples: Dict[Tuple[str, int], _StageSamples],
+        seed_offset: int
+    ):
+        """按阶段为单个服务商生成到达并提交请求（在独立线程中运行）"""
+        seed = None if self.config.seed is None else self.config.seed + seed_offset
+        rng = random.Random(seed)
+        origin = time.perf_counter()
+        stage_start = 0.0
+
+        for index, stage in enumerate(self.config.stages):
+            stage_end = stage_start + stage.duration
+            bucket = samples[(provider.name, index)]
+            counter.reset_peak()
+
+            print(f"\n服务商 {provider.name} 进入第 {index + 1} 阶段：目标 {stage.rps} 请求/秒，持续 {stage.duration} 秒")
+
+            if stage.rps > 0:
+                intervals = self._intervals(rng, stage.rps)
+                # 匀速到达从阶段起点开始，泊松到达从第一个间隔开始
+                arrival = stage_start if self.config.arrival == 'constant' else stage_start + next(intervals)
+                # 容差避免累加间隔的浮点误差在阶段末尾多出一个到达（例如 20 rps × 0.5 秒发出 11 个）
+                while arrival < stage_end - 1e-9:
+                    delay = origin + arrival - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                    if counter.try_acquire():
+                        with self._lock:
+                            bucket.sent += 1
+                        executor.submit(self._run_request, provider, messages, counter, bucket)
+                    else:
+                        with self._lock:
+                            bucket.dropped += 1
+
+                    arrival += next(intervals)
+
+            # 等待到阶段结束再切换
+            delay = origin + stage_end - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            with self._lock:
+                bucket.peak_in_flight = counter.peak
+            stage_start = stage_end
+
+    def _run_request(
+        self,
+        provider: BaseProvider,
+        messages: List[dict],
+        counter: _InFlightCounter,
+        bucket: _StageSamples
+    ):
+        """发送单个请求并记录结果（在线程池中运行）"""
+        result = None
+        try:
+            # 负载测试中请求量大，只保留指标以保证内存恒定
+            tester = APITester(
+                buffer_output=True,
+                verbose=False,
+                metrics_only=True,
+                raw_sse=self.config.raw_sse,
+                timeout=self.config.timeout,
+                stall_timeout=self.config.stall_timeout
+            )
+            result = tester.test_provider(provider, messages)
+        finally:
+            counter.release()
+
+        # 被截止时间中断的请求计为错误
+        with self._lock:
+            if result and result.status == 'ok':
+                bucket.results.append(result)
+            else:
+                bucket.errors += 1
+
+    def _summarize(self, provider_name: str, index: int, bucket: _StageSamples) -> StageResult:
+        """汇总单个阶段的样本"""
+        stage = self.config.stages[index]
+        ttfts = [r.first_token_time for r in bucket.results if r.first_token_time is not None]
+        speeds = [
+            (r.reasoning_tokens + r.content_tokens) / r.total_time
+            for r in bucket.results if r.total_time > 0
+        ]
+        output_tokens = sum(r.reasoning_tokens + r.content_tokens for r in bucket.results)
+
+        return StageResult(
+            provider=provider_name,
+            stage=index + 1,
+            target_rps=stage.rps,
+            duration=stage.duration,
+            sent=bucket.sent,
+            completed=len(bucket.results),
+            errors=bucket.errors,
+            dropped=bucket.dropped,
+            peak_in_flight=bucket.peak_in_flight,
+            ttft_mean=sum(ttfts) / len(ttfts) if ttfts else None,
+            ttft_p50=percentile(ttfts, 50),
+            ttft_p90=percentile(ttfts, 90),
+            tokens_per_second=sum(speeds) / len(speeds) if speeds else None,
+            throughput=output_tokens / stage.duration if stage.duration > 0 else 0
+        )
+
+def parse_stages(spec: str) -> List[LoadStage]:
+    """
+    解析阶段描述，例如 "1:30,2:30,5:60" 表示 1 rps 持续 30 秒，随后 2 rps 持续 30 秒……
+
+    Raises:
+        ValueError: 描述格式不正确
+    """
+    stages = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            rps, duration = part.split(':')
+            stages.append(LoadStage(rps=float(rps), duration=float(duration)))
+        except ValueError:
+            raise ValueError(f"无法解析负载阶段 '{part}'，格式应为 rps:秒数")
+    if not stages:
+        raise ValueError("至少需要一个负载阶段")
+    return stages
@@ -0,0 +1,358 @@
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from providers import BaseProvider
+
+@dataclass
+class MockServerConfig:
+    """本地模拟服务端配置"""
+    ttft: float = 0.5                   # 首 token 延迟（秒）
+    prefill_tokens_per_second: float = 0.0  # 预填充速度，大于 0 时首 token 延迟随输入长度增加
+    tokens_per_second: float = 50.0     # 生成速度
+    reasoning_tokens: int = 200         # reasoning_content 阶段的 token 数
+    content_tokens: int = 100           # content 阶段的 token 数
+    tokens_per_chunk: int = 1           # 每个分块包含的 token 数
+    jitter: float = 0.0                 # 分块间隔的随机抖动（相对标准差，例如 0.2 表示 20%）
+    stall_probability: float = 0.0      # 每个分块之前发生停顿的概率
+    stall_duration: float = 2.0         # 停顿时长（秒）
+    error_rate: float = 0.0             # 直接返回错误的请求比例
+    error_status: int = 500             # 注入错误时的 HTTP 状态码
+    retry_after: Optional[float] = None # 注入错误时附带的 Retry-After 头（秒）
+    max_concurrent_streams: Optional[int] = None  # 同时进行的流数上限，超出时返回 429（模拟并发配额）
+    include_usage: bool = True          # 是否在流末尾发送 usage 分块
+    usage_details: bool = True          # usage 中是否包含 completion_tokens_details（reasoning tokens）
+    prefix_cache: bool = False          # 模拟前缀缓存：与之前请求相同的前缀按 64 token 的块命中，命中部分不计入预填充时间，usage 中报告命中和未命中 tokens
+    seed: Optional[int] = None
+
+class _MockHandler(BaseHTTPRequestHandler):
+    """OpenAI 兼容的 /chat/completions 流式接口"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'mock-r1', 'object': 'model'}]})
+        else:
+            self._send_json(404, {'error': {'message': 'not found'}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'not found'}})
+            return
+
+        config = self.server.config
+        headers = {}
+        if config.retry_after is not None:
+            headers['Retry-After'] = f"{config.retry_after:g}"
+        if self.server.random() < config.error_rate:
+            self._send_json(config.error_status, {'error': {'message': 'injected error', 'code': config.error_status}}, headers)
+            return
+        if not self.server.acquire_stream():
+            self._send_json(429, {'error': {'message': 'too many concurrent requests', 'code': 429}}, headers)
+            return
+
+        try:
+            model = body.get('model', 'mock-r1')
+            # 按约 4 字符/token 估算输入长度；max_tokens 同时限制推理和正文
+            prompt = ''.join(str(m.get('content', '')) for m in body.get('messages', []))
+            self.prompt_tokens = max(1, len(prompt) // 4)
+            self.cache_hit_tokens = min(self.server.cached_prefix(prompt), self.prompt_tokens) if config.prefix_cache else 0
+            self.reasoning_tokens = config.reasoning_tokens
+            self.content_tokens = config.content_tokens
+            max_tokens = body.get('max_tokens')
+            if max_tokens is not None:
+                self.reasoning_tokens = min(self.reasoning_tokens, max_tokens)
+                self.content_tokens = min(self.content_tokens, max_tokens - self.reasoning_tokens)
+            if body.get('stream'):
+                include_usage = config.include_usage and (body.get('stream_options') or {}).get('include_usage', False)
+                self._stream(model, include_usage)
+            else:
+                self._send_json(200, self._completion(model))
+        finally:
+            self.server.release_stream()
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _usage(self):
+        completion = self.reasoning_tokens + self.content_tokens
+        usage = {
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': completion,
+            'total_tokens': self.prompt_tokens + completion,
+        }
+        if self.server.config.usage_details:
+            usage['completion_tokens_details'] = {'reasoning_tokens': self.reasoning_tokens}
+        if self.server.config.prefix_cache:
+            # DeepSeek 的字段名
+            usage['prompt_cache_hit_tokens'] = self.cache_hit_tokens
+            usage['prompt_cache_miss_tokens'] = self.prompt_tokens - self.cache_hit_tokens
+        return usage
+
+    def _completion(self, model):
+        config = self.server.config
+        return {
+            'id': f"chatcmpl-{uuid.uuid4().hex}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {
+                    'role': 'assistant',
+                    'reasoning_content': '思' * self.reasoning_tokens,
+                    'content': '答' * self.content_tokens,
+                },
+                'finish_reason': 'stop',
+            }],
+            'usage': self._usage(),
+        }
+
+    def _write_event(self, payload):
+        """以 chunked 编码写出一个 SSE 事件"""
+        data = b'data: ' + (payload if isinstance(payload, bytes) else json.dumps(payload, ensure_ascii=False).encode('utf-8')) + b'\n\n'
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+    def _stream(self, model, include_usage):
+        config = self.server.config
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        def chunk(delta, finish_reason=None):
+            return {
+                'id': chunk_id,
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+            }
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        try:
+            start = time.perf_counter()
+            self._write_event(chunk({'role': 'assistant', 'content': '', 'reasoning_content': ''}))
+
+            interval = config.tokens_per_chunk / config.tokens_per_second if config.tokens_per_second > 0 else 0
+            due = start + config.ttft
+            if config.prefill_tokens_per_second > 0:
+                due += (self.prompt_tokens - self.cache_hit_tokens) / config.prefill_tokens_per_second
+            phases = (('reasoning_content', '思', self.reasoning_tokens), ('content', '答', self.content_tokens))
+
+            for field, char, tokens in phases:
+                for sent in range(0, tokens, config.tokens_per_chunk):
+                    if config.stall_probability and self.server.random() < config.stall_probability:
+                        due += config.stall_duration
+                    delay = due - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    count = min(config.tokens_per_chunk, tokens - sent)
+                    self._write_event(chunk({field: char * count}))
+
+                    step = interval
+                    if config.jitter:
+                        step = max(0.0, self.server.gauss(interval, interval * config.jitter))
+                    due += step
+
+            self._write_event(chunk({}, finish_reason='stop'))
+            if include_usage:
+                usage_chunk = chunk({})
+                usage_chunk['choices'] = []
+                usage_chunk['usage'] = self._usage()
+                self._write_event(usage_chunk)
+            self._write_event(b'[DONE]')
+            self.wfile.write(b'0\r\n\r\n')
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前关闭连接（例如超时取消）
+            self.close_connection = True
+
+class MockSSEServer(ThreadingHTTPServer):
+    """
+    本地 OpenAI 兼容流式服务端
+
+    用于在不产生费用、不受服务商波动影响的情况下测试和评估测试框架本身。
+    """
+
+    daemon_threads = True
+    CACHE_BLOCK_TOKENS = 64
+
+    def __init__(self, config: MockServerConfig = None, host: str = '127.0.0.1', port: int = 0):
+        super().__init__((host, port), _MockHandler)
+        self.config = config or MockServerConfig()
+        self._rng = random.Random(self.config.seed)
+        self._rng_lock = threading.Lock()
+        self._active_streams = 0
+        self._prefix_blocks = set()
+        self._thread = None
+
+    def random(self) -> float:
+        with self._rng_lock:
+            return self._rng.random()
+
+    def gauss(self, mu: float, sigma: float) -> float:
+        with self._rng_lock:
+            return self._rng.gauss(mu, sigma)
+
+    def cached_prefix(self, prompt: str) -> int:
+        """返回提示词开头已缓存的 token 数（按 4 字符/token、64 token 一块计），并缓存本次请求的全部前缀块"""
+        block = self.CACHE_BLOCK_TOKENS * 4
+        digest = hashlib.sha1()
+        keys = []
+        for start in range(0, len(prompt) - block + 1, block):
+            digest.update(prompt[start:start + block].encode('utf-8'))
+            keys.append(digest.digest())
+        with self._rng_lock:
+            hits = 0
+            for key in keys:
+                if key not in self._prefix_blocks:
+                    break
+                hits += 1
+            self._prefix_blocks.update(keys)
+        return hits * self.CACHE_BLOCK_TOKENS
+
+    def acquire_stream(self) -> bool:
+        """占用一个并发名额，超出 max_concurrent_streams 时返回 False"""
+        with self._rng_lock:
+            limit = self.config.max_concurrent_streams
+            if limit is not None and self._active_streams >= limit:
+                return False
+            self._active_streams += 1
+            return True
+
+    def release_stream(self):
+        with self._rng_lock:
+            self._active_streams -= 1
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> 'MockSSEServer':
+        """在后台线程中启动"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务并释放端口"""
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+class MockProvider(BaseProvider):
+    """指向本地模拟服务端的服务商"""
+
+    def __init__(self, base_url: str, name: str = "Mock"):
+        self._base_url = base_url
+        self._name = name
+        super().__init__()
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def api_key(self) -> str:
+        return "mock"
+
+    @property
+    def base_url(self) -> str:
+        return self._base_url
+
+    @property
+    def model(self) -> str:
+        return "mock-r1"
+
+def parse_args():
+    """解析命令行参数"""
+    defaults = MockServerConfig()
+    parser = argparse.ArgumentParser(description='本地 OpenAI 兼容流式模拟服务端')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000, help='监听端口，0 表示自动分配（默认：8000）')
+    parser.add_argument('--ttft', type=float, default=defaults.ttft, help='首 token 延迟（秒）')
+    parser.add_argument('--prefill-tps', type=float, default=defaults.prefill_tokens_per_second, help='预填充速度（tokens/s），0 表示不随输入长度变化')
+    parser.add_argument('--tps', type=float, default=defaults.tokens_per_second, help='生成速度（tokens/s）')
+    parser.add_argument('--reasoning-tokens', type=int, default=defaults.reasoning_tokens)
+    parser.add_argument('--content-tokens', type=int, default=defaults.content_tokens)
+    parser.add_argument('--tokens-per-chunk', type=int, default=defaults.tokens_per_chunk)
+    parser.add_argument('--jitter', type=float, default=defaults.jitter, help='分块间隔的相对抖动')
+    parser.add_argument('--stall-probability', type=float, default=defaults.stall_probability)
+    parser.add_argument('--stall-duration', type=float, default=defaults.stall_duration)
+    parser.add_argument('--error-rate', type=float, default=defaults.error_rate)
+    parser.add_argument('--error-status', type=int, default=defaults.error_status)
+    parser.add_argument('--retry-after', type=float, default=None)
+    parser.add_argument('--max-concurrent-streams', type=int, default=None, help='并发流上限，超出返回 429')
+    parser.add_argument('--no-usage', action='store_true', help='不发送末尾的 usage 分块')
+    parser.add_argument('--no-usage-details', action='store_true', help='usage 中不包含 completion_tokens_details')
+    parser.add_argument('--prefix-cache', action='store_true', help='模拟前缀缓存，usage 中报告 prompt_cache_hit_tokens')
+    parser.add_argument('--seed', type=int, default=None)
+    return parser.parse_args()
+
+def main():
+    """命令行入口"""
+    args = parse_args()
+    config = MockServerConfig(
+        ttft=args.ttft,
+        tokens_per_second=args.tps,
+        prefill_tokens_per_second=args.prefill_tps,
+        reasoning_tokens=args.reasoning_tokens,
+        content_tokens=args.content_tokens,
+        tokens_per_chunk=args.tokens_per_chunk,
+        jitter=args.jitter,
+        stall_probability=args.stall_probability,
+        stall_duration=args.stall_duration,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        max_concurrent_streams=args.max_concurrent_streams,
+        include_usage=not args.no_usage,
+        usage_details=not args.no_usage_details,
+        prefix_cache=args.prefix_cache,
+        seed=args.seed
+    )
+    server = MockSSEServer(config, args.host, args.port)
+    print(f"模拟服务端已启动：{server.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
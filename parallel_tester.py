@@ -1,31 +1,45 @@
 import time
-import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Optional
+from typing import Callable, List, Optional
 from dataclasses import dataclass
-from tester import APITester
+from tester import APITester, TestResult
 from providers import BaseProvider
+import profiling
 
 @dataclass
 class ParallelTestConfig:
     """并行测试配置"""
     max_workers: int = 3  # 最大并发数
-    timeout: int = 300    # 单个测试超时时间（秒）
+    timeout: int = 300    # 单个请求的截止时间（秒），超时后关闭流并返回部分结果
+    metrics_only: bool = False      # 仅保留计数和字符长度，不保存生成文本
+    sink_dir: Optional[str] = None  # 生成文本的落盘目录（每个测试一个文件）
+    raw_sse: bool = False           # 直接解析 SSE 字节流，跳过 SDK 对象构造
+    run_timeout: Optional[float] = None    # 整轮测试的截止时间（秒）
+    stall_timeout: Optional[float] = None  # 开始输出后两个分块之间允许的最长间隔（秒）
+    verbose: bool = True                   # 打印每个测试的进度和结果；SLO 扫描等批量请求时关闭
 
 class ParallelAPITester:
     """并行API测试器"""
     
     def __init__(self, config: ParallelTestConfig = None):
         self.config = config or ParallelTestConfig()
-        self._lock = threading.Lock()  # 用于线程安全的打印
+        self._lock = profiling.lock('ParallelAPITester._lock')  # 用于线程安全的打印；--instrument 时记录等待时间
     
-    def test_providers(self, providers: List[BaseProvider], messages: List[dict]):
+    def test_providers(
+        self,
+        providers: List[BaseProvider],
+        messages: List[dict],
+        max_tokens: Optional[int] = None,
+        on_result: Optional[Callable[[BaseProvider, Optional[TestResult]], None]] = None
+    ):
         """
         并行测试多个提供商
         
         Args:
             providers: 提供商实例列表
             messages: 测试消息列表
+            max_tokens: 可选的输出 token 上限
+            on_result: 可选回调，每个测试完成时在调用线程中以 (服务商, 结果) 调用，失败时结果为 None
         
         Returns:
             list: 测试结果列表
@@ -37,39 +51,65 @@ class ParallelAPITester:
             print("没有可用的服务商")
             return results
         
+        # 截止时间由每个测试器在流内部执行（关闭连接并返回部分结果），
+        # 因此工作线程总会按时结束，这里只需等待任务完成
+        deadline_at = time.perf_counter() + self.config.run_timeout if self.config.run_timeout else None
+        
         with ThreadPoolExecutor(max_workers=min(self.config.max_workers, len(active_providers))) as executor:
             # 提交所有测试任务
             future_to_provider = {
-                executor.submit(self._test_single_provider, provider, messages): provider
+                executor.submit(self._test_single_provider, provider, messages, deadline_at, max_tokens): provider
                 for provider in active_providers
             }
             
             # 收集结果
             for future in as_completed(future_to_provider):
                 provider = future_to_provider[future]
+                result = None
                 try:
-                    result = future.result(timeout=self.config.timeout)
+                    result = future.result()
                     if result:
                         results.append(result)
                 except Exception as e:
                     with self._lock:
                         print(f"\n服务商 {provider.name} 测试失败: {str(e)}")
+                if on_result:
+                    on_result(provider, result)
         
         return sorted(results, key=lambda x: x.provider)  # 按提供商名称排序
     
-    def _test_single_provider(self, provider: BaseProvider, messages: List[dict]):
+    def _test_single_provider(
+        self,
+        provider: BaseProvider,
+        messages: List[dict],
+        deadline_at: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ):
         """
         测试单个提供商（在独立线程中运行）
         """
-        with self._lock:
-            print(f"\n准备测试服务商：{provider.name}")
+        if self.config.verbose:
+            with self._lock:
+                print(f"\n准备测试服务商：{provider.name}")
         
         # 使用带缓冲的测试器
-        tester = APITester(buffer_output=True)
-        result = tester.test_provider(provider, messages)
+        tester = APITester(
+            buffer_output=True,
+            verbose=self.config.verbose,
+            metrics_only=self.config.metrics_only,
+            sink_dir=self.config.sink_dir,
+            raw_sse=self.config.raw_sse,
+            timeout=self.config.timeout,
+            stall_timeout=self.config.stall_timeout
+        )
+        result = tester.test_provider(provider, messages, deadline_at, max_tokens)
         
+        if not self.config.verbose:
+            return result
         with self._lock:
-            if result:
+            if result and result.status != 'ok':
+                print(f"\n服务商 {provider.name} 测试被中断（{result.status}），已保留部分结果")
+            elif result:
                 print(f"\n完成测试服务商：{provider.name}")
             else:
                 print(f"\n服务商 {provider.name} 测试失败")
@@ -0,0 +1,365 @@
+"""
+Self-instrumentation of the test harness
+
+Separates the harness's own overhead from provider latency. While a
+HarnessProfiler is active:
+
+- every APITester times how long it spends handling each chunk, the CPU
+  time spent inside the stream iterator (SDK or SSE parsing), and how long
+  chunk handling was runnable but not running (GIL or lock waits); in async
+  runs the event loop lag is reported instead. The numbers are attached to
+  each TestResult as the harness_* fields.
+- locks created through lock() record how long threads waited for them.
+- tracemalloc tracks allocations for the run (optional).
+- cProfile profiles every thread of the run (optional, much slower).
+
+Nothing is measured unless a HarnessProfiler is started (--instrument,
+--tracemalloc or --profile); otherwise APITester pays one None check per chunk.
+"""
+import asyncio
+import threading
+import time
+from typing import Dict, List, Optional
+
+_active: Optional['HarnessProfiler'] = None
+
+def active() -> Optional['HarnessProfiler']:
+    """The profiler of the current run, or None"""
+    return _active
+
+def chunk_timer() -> Optional['ChunkTimer']:
+    """A ChunkTimer for a new test if chunk instrumentation is on, else None"""
+    if _active is None or not _active.instrument:
+        return None
+    return ChunkTimer(_active.loop_monitor)
+
+def lock(name: str):
+    """A threading.Lock, recording wait times under name if instrumentation is on"""
+    if _active is None or not _active.instrument:
+        return threading.Lock()
+    return _active.lock(name)
+
+def start_loop_monitor() -> Optional['LoopLagMonitor']:
+    """Start measuring event loop lag on the running loop if instrumentation is on"""
+    if _active is None or not _active.instrument:
+        return None
+    monitor = LoopLagMonitor()
+    monitor.start()
+    _active.loop_monitor = monitor
+    return monitor
+
+def stop_loop_monitor(monitor: Optional['LoopLagMonitor']):
+    """Stop a monitor returned by start_loop_monitor and keep its totals for the summary"""
+    if monitor is None:
+        return
+    monitor.stop()
+    if _active is not None:
+        _active.loop_lag.append(monitor)
+        if _active.loop_monitor is monitor:
+            _active.loop_monitor = None
+
+def _overhead_histogram():
+    from tester import LatencyHistogram
+
+    class OverheadHistogram(LatencyHistogram):
+        """LatencyHistogram scaled for per-chunk processing times"""
+        MIN_VALUE = 1e-7  # 0.1 µs
+        MAX_VALUE = 10.0
+
+    return OverheadHistogram()
+
+class ChunkTimer:
+    """Per-test record of the time the harness spent on each chunk"""
+
+    def __init__(self, loop_monitor: Optional['LoopLagMonitor'] = None):
+        self.histogram = _overhead_histogram()
+        self.total = 0.0       # Wall time handling chunks
+        self.cpu = 0.0         # Thread CPU time handling chunks
+        self.parse_cpu = None  # Thread CPU time inside the stream iterator (sync only)
+        self._loop_monitor = loop_monitor
+        self._lag_start = loop_monitor.total if loop_monitor else None
+        self._wall = 0.0
+        self._thread_cpu = 0.0
+
+    def start(self):
+        self._wall = time.perf_counter()
+        self._thread_cpu = time.thread_time()
+
+    def stop(self):
+        elapsed = time.perf_counter() - self._wall
+        self.total += elapsed
+        self.cpu += time.thread_time() - self._thread_cpu
+        self.histogram.add(elapsed)
+
+    def iterate(self, chunks):
+        """Wrap a synchronous chunk iterator, adding the CPU time spent producing each chunk to parse_cpu"""
+        self.parse_cpu = 0.0
+        iterator = iter(chunks)
+        while True:
+            cpu = time.thread_time()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.parse_cpu += time.thread_time() - cpu
+            yield chunk
+
+    def result_fields(self) -> Dict[str, Optional[float]]:
+        """The harness_* fields of TestResult"""
+        if self._loop_monitor is not None:
+            blocked = self._loop_monitor.total - self._lag_start
+        else:
+            blocked = max(0.0, self.total - self.cpu)
+        return {
+            'harness_time': self.total,
+            'harness_chunk_p99': self.histogram.percentile(99),
+            'harness_parse_cpu': self.parse_cpu,
+            'harness_blocked': blocked,
+        }
+
+class InstrumentedLock:
+    """threading.Lock that records how long acquirers waited"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._lock.acquire(False):
+            waited = 0.0
+        else:
+            if not blocking:
+                return False
+            start = time.perf_counter()
+            if not self._lock.acquire(True, timeout):
+                return False
+            waited = time.perf_counter() - start
+        with self._stats_lock:
+            self.acquisitions += 1
+            if waited:
+                self.contended += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+        return True
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop runs a periodic callback
+
+    Lag accumulates whenever a coroutine (e.g. chunk processing) holds the
+    loop; total is the sum of lag over the monitor's lifetime.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = 0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            self.total += lag
+            self.max = max(self.max, lag)
+            self.samples += 1
+
+class HarnessProfiler:
+    """
+    Run-level instrumentation, active between start() and stop()
+
+    Args:
+        instrument: Time chunk handling, lock waits and event loop lag
+        allocations: Track allocations with tracemalloc
+        profile: Profile all threads with cProfile
+    """
+
+    def __init__(self, instrument: bool = True, allocations: bool = False, profile: bool = False):
+        self.instrument = instrument
+        self.allocations = allocations
+        self.profile = profile
+        self.locks: Dict[str, List[InstrumentedLock]] = {}
+        self.loop_monitor: Optional[LoopLagMonitor] = None
+        self.loop_lag: List[LoopLagMonitor] = []
+        self.allocation_peak = None
+        self.allocation_top = []
+        self._profiles = []
+        self._profiles_lock = threading.Lock()
+        self._stats = None
+
+    def lock(self, name: str) -> InstrumentedLock:
+        """An InstrumentedLock; locks created under the same name are summed in the report"""
+        instrumented = InstrumentedLock()
+        with self._profiles_lock:
+            self.locks.setdefault(name, []).append(instrumented)
+        return instrumented
+
+    def start(self):
+        global _active
+        _active = self
+        if self.allocations:
+            import tracemalloc
+            tracemalloc.start()
+        if self.profile:
+            # The main thread gets a profile now; every thread started later
+            # gets its own from the hook, which cProfile replaces on enable()
+            self._start_thread_profile()
+            threading.setprofile(self._thread_profile_hook)
+        return self
+
+    def stop(self):
+        global _active
+        if self.profile:
+            threading.setprofile(None)
+            import pstats
+            with self._profiles_lock:
+                for profile in self._profiles:
+                    profile.disable()
+                self._stats = pstats.Stats(*self._profiles) if self._profiles else None
+        if self.allocations:
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            self.allocation_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.allocation_top = snapshot.statistics('lineno')[:10]
+        _active = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _start_thread_profile(self):
+        import cProfile
+        profile = cProfile.Profile()
+        with self._profiles_lock:
+            self._profiles.append(profile)
+        profile.enable()
+
+    def _thread_profile_hook(self, frame, event, arg):
+        self._start_thread_profile()
+
+    def summary_rows(self) -> List[list]:
+        """Lock and event loop rows for the run summary"""
+        rows = []
+        for name, locks in sorted(self.locks.items()):
+            acquisitions = sum(l.acquisitions for l in locks)
+            contended = sum(l.contended for l in locks)
+            rows.append([
+                f"锁 {name}",
+                f"获取 {acquisitions} 次，争用 {contended} 次",
+                f"{sum(l.wait_total for l in locks) * 1000:.2f}",
+                f"{max((l.wait_max for l in locks), default=0) * 1000:.2f}",
+            ])
+        for index, monitor in enumerate(self.loop_lag):
+            rows.append([
+                "事件循环延迟" if len(self.loop_lag) == 1 else f"事件循环延迟 #{index + 1}",
+                f"采样 {monitor.samples} 次",
+                f"{monitor.total * 1000:.2f}",
+                f"{monitor.max * 1000:.2f}",
+            ])
+        return rows
+
+    def report(self, results, report_dir) -> Optional[str]:
+        """
+        Print the harness overhead summary and write the cProfile dump
+
+        Args:
+            results: Results of the run; TestResults carrying harness_* fields get per-provider rows
+            report_dir: Directory for the .prof file
+
+        Returns:
+            str: Path of the .prof file, or None without --profile
+        """
+        from datetime import datetime
+        from pathlib import Path
+        from tabulate import tabulate
+
+        grouped = {}
+        for result in results or []:
+            if getattr(result, 'harness_time', None) is not None:
+                grouped.setdefault(result.provider, []).append(result)
+
+        def mean(values):
+            values = [v for v in values if v is not None]
+            return sum(values) / len(values) if values else None
+
+        def ms(value, digits=2):
+            return f"{value * 1000:.{digits}f}" if value is not None else "-"
+
+        if grouped:
+            rows = []
+            for provider, provider_results in sorted(grouped.items()):
+                share = mean([r.harness_time / r.total_time for r in provider_results if r.total_time > 0])
+                rows.append([
+                    provider,
+                    len(provider_results),
+                    ms(mean([r.harness_time for r in provider_results])),
+                    ms(max(r.harness_chunk_p99 or 0 for r in provider_results), 3),
+                    ms(mean([r.harness_parse_cpu for r in provider_results])),
+                    ms(mean([r.harness_blocked for r in provider_results])),
+                    f"{share:.2%}" if share is not None else "-",
+                ])
+            print("\n测试框架自身开销（每个请求的平均值）：")
+            print(tabulate(
+                rows,
+                headers=['Provider', 'Samples', 'Harness (ms)', 'Chunk P99 (ms)', 'Parse CPU (ms)', 'Blocked (ms)', 'Share of Request'],
+                tablefmt='grid'
+            ))
+
+        rows = self.summary_rows()
+        if rows:
+            print("\n锁等待与事件循环延迟：")
+            print(tabulate(rows, headers=['Item', 'Count', 'Total (ms)', 'Max (ms)'], tablefmt='grid'))
+
+        if self.allocation_peak is not None:
+            print(f"\ntracemalloc：内存分配峰值 {self.allocation_peak / 1024 / 1024:.2f} MiB，当前占用最多的位置：")
+            for statistic in self.allocation_top:
+                print(f"  {statistic}")
+
+        if self._stats is None:
+            return None
+        report_dir = Path(report_dir)
+        report_dir.mkdir(parents=True, exist_ok=True)
+        path = report_dir / f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.prof"
+        print("\ncProfile（按累计时间排序的前 25 个函数）：")
+        print(self.dump_profile(path))
+        print(f"完整的 cProfile 数据已保存到：{path}（可用 python -m pstats 或 snakeviz 查看）")
+        return str(path)
+
+    def dump_profile(self, path) -> Optional[str]:
+        """Write the merged cProfile stats to path; returns the top functions by cumulative time"""
+        if self._stats is None:
+            return None
+        import io
+        self._stats.dump_stats(str(path))
+        out = io.StringIO()
+        self._stats.stream = out
+        self._stats.sort_stats('cumulative').print_stats(25)
+        return out.getvalue()
@@ -1,13 +1,39 @@
+import asyncio
+import copy
+import threading
+import time
 from abc import ABC, abstractmethod
-from openai import OpenAI
-from config import API_KEYS, BASE_URLS, MODELS, ENDPOINTS
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+from config import get_env_var, load_registry
+from http_pool import get_http_client, get_async_http_client
+from sse import RawChunkStream, AsyncRawChunkStream
 
 class BaseProvider(ABC):
-    """Base class for all API providers"""
+    """
+    Base class for all API providers
+    
+    Construction is cheap: the API key is read and the OpenAI client (and the
+    openai package itself) is loaded only when the provider is first used.
+    """
+    
+    key = None  # Short name used by --providers and the provider registry
     
     def __init__(self):
-        self.client = None
-        self.setup_client()
+        self._client = None
+        self._client_lock = threading.Lock()
+        self.async_client = None
+        self.max_retries = None  # SDK retry count; None keeps the SDK default
+    
+    @property
+    def client(self):
+        """OpenAI client, built on first use"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self.setup_client()
+        return self._client
     
     @property
     @abstractmethod
@@ -38,16 +64,64 @@ class BaseProvider(ABC):
         return bool(self.api_key)
     
     def setup_client(self):
-        """Initialize OpenAI client with provider configuration"""
+        """Initialize OpenAI client with provider configuration, on the shared connection pool"""
         if not self.is_available():
             return
         
-        self.client = OpenAI(
+        from openai import OpenAI
+        self._client = OpenAI(
             api_key=self.api_key,
-            base_url=self.base_url
+            base_url=self.base_url,
+            http_client=get_http_client(),
+            **self._client_options()
         )
+        # The SDK imports the chat resource on first access; do it here rather than inside a timed request
+        self._client.chat.completions
+    
+    def _client_options(self) -> dict:
+        """Client-level options overridden on this provider"""
+        return {} if self.max_retries is None else {"max_retries": self.max_retries}
+    
+    def set_max_retries(self, max_retries):
+        """
+        Override the SDK retry count
+        
+        The SDK retries 429 and 5xx responses inside the call, which hides rate
+        limiting and adds the backoff to the measured latency; 0 surfaces them.
+        """
+        self.max_retries = max_retries
+        if self._client is not None:
+            self._client = self._client.with_options(**self._client_options())
+        if self.async_client is not None:
+            self.async_client = self.async_client.with_options(**self._client_options())
     
-    def create_completion(self, messages, stream=True):
+    def without_retries(self) -> 'BaseProvider':
+        """
+        A copy of this provider with SDK retries disabled
+        
+        For modes that count 429/5xx themselves (see set_max_retries). The copy
+        shares the connection pool; the caller's provider keeps its retry count,
+        so later modes or library use in the same process are unaffected.
+        """
+        provider = copy.copy(self)
+        provider._client_lock = threading.Lock()
+        provider.max_retries = 0
+        if self._client is not None:
+            provider._client = self._client.with_options(max_retries=0)
+        if self.async_client is not None:
+            provider.async_client = self.async_client.with_options(max_retries=0)
+        return provider
+    
+    def _request_options(self, timeout=None, max_tokens=None) -> dict:
+        """Per-request options; timeout bounds connect and every read, so a hung request gives up"""
+        options = {}
+        if timeout is not None:
+            options["timeout"] = timeout
+        if max_tokens is not None:
+            options["max_tokens"] = max_tokens
+        return options
+    
+    def create_completion(self, messages, stream=True, timeout=None, max_tokens=None):
         """Create chat completion"""
         if not self.is_available():
             raise ValueError(f"Provider {self.name} is not available (missing API key)")
@@ -56,127 +130,224 @@ class BaseProvider(ABC):
             model=self.model,
             messages=messages,
             stream=stream,
-            stream_options={"include_usage": True}
+            stream_options={"include_usage": True},
+            **self._request_options(timeout, max_tokens)
         )
-
-class DeepSeekProvider(BaseProvider):
-    @property
-    def name(self) -> str:
-        return "DeepSeek 官方"
     
-    @property
-    def api_key(self) -> str:
-        return API_KEYS['deepseek']
-    
-    @property
-    def base_url(self) -> str:
-        return BASE_URLS['deepseek']
-    
-    @property
-    def model(self) -> str:
-        return MODELS['deepseek']
-
-class AliyunProvider(BaseProvider):
-    @property
-    def name(self) -> str:
-        return "阿里云/百炼"
+    def create_completion_raw(self, messages, timeout=None, max_tokens=None) -> RawChunkStream:
+        """
+        Create a streaming chat completion and parse the SSE bytes directly
+        
+        Returns a stream of lightweight sse.RawChunk objects instead of SDK
+        ChatCompletionChunk models.
+        """
+        if not self.is_available():
+            raise ValueError(f"Provider {self.name} is not available (missing API key)")
+        
+        return RawChunkStream(self.client.chat.completions.with_streaming_response.create(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            **self._request_options(timeout, max_tokens)
+        ))
     
-    @property
-    def api_key(self) -> str:
-        return API_KEYS['aliyun']
+    def warmup(self, connections: int = 1) -> Optional[float]:
+        """
+        Open pooled connections (DNS, TCP, TLS) before the timed run
+        
+        Whether a later request actually reuses one of them is recorded per
+        request (TestResult.connection), since idle connections can expire.
+        
+        Args:
+            connections: Number of connections to open concurrently
+        
+        Returns:
+            float: Seconds spent warming up, or None if the connections could not be opened
+        """
+        if not self.is_available():
+            raise ValueError(f"Provider {self.name} is not available (missing API key)")
+        
+        from openai import APIConnectionError, APIStatusError
+        client = self.client.with_options(max_retries=0)
+        
+        def open_connection(_):
+            try:
+                client.models.list()
+            except APIStatusError:
+                # Any HTTP response means the connection is established
+                pass
+        
+        start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=connections) as executor:
+                list(executor.map(open_connection, range(connections)))
+        except APIConnectionError:
+            return None
+        
+        return time.perf_counter() - start
     
-    @property
-    def base_url(self) -> str:
-        return BASE_URLS['aliyun']
+    def setup_async_client(self):
+        """Initialize AsyncOpenAI client, bound to the currently running event loop"""
+        if not self.is_available():
+            return
+        
+        from openai import AsyncOpenAI
+        self.async_client = AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            http_client=get_async_http_client(),
+            **self._client_options()
+        )
+        self.async_client.chat.completions
     
-    @property
-    def model(self) -> str:
-        return MODELS['aliyun']
-
-class QianfanProvider(BaseProvider):
-    @property
-    def name(self) -> str:
-        return "百度千帆"
+    async def warmup_async(self, connections: int = 1) -> Optional[float]:
+        """Open pooled connections on the running event loop before the timed run; same result as warmup()"""
+        if not self.is_available():
+            raise ValueError(f"Provider {self.name} is not available (missing API key)")
+        
+        from openai import APIConnectionError, APIStatusError
+        if self.async_client is None:
+            self.setup_async_client()
+        client = self.async_client.with_options(max_retries=0)
+        
+        async def open_connection():
+            try:
+                await client.models.list()
+            except APIStatusError:
+                # Any HTTP response means the connection is established
+                pass
+        
+        start = time.perf_counter()
+        try:
+            await asyncio.gather(*(open_connection() for _ in range(connections)))
+        except APIConnectionError:
+            return None
+        
+        return time.perf_counter() - start
     
-    @property
-    def api_key(self) -> str:
-        return API_KEYS['qianfan']
+    async def create_completion_async(self, messages, stream=True, timeout=None, max_tokens=None):
+        """Create chat completion on the asyncio event loop"""
+        if not self.is_available():
+            raise ValueError(f"Provider {self.name} is not available (missing API key)")
+        
+        if self.async_client is None:
+            self.setup_async_client()
+        
+        return await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=stream,
+            stream_options={"include_usage": True},
+            **self._request_options(timeout, max_tokens)
+        )
     
-    @property
-    def base_url(self) -> str:
-        return BASE_URLS['qianfan']
+    async def create_completion_raw_async(self, messages, timeout=None, max_tokens=None) -> AsyncRawChunkStream:
+        """Async counterpart of create_completion_raw"""
+        if not self.is_available():
+            raise ValueError(f"Provider {self.name} is not available (missing API key)")
+        
+        if self.async_client is None:
+            self.setup_async_client()
+        
+        return await AsyncRawChunkStream.open(self.async_client.chat.completions.with_streaming_response.create(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            **self._request_options(timeout, max_tokens)
+        ))
     
-    @property
-    def model(self) -> str:
-        return MODELS['qianfan']
+    async def close_async_client(self):
+        """Drop the async client so the next event loop starts with a fresh one
+        
+        The underlying connection pool is shared and closed by http_pool.close_async_http_client.
+        """
+        self.async_client = None
 
-class SiliconFlowProvider(BaseProvider):
-    @property
-    def name(self) -> str:
-        return "硅基流动"
-    
-    @property
-    def api_key(self) -> str:
-        return API_KEYS['siliconflow']
-    
-    @property
-    def base_url(self) -> str:
-        return BASE_URLS['siliconflow']
-    
-    @property
-    def model(self) -> str:
-        return MODELS['siliconflow']
+@dataclass
+class ProviderSpec:
+    """One provider/model pair expanded from the registry"""
+    key: str                          # Unique short name, matched by --providers
+    group: str                        # Registry table the pair belongs to
+    name: str                         # Display name in reports
+    base_url: str
+    model: Optional[str] = None
+    api_key_env: Optional[str] = None # Environment variable holding the API key
+    model_env: Optional[str] = None   # Environment variable holding the model name, if model is not set
+    required: bool = False            # Whether a missing API key is an error rather than a skip
 
-class SiliconFlowProProvider(SiliconFlowProvider):
-    @property
-    def name(self) -> str:
-        return "硅基流动Pro"
+class ConfiguredProvider(BaseProvider):
+    """Provider built from a registry entry; the API key is read on first use"""
+    
+    def __init__(self, spec: ProviderSpec):
+        self.spec = spec
+        self.key = spec.key
+        self._api_key = None
+        super().__init__()
     
-    @property
-    def model(self) -> str:
-        return MODELS['siliconflow_pro']
-
-class VolcesProvider(BaseProvider):
     @property
     def name(self) -> str:
-        return "火山引擎"
+        return self.spec.name
     
     @property
     def api_key(self) -> str:
-        return API_KEYS['volces']
+        if self._api_key is None and self.spec.api_key_env:
+            self._api_key = get_env_var(self.spec.api_key_env, required=self.spec.required)
+        return self._api_key
     
     @property
     def base_url(self) -> str:
-        return BASE_URLS['volces']
+        return self.spec.base_url
     
     @property
     def model(self) -> str:
-        return ENDPOINTS['volces']
+        if self.spec.model is None and self.spec.model_env:
+            return get_env_var(self.spec.model_env, required=False)
+        return self.spec.model
 
-class TencentCloudProvider(BaseProvider):
-    @property
-    def name(self) -> str:
-        return "腾讯云"
+def expand_registry(registry: dict) -> List[ProviderSpec]:
+    """
+    Expand the registry into one ProviderSpec per provider/model pair
     
-    @property
-    def api_key(self) -> str:
-        return API_KEYS['tencentcloud']
+    A provider with a single model keeps its own key and name; with several
+    models the defaults are "<key>:<model>" and "<name> (<model>)".
     
-    @property
-    def base_url(self) -> str:
-        return BASE_URLS['tencentcloud']
+    Raises:
+        ValueError: If an entry is incomplete or two pairs share a key
+    """
+    specs = []
+    for group, entry in registry.get('providers', {}).items():
+        missing = [field for field in ('name', 'base_url', 'models') if field not in entry]
+        if missing:
+            raise ValueError(f"Provider {group} in the registry is missing: {', '.join(missing)}")
+        
+        models = entry['models']
+        for model in models:
+            if isinstance(model, str):
+                model = {'model': model}
+            model_id = model.get('model')
+            if model_id is None and 'model_env' not in model:
+                raise ValueError(f"Provider {group} has a model entry without 'model' or 'model_env'")
+            single = len(models) == 1
+            specs.append(ProviderSpec(
+                key=model.get('key') or (group if single else f"{group}:{model_id}"),
+                group=group,
+                name=model.get('name') or (entry['name'] if single else f"{entry['name']} ({model_id})"),
+                base_url=model.get('base_url', entry['base_url']),
+                model=model_id,
+                api_key_env=model.get('api_key_env', entry.get('api_key_env')),
+                model_env=model.get('model_env'),
+                required=model.get('required', entry.get('required', False))
+            ))
     
-    @property
-    def model(self) -> str:
-        return MODELS['tencentcloud']
+    seen = set()
+    for spec in specs:
+        if spec.key in seen:
+            raise ValueError(f"Duplicate provider key in the registry: {spec.key}")
+        seen.add(spec.key)
+    return specs
 
-# List of all available providers
-AVAILABLE_PROVIDERS = [
-    DeepSeekProvider,
-    AliyunProvider,
-    QianfanProvider,
-    SiliconFlowProvider,
-    SiliconFlowProProvider,
-    VolcesProvider,
-    TencentCloudProvider,
-]
+def load_providers(path=None) -> List[ProviderSpec]:
+    """Load and expand the provider registry (see config.load_registry)"""
+    return expand_registry(load_registry(path))
@@ -0,0 +1,219 @@
+import argparse
+import functools
+import math
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+from typing import List, Optional, Tuple
+import timeline
+from sse import RawChunk
+from tester import APITester, TestResult
+from traces import DELTA_CONTENT, DELTA_REASONING, USAGE, Trace, trace_files
+
+class _ReplayProvider:
+    """回放时代替服务商实例，只提供 APITester 读取的属性"""
+
+    def __init__(self, meta: dict):
+        self.name = meta['provider']
+        self.model = meta.get('model')
+
+@functools.lru_cache(maxsize=4096)
+def _synthetic_text(chars: int, size: int) -> str:
+    """
+    按字符数和 UTF-8 字节数构造占位文本
+
+    轨迹不保存生成文本；多字节字符数由字节差推出，只有启发式 token 估算的结果与原文一致。
+    录制时估算的 token 数保存在轨迹中，回放时直接使用，不依赖此处的文本。
+    """
+    wide = min(chars, (size - chars) // 2)
+    return 'a' * (chars - wide) + '中' * wide
+
+class ReplayTester(APITester):
+    """
+    从轨迹文件重新计算 TestResult
+
+    轨迹中的事件按记录的时间依次交给 APITester 的分块处理逻辑，
+    因此修改指标定义后回放得到的就是新定义下的结果。
+    """
+
+    def __init__(self, metrics_only: bool = False):
+        """
+        Args:
+            metrics_only: 与 APITester 相同；为 True 时 token 间隔按直方图近似计算，与 --metrics-only 运行的结果一致
+        """
+        super().__init__(buffer_output=True, verbose=False, metrics_only=metrics_only)
+        self._now = 0.0
+        self._recorded_tokens = None
+        # 每个事件复用同一组分块对象，只替换增量文本
+        self._chunks = {}
+        for kind, field in ((DELTA_REASONING, 'reasoning_content'), (DELTA_CONTENT, 'content')):
+            chunk = RawChunk({'choices': [{'delta': {}}]})
+            self._chunks[kind] = (chunk, chunk.choices[0].delta, field)
+
+    def clock(self) -> float:
+        return self._now
+
+    def _resolve_connection(self):
+        """连接标签取自轨迹记录，replay() 中已设置"""
+
+    def _resolve_token_counts(self) -> str:
+        """
+        使用录制时估算的 token 数
+
+        占位文本只在启发式估算下与原文的 token 数一致，安装 tiktoken 时会得到不同的结果；
+        旧版本录制的轨迹没有保存估算值，仍按占位文本重新估算。
+        """
+        recorded = self._recorded_tokens
+        if recorded is None:
+            return super()._resolve_token_counts()
+        for name in ('reasoning_tokens', 'content_tokens', 'completion_tokens', 'prompt_tokens', 'total_tokens'):
+            setattr(self, name, recorded[name])
+        return recorded['token_source']
+
+    def replay(self, trace: Trace) -> Optional[TestResult]:
+        """
+        回放单个轨迹
+
+        Returns:
+            TestResult，原请求失败时返回 None
+        """
+        meta = trace.meta
+        if meta.get('status') == 'error':
+            return None
+
+        provider = _ReplayProvider(meta)
+        messages = [{'role': 'user', 'content': _synthetic_text(chars, size)} for chars, size in meta.get('prompt', [])]
+        self._now = 0.0
+        self._start(provider, messages=messages)
+        self.connection = meta.get('connection')
+        self._recorded_tokens = meta.get('tokens')
+
+        for elapsed, value, size, kind in trace.events():
+            self._now = elapsed
+            if kind == USAGE:
+                chunk = RawChunk({'usage': meta['usage'][value]})
+            else:
+                chunk, delta, field = self._chunks[kind]
+                setattr(delta, field, _synthetic_text(value, size))
+            self._on_chunk(chunk)
+
+        if meta.get('status', 'ok') != 'ok':
+            self.status = meta['status']
+        self._now = meta['total_time']
+        result = self._finish(provider)
+        result.started_at = meta.get('recorded_at')
+        result.workload_id = meta.get('workload_id')
+        result.tags = meta.get('tags')
+        return result
+
+# 轨迹数不少于此值时默认使用多进程回放；更少时进程启动的开销超过收益
+PARALLEL_MIN_TRACES = 256
+
+def _replay_files(files: List[Path], include_warmup: bool, metrics_only: bool, timelines: bool) -> List[Tuple[str, Optional[TestResult]]]:
+    """在当前进程中回放一批轨迹，返回 (服务商名称, 结果) 列表"""
+    timeline.enable(timelines)
+    tester = ReplayTester(metrics_only)
+    replayed = []
+    for path in files:
+        with Trace(path) as trace:
+            if trace.meta.get('warmup') and not include_warmup:
+                continue
+            replayed.append((trace.meta['provider'], tester.replay(trace)))
+    return replayed
+
+def replay_traces(
+    paths,
+    include_warmup: bool = False,
+    metrics_only: bool = False,
+    workers: Optional[int] = None,
+    on_result=None,
+    timelines: bool = False
+) -> List[Optional[TestResult]]:
+    """
+    回放目录或文件中的所有轨迹
+
+    Args:
+        paths: 轨迹文件或目录（递归查找 .trace 文件）
+        include_warmup: 是否包含预热试验的轨迹
+        metrics_only: 见 ReplayTester
+        workers: 回放进程数；默认轨迹数不少于 PARALLEL_MIN_TRACES 时使用全部 CPU，否则在当前进程中回放
+        on_result: 可选回调，每个轨迹回放完成时以 (服务商名称, 结果) 调用
+        timelines: 是否为结果生成 token 时间线（HTML 报告中的图表）
+
+    Returns:
+        list: 按记录顺序排列的结果，原请求失败的为 None
+    """
+    files = trace_files(*paths)
+    if workers is None:
+        workers = os.cpu_count() or 1 if len(files) >= PARALLEL_MIN_TRACES else 1
+
+    if workers > 1 and len(files) > 1:
+        # 按记录顺序分批，每个进程处理若干批，结果按批次顺序合并
+        size = math.ceil(len(files) / (workers * 4))
+        batches = [files[i:i + size] for i in range(0, len(files), size)]
+        with ProcessPoolExecutor(workers) as pool:
+            replayed = [
+                item
+                for batch in pool.map(_replay_files, batches, repeat(include_warmup), repeat(metrics_only), repeat(timelines))
+                for item in batch
+            ]
+    else:
+        replayed = _replay_files(files, include_warmup, metrics_only, timelines)
+
+    results = []
+    for name, result in replayed:
+        results.append(result)
+        if on_result:
+            on_result(name, result)
+    return results
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='从 --trace-dir 记录的轨迹离线重新计算测试结果并生成报告，不调用任何 API')
+    parser.add_argument('paths', nargs='+', help='轨迹目录或 .trace 文件')
+    parser.add_argument('--trials', type=int, default=None, help='每个服务商的试验次数，用于排名汇总（默认：按轨迹数推断）')
+    parser.add_argument('--rank-by', choices=['tokens_per_second', 'ttft'], default='tokens_per_second', help='排名指标')
+    parser.add_argument('--include-warmup', action='store_true', help='包含预热试验的轨迹')
+    parser.add_argument('--workers', type=int, default=None, help=f'回放进程数（默认：轨迹数不少于 {PARALLEL_MIN_TRACES} 时使用全部 CPU）')
+    parser.add_argument('--metrics-only', action='store_true', help='token 间隔按直方图近似计算，与 --metrics-only 运行的结果一致（默认按精确值计算）')
+    return parser.parse_args()
+
+def main():
+    """命令行入口"""
+    from reporter import StreamingReporter, TestReporter
+
+    args = parse_args()
+    files = trace_files(*args.paths)
+    if not files:
+        raise SystemExit(f"没有找到轨迹文件：{', '.join(args.paths)}")
+
+    # 每个服务商的轨迹数（含失败的请求），用于推断试验次数和统计全部失败的服务商
+    counts = Counter()
+
+    def on_result(name, result):
+        counts[name] += 1
+        stream.add(name, result)
+
+    start = time.perf_counter()
+    stream = StreamingReporter(prefix='replay_report')
+    try:
+        results = replay_traces(args.paths, args.include_warmup, args.metrics_only, args.workers, on_result=on_result, timelines=True)
+    finally:
+        stream.close()
+    elapsed = time.perf_counter() - start
+
+    reporter = TestReporter(
+        [r for r in results if r],
+        f"回放：{', '.join(args.paths)}",
+        trials=args.trials or max(counts.values(), default=1),
+        providers=sorted(counts),
+        rank_by=args.rank_by
+    )
+    stream.finish(reporter)
+    print(f"\n已回放 {len(results)} 个轨迹，用时 {elapsed:.2f} 秒")
+
+if __name__ == "__main__":
+    main()
@@ -1,74 +1,173 @@
+import csv
+import json
 import os
+from dataclasses import fields
 from datetime import datetime
 from pathlib import Path
-import pandas as pd
 from tabulate import tabulate
-from jinja2 import Template
+from tester import TestResult, percentile
+
+REPORT_DIR = Path(__file__).parent / 'test_reports'
+
+def write_csv(path, rows):
+    """把字典列表写成 CSV，列顺序取第一行的键"""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        if rows:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
 
 class TestReporter:
-    def __init__(self, results, test_message):
+    def __init__(self, results, test_message, trials=1, providers=(), rank_by='tokens_per_second'):
         self.results = results
         self.test_message = test_message
-        self.report_dir = Path(__file__).parent / 'test_reports'
+        self.trials = trials          # 每个服务商的正式试验次数，大于 1 时按服务商汇总
+        self.providers = providers    # 参与测试的服务商名称，用于统计全部失败的服务商
+        self.rank_by = rank_by
+        self.report_dir = REPORT_DIR
         self.report_dir.mkdir(exist_ok=True)
         
-    def create_report(self):
-        """Create and save test report"""
+    def create_report(self, timestamp=None):
+        """
+        Create and save test report
+        
+        Args:
+            timestamp: Optional report timestamp, so the files share the name of a StreamingReporter's output
+        """
         # 创建时间戳
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        timestamp = timestamp or datetime.now().strftime('%Y%m%d_%H%M%S')
+        
+        # 准备数据：多次试验时按服务商汇总，否则每次运行一行
+        data = self._aggregate_rows() if self.trials > 1 else self._result_rows()
+        
+        # 生成HTML报告
+        html_report = self._generate_html_report(data, timestamp)
+        
+        # 保存报告
+        report_path = self.report_dir / f'test_report_{timestamp}'
+        
+        # 保存CSV
+        write_csv(f'{report_path}.csv', data)
+        
+        # 保存HTML
+        with open(f'{report_path}.html', 'w', encoding='utf-8') as f:
+            f.write(html_report)
         
-        # 准备数据
+        # 打印表格到控制台
+        print("\n测试结果总结：")
+        print(tabulate(data, headers='keys', tablefmt='grid'))
+        if self.trials > 1:
+            print("注：Rank 后的 ≈ 表示与上一名的差异在 95% 置信水平下不显著；"
+                  "TTFT 列仅统计已预热连接上的请求，Cold TTFT 为需要新建连接的请求")
+        print(f"\n详细报告已保存到：{report_path}.html 和 {report_path}.csv")
+        
+        return report_path
+    
+    def _result_rows(self):
+        """One row per single run"""
         data = []
         for result in self.results:
             if result:  # 如果测试成功
                 data.append({
                     'Provider': result.provider,
+                    'Status': result.status,
                     'First Token (s)': f"{result.first_token_time:.2f}" if result.first_token_time else "-",
+                    'Connection': result.connection or "-",
                     'Reasoning Tokens': result.reasoning_tokens if result.reasoning_tokens > 0 else "-",
                     'Reasoning Time (s)': f"{result.reasoning_time:.2f}" if result.reasoning_tokens > 0 else "-",
                     'Content Tokens': result.content_tokens if result.content_tokens > 0 else "-",
                     'Content Time (s)': f"{result.content_time:.2f}" if result.content_tokens > 0 else "-",
                     'Total Tokens': result.total_tokens,
+                    'Token Source': result.token_source,
                     'Total Time (s)': f"{result.total_time:.2f}",
-                    'Tokens/s': f"{result.total_tokens / result.total_time:.2f}" if result.total_time > 0 else "-"
+                    'Tokens/s': f"{result.output_tokens_per_second:.2f}" if result.total_time > 0 else "-",
+                    'ITL P50 (ms)': self._format_ms(result.itl_p50),
+                    'ITL P90 (ms)': self._format_ms(result.itl_p90),
+                    'ITL P99 (ms)': self._format_ms(result.itl_p99),
+                    'ITL Max (ms)': self._format_ms(result.itl_max),
+                    'TPOT (ms)': self._format_ms(result.tpot)
                 })
             else:  # 如果测试失败
                 data.append({
                     'Provider': "Failed",
+                    'Status': "error",
                     'First Token (s)': "-",
+                    'Connection': "-",
                     'Reasoning Tokens': "-",
                     'Reasoning Time (s)': "-",
                     'Content Tokens': "-",
                     'Content Time (s)': "-",
                     'Total Tokens': "-",
+                    'Token Source': "-",
                     'Total Time (s)': "-",
-                    'Tokens/s': "-"
+                    'Tokens/s': "-",
+                    'ITL P50 (ms)': "-",
+                    'ITL P90 (ms)': "-",
+                    'ITL P99 (ms)': "-",
+                    'ITL Max (ms)': "-",
+                    'TPOT (ms)': "-"
                 })
         
-        # 创建DataFrame
-        df = pd.DataFrame(data)
-        
-        # 生成HTML报告
-        html_report = self._generate_html_report(df, timestamp)
-        
-        # 保存报告
-        report_path = self.report_dir / f'test_report_{timestamp}'
+        # --instrument 时附上测试框架自身的开销，便于与服务商延迟对照
+        if any(result and result.harness_time is not None for result in self.results):
+            for result, row in zip(self.results, data):
+                row['Harness (ms)'] = self._format_ms(result.harness_time) if result else "-"
         
-        # 保存CSV
-        df.to_csv(f'{report_path}.csv', index=False)
+        return data
+    
+    def _aggregate_rows(self):
+        """One row per provider with repeated-trial statistics, in ranking order"""
+        from stats import aggregate_results
+        aggregates = aggregate_results(
+            self.results, self.trials, providers=self.providers, rank_by=self.rank_by
+        )
         
-        # 保存HTML
-        with open(f'{report_path}.html', 'w', encoding='utf-8') as f:
-            f.write(html_report)
+        # 服务商未返回 usage 时 tokens/s 基于客户端估算，在排名表中标明
+        token_sources = {}
+        for result in self.results:
+            if result and result.status == 'ok':
+                token_sources.setdefault(result.provider, set()).add(result.token_source)
         
-        # 打印表格到控制台
-        print("\n测试结果总结：")
-        print(tabulate(df, headers='keys', tablefmt='grid', showindex=False))
-        print(f"\n详细报告已保存到：{report_path}.html 和 {report_path}.csv")
+        data = []
+        for aggregate in aggregates:
+            rank = "-" if aggregate.rank is None else str(aggregate.rank)
+            if aggregate.tied_with_previous:
+                rank += " ≈"
+            data.append({
+                'Rank': rank,
+                'Provider': aggregate.provider,
+                'Success': f"{aggregate.successes}/{aggregate.trials}",
+                'TTFT Mean (s)': self._format_summary(aggregate.ttft, 'mean'),
+                'TTFT Median (s)': self._format_summary(aggregate.ttft, 'median'),
+                'TTFT 95% CI (s)': self._format_ci(aggregate.ttft),
+                'Cold TTFT (s)': self._format_summary(aggregate.cold_ttft, 'mean'),
+                'Tokens/s Mean': self._format_summary(aggregate.tokens_per_second, 'mean'),
+                'Tokens/s Median': self._format_summary(aggregate.tokens_per_second, 'median'),
+                'Tokens/s 95% CI': self._format_ci(aggregate.tokens_per_second),
+                'Token Source': '/'.join(sorted(token_sources.get(aggregate.provider, ()))) or "-",
+                'ITL P99 Median (ms)': self._format_ms(aggregate.itl_p99.median) if aggregate.itl_p99 else "-"
+            })
         
-        return report_path
+        return data
     
-    def _generate_html_report(self, df, timestamp):
+    @staticmethod
+    def _format_summary(summary, field):
+        """Format one field of a MetricSummary"""
+        return f"{getattr(summary, field):.2f}" if summary else "-"
+    
+    @staticmethod
+    def _format_ci(summary):
+        """Format the confidence interval of a MetricSummary"""
+        if not summary or summary.ci_low is None:
+            return "-"
+        return f"[{summary.ci_low:.2f}, {summary.ci_high:.2f}]"
+    
+    @staticmethod
+    def _format_ms(seconds):
+        """Format a duration in seconds as milliseconds for the tables"""
+        return f"{seconds * 1000:.1f}" if seconds is not None else "-"
+    
+    def _generate_html_report(self, rows, timestamp):
         """Generate HTML report using template"""
         template = """
         <!DOCTYPE html>
@@ -83,6 +182,7 @@ class TestReporter:
                 th { background-color: #f2f2f2; }
                 tr:nth-child(even) { background-color: #f9f9f9; }
                 .metadata { margin: 20px 0; }
+                {% if charts %}{{ chart_style }}{% endif %}
             </style>
         </head>
         <body>
@@ -93,17 +193,424 @@ class TestReporter:
                     <p><strong>Test Message:</strong> {{ test_message }}</p>
                 </div>
             </div>
-            {{ table }}
+            <table>
+                <thead>
+                    <tr>{% for column in columns %}<th>{{ column }}</th>{% endfor %}</tr>
+                </thead>
+                <tbody>
+                    {% for row in rows %}
+                    <tr>{% for column in columns %}<td>{{ row[column] }}</td>{% endfor %}</tr>
+                    {% endfor %}
+                </tbody>
+            </table>
+            {% if charts %}
+            <div class="charts">
+                <h2>Token Timeline</h2>
+                <p class="note">每条曲线为一次请求的累计输出 token 数（服务商只在末尾报告各阶段的 token 数，按分块均匀分摊）；橙色底为推理阶段，蓝色底为输出阶段，虚线为被截止时间或停顿中断的请求。长流已用 LTTB 降采样。</p>
+                <div class="legend" id="chart-legend"></div>
+                <div class="grid" id="timeline-grid"></div>
+                <h2>TTFT Distribution</h2>
+                <div><canvas id="ttft-chart"></canvas></div>
+                <h2>Inter-Token Latency Distribution</h2>
+                <div><canvas id="itl-chart"></canvas></div>
+                <div id="chart-tooltip"></div>
+            </div>
+            <script>
+                const CHART_DATA = {{ charts|tojson }};
+                {{ chart_script }}
+            </script>
+            {% endif %}
         </body>
         </html>
         """
         
-        # 渲染模板
-        template = Template(template)
+        # 渲染模板；有 token 时间线时附带交互图表（脚本内联，离线也能打开）
+        from jinja2 import Template
+        from markupsafe import Markup
+        from charts import CHART_SCRIPT, CHART_STYLE, chart_data
+        template = Template(template, autoescape=True)
         html = template.render(
             timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             test_message=self.test_message,
-            table=df.to_html(index=False)
+            columns=list(rows[0]) if rows else [],
+            rows=rows,
+            charts=chart_data(self.results),
+            chart_style=Markup(CHART_STYLE),
+            chart_script=Markup(CHART_SCRIPT)
         )
         
         return html
+
+class LoadTestReporter(TestReporter):
+    """负载测试报告：每个服务商每个阶段一行"""
+    
+    def create_report(self):
+        """Create and save load test report"""
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        
+        data = []
+        for stage in self.results:
+            data.append({
+                'Provider': stage.provider,
+                'Stage': stage.stage,
+                'Target RPS': f"{stage.target_rps:.2f}",
+                'Achieved RPS': f"{stage.achieved_rps:.2f}",
+                'Sent': stage.sent,
+                'Errors': stage.errors,
+                'Dropped': stage.dropped,
+                'Error Rate': f"{stage.error_rate:.1%}",
+                'Peak In-Flight': stage.peak_in_flight,
+                'TTFT Mean (s)': f"{stage.ttft_mean:.2f}" if stage.ttft_mean is not None else "-",
+                'TTFT P50 (s)': f"{stage.ttft_p50:.2f}" if stage.ttft_p50 is not None else "-",
+                'TTFT P90 (s)': f"{stage.ttft_p90:.2f}" if stage.ttft_p90 is not None else "-",
+                'Tokens/s': f"{stage.tokens_per_second:.2f}" if stage.tokens_per_second is not None else "-",
+                'Throughput (tokens/s)': f"{stage.throughput:.2f}"
+            })
+        
+        html_report = self._generate_html_report(data, timestamp)
+        report_path = self.report_dir / f'load_report_{timestamp}'
+        
+        write_csv(f'{report_path}.csv', data)
+        with open(f'{report_path}.html', 'w', encoding='utf-8') as f:
+            f.write(html_report)
+        
+        print("\n负载测试结果总结：")
+        print(tabulate(data, headers='keys', tablefmt='grid'))
+        print(f"\n详细报告已保存到：{report_path}.html 和 {report_path}.csv")
+        
+        return report_path
+    
+class SchedulerReporter(TestReporter):
+    """自适应并发探测报告：每个服务商一行最大可持续并发，控制台另外打印各窗口"""
+    
+    def create_report(self):
+        """Create and save adaptive concurrency report"""
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        
+        data = []
+        for result in self.results:
+            best = result.best
+            data.append({
+                'Provider': result.provider,
+                'Max Sustainable Concurrency': best.concurrency if best else "-",
+                'Throughput (tokens/s)': f"{best.throughput:.2f}" if best else "-",
+                'Requests/s': f"{best.requests_per_second:.2f}" if best else "-",
+                'TTFT P50 (s)': f"{best.ttft_p50:.2f}" if best and best.ttft_p50 is not None else "-",
+                'Windows': len(result.windows),
+                'Throttled': result.throttled,
+                'Errors': result.errors
+            })
+        
+        history = []
+        for result in self.results:
+            for index, window in enumerate(result.windows, 1):
+                history.append({
+                    'Provider': result.provider,
+                    'Window': index,
+                    'Concurrency': window.concurrency,
+                    'Completed': window.completed,
+                    'Throttled': window.throttled,
+                    'Errors': window.errors,
+                    'TTFT P50 (s)': f"{window.ttft_p50:.2f}" if window.ttft_p50 is not None else "-",
+                    'Throughput (tokens/s)': f"{window.throughput:.2f}",
+                    'Decision': window.decision
+                })
+        
+        html_report = self._generate_html_report(data, timestamp)
+        report_path = self.report_dir / f'adaptive_report_{timestamp}'
+        
+        write_csv(f'{report_path}.csv', data)
+        write_csv(f'{report_path}_windows.csv', history)
+        with open(f'{report_path}.html', 'w', encoding='utf-8') as f:
+            f.write(html_report)
+        
+        print("\n各测量窗口：")
+        print(tabulate(history, headers='keys', tablefmt='grid'))
+        print("\n自适应并发探测结果总结：")
+        print(tabulate(data, headers='keys', tablefmt='grid'))
+        print(f"\n详细报告已保存到：{report_path}.html、{report_path}.csv 和 {report_path}_windows.csv")
+        
+        return report_path
+    
+class GoodputReporter(TestReporter):
+    """SLO 有效吞吐报告：每个服务商一行，按可持续有效吞吐排名；各并发等级另存一张表"""
+    
+    @staticmethod
+    def _seconds(value):
+        return f"{value:.2f}" if value is not None else "-"
+    
+    @staticmethod
+    def _ms(value):
+        return f"{value * 1000:.1f}" if value is not None else "-"
+    
+    def create_report(self):
+        """Create and save SLO goodput report"""
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        
+        # 结果已按可持续有效吞吐从高到低排列
+        data = []
+        for rank, result in enumerate(self.results, 1):
+            best, knee = result.best, result.knee
+            data.append({
+                'Rank': rank,
+                'Provider': result.provider,
+                'Sustainable Goodput (req/s)': f"{best.goodput:.2f}" if best else "0.00",
+                'Goodput (tokens/s)': f"{best.goodput_tokens:.2f}" if best else "0.00",
+                'At Concurrency': best.concurrency if best else "-",
+                'SLO Attainment': f"{best.attainment:.1%}" if best else "-",
+                'TTFT P90 (s)': self._seconds(best.ttft_p90) if best else "-",
+                'TPOT P90 (ms)': self._ms(best.tpot_p90) if best else "-",
+                'Knee Concurrency': knee.concurrency if knee else f">{result.levels[-1].concurrency}" if result.levels else "-",
+            })
+        
+        levels = []
+        for result in self.results:
+            for level in result.levels:
+                levels.append({
+                    'Provider': result.provider,
+                    'Concurrency': level.concurrency,
+                    'Sent': level.sent,
+                    'Completed': level.completed,
+                    'Met SLO': level.good,
+                    'SLO Attainment': f"{level.attainment:.1%}",
+                    'Goodput (req/s)': f"{level.goodput:.2f}",
+                    'Goodput (tokens/s)': f"{level.goodput_tokens:.2f}",
+                    'Throughput (tokens/s)': f"{level.throughput:.2f}",
+                    'TTFT P50 (s)': self._seconds(level.ttft_p50),
+                    'TTFT P90 (s)': self._seconds(level.ttft_p90),
+                    'TPOT P50 (ms)': self._ms(level.tpot_p50),
+                    'TPOT P90 (ms)': self._ms(level.tpot_p90),
+                    'Note': 'knee' if level is result.knee else 'best' if level is result.best else '',
+                })
+        
+        html_report = self._generate_html_report(data, timestamp)
+        report_path = self.report_dir / f'goodput_report_{timestamp}'
+        
+        write_csv(f'{report_path}.csv', data)
+        write_csv(f'{report_path}_levels.csv', levels)
+        with open(f'{report_path}.html', 'w', encoding='utf-8') as f:
+            f.write(html_report)
+        
+        print("\n各并发等级：")
+        print(tabulate(levels, headers='keys', tablefmt='grid'))
+        print("\nSLO 有效吞吐排名：")
+        print(tabulate(data, headers='keys', tablefmt='grid'))
+        print("注：有效吞吐只计同时满足首 token 时间和 TPOT SLO 的完整请求；拐点为满足率首次低于目标的并发等级，"
+              "\">N\" 表示测到最高等级 N 仍未出现拐点")
+        print(f"\n详细报告已保存到：{report_path}.html、{report_path}.csv 和 {report_path}_levels.csv")
+        
+        return report_path
+    
+class SweepReporter(TestReporter):
+    """输入长度扫描报告：每个服务商每个输入长度一行，并拟合首 token 时间随输入 token 数的增长"""
+    
+    def create_report(self, timestamp=None):
+        """Create and save prompt-length sweep report"""
+        timestamp = timestamp or datetime.now().strftime('%Y%m%d_%H%M%S')
+        
+        from stats import linear_fit
+        grouped = {}
+        for result in self.results:
+            if result and result.status == 'ok':
+                grouped.setdefault((result.provider, result.workload_id), []).append(result)
+        
+        data = []
+        fits = {}
+        for provider in sorted({provider for provider, _ in grouped}):
+            points = []
+            rows = []
+            for (name, workload_id), results in grouped.items():
+                if name != provider:
+                    continue
+                # 与排名统计一致，首 token 时间只用已预热连接的样本，避免握手时间混入预填充时间
+                warm_results = [r for r in results if r.connection != 'cold'] or results
+                ttfts = [r.first_token_time for r in warm_results if r.first_token_time is not None]
+                prompt_tokens = [r.prompt_tokens for r in results if r.prompt_tokens]
+                mean_prompt_tokens = sum(prompt_tokens) / len(prompt_tokens) if prompt_tokens else None
+                points.extend((r.prompt_tokens, r.first_token_time) for r in warm_results)
+                rows.append({
+                    'Provider': provider,
+                    'Workload': workload_id,
+                    'Input Tokens': f"{mean_prompt_tokens:.0f}" if mean_prompt_tokens is not None else "-",
+                    'Samples': len(results),
+                    'TTFT Mean (s)': f"{sum(ttfts) / len(ttfts):.3f}" if ttfts else "-",
+                    'TTFT P50 (s)': f"{percentile(ttfts, 50):.3f}" if ttfts else "-",
+                    'TTFT Max (s)': f"{max(ttfts):.3f}" if ttfts else "-",
+                    '_order': mean_prompt_tokens or 0
+                })
+            rows.sort(key=lambda row: row.pop('_order'))
+            data.extend(rows)
+            fits[provider] = linear_fit([p[0] for p in points], [p[1] for p in points])
+        
+        html_report = self._generate_html_report(data, timestamp)
+        report_path = self.report_dir / f'sweep_report_{timestamp}'
+        
+        write_csv(f'{report_path}.csv', data)
+        with open(f'{report_path}.html', 'w', encoding='utf-8') as f:
+            f.write(html_report)
+        
+        print("\n输入长度扫描结果：")
+        print(tabulate(data, headers='keys', tablefmt='grid'))
+        print("\n首 token 时间随输入长度的线性拟合：")
+        for provider, fit in fits.items():
+            if fit is None:
+                print(f"  {provider}: 样本不足，无法拟合")
+                continue
+            prefill = f"，约 {1 / fit.slope:.0f} tokens/s 预填充" if fit.slope > 0 else ""
+            r_squared = f"，R²={fit.r_squared:.2f}" if fit.r_squared is not None else ""
+            print(f"  {provider}: 每 1000 输入 tokens 增加 {fit.slope * 1000:.3f} 秒{prefill}，"
+                  f"截距 {fit.intercept:.3f} 秒{r_squared}")
+        print(f"\n详细报告已保存到：{report_path}.html 和 {report_path}.csv")
+        
+        return report_path
+    
+class CacheReporter(TestReporter):
+    """前缀缓存测试报告：每个服务商一行，对比冷请求（共享前缀首次发送）和热请求（前缀已缓存）的首 token 时间"""
+    
+    @staticmethod
+    def _ttfts(results):
+        """首 token 时间；与排名统计一致，只用已预热连接的样本，避免握手时间混入"""
+        warm_connection = [r for r in results if r.connection != 'cold'] or results
+        return [r.first_token_time for r in warm_connection if r.first_token_time is not None]
+    
+    @staticmethod
+    def _hit_rate(results):
+        """服务商报告的缓存命中 token 占输入 token 的比例，均未报告时返回 None"""
+        reported = [r for r in results if r.prompt_cache_hit_tokens is not None]
+        total = sum(r.prompt_cache_hit_tokens + (r.prompt_cache_miss_tokens or 0) for r in reported)
+        return sum(r.prompt_cache_hit_tokens for r in reported) / total if total else None
+    
+    def create_report(self, timestamp=None):
+        """Create and save prefix-cache report"""
+        timestamp = timestamp or datetime.now().strftime('%Y%m%d_%H%M%S')
+        
+        from stats import difference_ci
+        grouped = {}
+        for result in self.results:
+            if result and result.status == 'ok' and result.tags:
+                phase = 'warm' if 'warm' in result.tags.split(',') else 'cold'
+                grouped.setdefault(result.provider, {'cold': [], 'warm': []})[phase].append(result)
+        
+        data = []
+        for provider in sorted(grouped):
+            cold, warm = grouped[provider]['cold'], grouped[provider]['warm']
+            cold_ttfts, warm_ttfts = self._ttfts(cold), self._ttfts(warm)
+            cold_median, warm_median = percentile(cold_ttfts, 50), percentile(warm_ttfts, 50)
+            saved = sum(cold_ttfts) / len(cold_ttfts) - sum(warm_ttfts) / len(warm_ttfts) if cold_ttfts and warm_ttfts else None
+            ci = difference_ci(cold_ttfts, warm_ttfts)
+            prompt_tokens = [r.prompt_tokens for r in cold + warm if r.prompt_tokens]
+            cold_hit, warm_hit = self._hit_rate(cold), self._hit_rate(warm)
+            data.append({
+                'Provider': provider,
+                'Input Tokens': f"{sum(prompt_tokens) / len(prompt_tokens):.0f}" if prompt_tokens else "-",
+                'Samples (Cold/Warm)': f"{len(cold)}/{len(warm)}",
+                'Cold TTFT P50 (s)': f"{cold_median:.3f}" if cold_median is not None else "-",
+                'Warm TTFT P50 (s)': f"{warm_median:.3f}" if warm_median is not None else "-",
+                'Speedup': f"{cold_median / warm_median:.2f}x" if cold_median and warm_median else "-",
+                'TTFT Saved Mean (s)': f"{saved:.3f}" if saved is not None else "-",
+                'Saved 95% CI (s)': f"[{ci[0]:.3f}, {ci[1]:.3f}]" if ci else "-",
+                'Cold Cache Hit': f"{cold_hit:.0%}" if cold_hit is not None else "-",
+                'Warm Cache Hit': f"{warm_hit:.0%}" if warm_hit is not None else "-",
+            })
+        
+        html_report = self._generate_html_report(data, timestamp)
+        report_path = self.report_dir / f'cache_report_{timestamp}'
+        
+        write_csv(f'{report_path}.csv', data)
+        with open(f'{report_path}.html', 'w', encoding='utf-8') as f:
+            f.write(html_report)
+        
+        print("\n前缀缓存测试结果：")
+        print(tabulate(data, headers='keys', tablefmt='grid'))
+        print("注：Cache Hit 为服务商报告的缓存命中 tokens 占输入 tokens 的比例，\"-\" 表示服务商未报告；"
+              "热请求命中率低说明缓存尚未建立，可加大 --cache-wait；"
+              "冷请求命中率高说明冷请求之前该前缀已在服务商缓存中，该行的冷热对比无效")
+        print(f"\n详细报告已保存到：{report_path}.html 和 {report_path}.csv")
+        
+        return report_path
+    
+class StreamingReporter:
+    """
+    逐条写出测试结果
+    
+    每个结果到达时立即追加到 {report}_results.csv 和 {report}_results.jsonl 并刷新到磁盘，
+    同时在控制台打印一行进度；运行中途崩溃也不会丢失已完成的结果。
+    汇总表格和 HTML 在 finish() 时生成，与结果文件使用同一时间戳。
+    """
+    
+    # 时间线只用于 HTML 图表，不写入结果文件
+    COLUMNS = [f.name for f in fields(TestResult) if f.name != 'timeline']
+    
+    def __init__(self, expected=None, prefix='test_report'):
+        """
+        Args:
+            expected: 预计的结果数量，用于显示进度
+            prefix: 结果文件名前缀，应与最终报告一致
+        """
+        self.expected = expected
+        self.results = []
+        self.failures = 0
+        self.timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        REPORT_DIR.mkdir(exist_ok=True)
+        self.results_path = REPORT_DIR / f'{prefix}_{self.timestamp}_results'
+        self._csv_file = open(f'{self.results_path}.csv', 'w', newline='', encoding='utf-8')
+        self._csv = csv.DictWriter(self._csv_file, fieldnames=['recorded_at'] + self.COLUMNS)
+        self._csv.writeheader()
+        self._jsonl_file = open(f'{self.results_path}.jsonl', 'w', encoding='utf-8')
+    
+    def add(self, provider, result):
+        """
+        记录一个结果（可在回调中直接调用）
+        
+        Args:
+            provider: 服务商实例或名称
+            result: TestResult，失败时为 None
+        """
+        name = getattr(provider, 'name', provider)
+        recorded_at = datetime.now().isoformat(timespec='seconds')
+        if result:
+            self.results.append(result)
+            row = {'recorded_at': recorded_at, **{name: getattr(result, name) for name in self.COLUMNS}}
+            self._csv.writerow(row)
+        else:
+            self.failures += 1
+            row = {'recorded_at': recorded_at, 'provider': name, 'status': 'error'}
+            self._csv.writerow(row)
+        self._jsonl_file.write(json.dumps(row, ensure_ascii=False) + '\n')
+        self._csv_file.flush()
+        self._jsonl_file.flush()
+        self._print_progress(name, result)
+    
+    def _print_progress(self, name, result):
+        """打印一行进度"""
+        done = len(self.results) + self.failures
+        progress = f"[{done}/{self.expected}]" if self.expected else f"[{done}]"
+        if not result:
+            print(f"{progress} {name}: 失败")
+            return
+        ttft = f"{result.first_token_time:.2f}s" if result.first_token_time is not None else "-"
+        speed = f"{result.output_tokens_per_second:.2f}" if result.total_time > 0 else "-"
+        status = "" if result.status == 'ok' else f"（{result.status}）"
+        print(f"{progress} {name}: 首 token {ttft}，输出 {result.reasoning_tokens + result.content_tokens} tokens，{speed} tokens/s{status}")
+    
+    def close(self):
+        """关闭结果文件（可重复调用）"""
+        if not self._csv_file.closed:
+            self._csv_file.close()
+        if not self._jsonl_file.closed:
+            self._jsonl_file.close()
+    
+    def finish(self, reporter):
+        """
+        关闭结果文件，生成汇总表格和 HTML
+        
+        Args:
+            reporter: 以 self.results 构造的 TestReporter（或子类）
+        
+        Returns:
+            报告路径（不含扩展名）
+        """
+        self.close()
+        report_path = reporter.create_report(self.timestamp)
+        print(f"逐条结果：{self.results_path}.csv 和 {self.results_path}.jsonl")
+        return report_path
@@ -0,0 +1,341 @@
+import argparse
+import hashlib
+import sqlite3
+import time
+import typing
+import uuid
+from dataclasses import fields
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Iterable
+from tester import TestResult
+
+DEFAULT_STORE_PATH = Path(__file__).parent / 'test_reports' / 'results.db'
+
+# TestResult 字段类型到 SQLite 列类型的映射；非标量字段不入库
+_SQL_TYPES = {int: 'INTEGER', float: 'REAL', str: 'TEXT', bool: 'INTEGER'}
+
+# 库结构版本（PRAGMA user_version）；1：tokens_per_second 只计推理和正文 tokens
+_SCHEMA_VERSION = 1
+
+# 按时间分桶聚合时使用的格式
+_BUCKETS = {
+    'hour': '%Y-%m-%d %H:00',
+    'day': '%Y-%m-%d',
+    'week': '%Y-W%W',
+    'month': '%Y-%m',
+}
+
+def _result_columns():
+    """TestResult 中可入库的字段及其 SQLite 类型"""
+    hints = typing.get_type_hints(TestResult)
+    columns = []
+    for f in fields(TestResult):
+        hint = hints[f.name]
+        # 展开 Optional[X]
+        args = [a for a in typing.get_args(hint) if a is not type(None)]
+        if typing.get_origin(hint) is typing.Union and len(args) == 1:
+            hint = args[0]
+        if hint in _SQL_TYPES:
+            columns.append((f.name, _SQL_TYPES[hint]))
+    return columns
+
+def parse_time(value: str) -> float:
+    """解析 ISO 格式的日期或时间（本地时区），返回时间戳"""
+    return datetime.fromisoformat(value).timestamp()
+
+class ResultStore:
+    """
+    追加写入的测试结果库（SQLite）
+
+    每次运行的结果写入 results 表，按服务商、模型、时间和提示词建立索引，
+    查询和聚合直接在库内完成，无需重新解析历史报告。
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.row_factory = sqlite3.Row
+        self._columns = _result_columns()
+        self._ensure_schema()
+
+    def _ensure_schema(self):
+        """建表、建索引，为 TestResult 新增的字段补充列，并迁移旧版本写入的数据"""
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS prompts (
+                    prompt_hash TEXT PRIMARY KEY,
+                    prompt TEXT NOT NULL
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_id TEXT NOT NULL,
+                    recorded_at REAL NOT NULL,
+                    mode TEXT,
+                    prompt_hash TEXT,
+                    provider TEXT NOT NULL,
+                    tokens_per_second REAL
+                )
+            """)
+
+            existing = {row['name'] for row in self.conn.execute("PRAGMA table_info(results)")}
+            for name, sql_type in self._columns:
+                if name not in existing:
+                    self.conn.execute(f"ALTER TABLE results ADD COLUMN {name} {sql_type}")
+
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+                # 早期版本按 total_tokens 计算生成速度，包含了输入 tokens
+                self.conn.execute("""
+                    UPDATE results SET tokens_per_second =
+                        CASE WHEN total_time > 0 THEN (reasoning_tokens + content_tokens) / total_time END
+                """)
+            self.conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+
+            for index_columns in ('provider, recorded_at', 'model, recorded_at', 'prompt_hash, recorded_at', 'recorded_at', 'run_id'):
+                index_name = 'idx_results_' + index_columns.replace(', ', '_')
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON results ({index_columns})")
+
+    def append(
+        self,
+        results: Iterable[TestResult],
+        prompt: str,
+        run_id: Optional[str] = None,
+        mode: Optional[str] = None,
+        recorded_at: Optional[float] = None
+    ) -> int:
+        """
+        追加一次运行的结果
+
+        Args:
+            results: TestResult 列表（None 会被忽略）
+            prompt: 测试提示词
+            run_id: 运行标识，默认随机生成
+            mode: 测试模式
+            recorded_at: 记录时间戳，默认当前时间
+
+        Returns:
+            int: 写入的行数
+        """
+        run_id = run_id or uuid.uuid4().hex[:12]
+        recorded_at = recorded_at if recorded_at is not None else time.time()
+        prompt_hash = hashlib.sha1(prompt.encode('utf-8')).hexdigest()
+
+        names = [name for name, _ in self._columns]
+        columns = ['run_id', 'recorded_at', 'mode', 'prompt_hash', 'tokens_per_second'] + names
+        sql = f"INSERT INTO results ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+        rows = []
+        for result in results:
+            if not result:
+                continue
+            rows.append(
+                [run_id, recorded_at, mode, prompt_hash, result.output_tokens_per_second]
+                + [getattr(result, name) for name in names]
+            )
+
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO prompts (prompt_hash, prompt) VALUES (?, ?)",
+                (prompt_hash, prompt)
+            )
+            self.conn.executemany(sql, rows)
+
+        return len(rows)
+
+    def _where(self, provider=None, model=None, prompt=None, since=None, until=None, run_id=None, complete_only=False):
+        """构造过滤条件；complete_only 时排除被截止时间或停顿中断的部分结果（旧版本写入的行没有 status，视为完整）"""
+        clauses, params = [], []
+        if complete_only:
+            clauses.append("(r.status = 'ok' OR r.status IS NULL)")
+        if run_id:
+            clauses.append("r.run_id = ?")
+            params.append(run_id)
+        if provider:
+            clauses.append("r.provider = ?")
+            params.append(provider)
+        if model:
+            clauses.append("r.model = ?")
+            params.append(model)
+        if prompt:
+            clauses.append("r.prompt_hash = ?")
+            params.append(hashlib.sha1(prompt.encode('utf-8')).hexdigest())
+        if since is not None:
+            clauses.append("r.recorded_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("r.recorded_at < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def query(
+        self,
+        provider: Optional[str] = None,
+        model: Optional[str] = None,
+        prompt: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: Optional[int] = None,
+        run_id: Optional[str] = None
+    ) -> List[dict]:
+        """
+        按条件查询原始结果，按时间倒序
+
+        Args:
+            provider: 服务商名称
+            model: 模型名称
+            prompt: 提示词原文
+            since: 起始时间戳（含）
+            until: 结束时间戳（不含）
+            limit: 最多返回的行数
+            run_id: 运行标识（与报告文件名相同，例如 test_report_20250201_120000）
+
+        Returns:
+            list: 每行一个字典
+        """
+        where, params = self._where(provider, model, prompt, since, until, run_id)
+        sql = f"""
+            SELECT r.*, p.prompt FROM results r
+            LEFT JOIN prompts p ON p.prompt_hash = r.prompt_hash
+            {where}
+            ORDER BY r.recorded_at DESC
+        """
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def aggregate(
+        self,
+        group_by: str = 'provider',
+        bucket: Optional[str] = None,
+        provider: Optional[str] = None,
+        model: Optional[str] = None,
+        prompt: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None
+    ) -> List[dict]:
+        """
+        按服务商或模型（可再按时间分桶）聚合
+
+        Args:
+            group_by: 'provider' 或 'model'
+            bucket: 时间分桶，'hour'、'day'、'week' 或 'month'，None 表示不分桶
+            其余参数同 query
+
+        Returns:
+            list: 每组一个字典，包含样本数以及首 token 时间、生成速度的均值/最小值/最大值；
+            被中断的部分结果（status 为 timeout/stalled）的耗时和 token 数被截断，不计入聚合
+        """
+        if group_by not in ('provider', 'model'):
+            raise ValueError(f"不支持的分组字段：{group_by}")
+
+        group_columns = [f"r.{group_by}"]
+        select_columns = [f"r.{group_by} AS {group_by}"]
+        if bucket:
+            if bucket not in _BUCKETS:
+                raise ValueError(f"不支持的时间分桶：{bucket}")
+            bucket_sql = f"strftime('{_BUCKETS[bucket]}', r.recorded_at, 'unixepoch', 'localtime')"
+            group_columns.append(bucket_sql)
+            select_columns.append(f"{bucket_sql} AS bucket")
+
+        where, params = self._where(provider, model, prompt, since, until, complete_only=True)
+        sql = f"""
+            SELECT {', '.join(select_columns)},
+                   COUNT(*) AS samples,
+                   AVG(r.first_token_time) AS ttft_mean,
+                   MIN(r.first_token_time) AS ttft_min,
+                   MAX(r.first_token_time) AS ttft_max,
+                   AVG(r.tokens_per_second) AS tps_mean,
+                   MIN(r.tokens_per_second) AS tps_min,
+                   MAX(r.tokens_per_second) AS tps_max,
+                   MIN(r.recorded_at) AS first_seen,
+                   MAX(r.recorded_at) AS last_seen
+            FROM results r
+            {where}
+            GROUP BY {', '.join(group_columns)}
+            ORDER BY {', '.join(group_columns)}
+        """
+        return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def close(self):
+        self.conn.close()
+
+def _format_rows(rows: List[dict], columns: List[str]) -> List[List]:
+    """格式化输出行：时间戳转为本地时间，浮点数保留两位小数"""
+    formatted = []
+    for row in rows:
+        line = []
+        for column in columns:
+            value = row.get(column)
+            if column in ('recorded_at', 'first_seen', 'last_seen') and value is not None:
+                value = datetime.fromtimestamp(value).strftime('%Y-%m-%d %H:%M:%S')
+            elif isinstance(value, float):
+                value = f"{value:.2f}"
+            line.append("-" if value is None else value)
+        formatted.append(line)
+    return formatted
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='测试结果历史库查询工具')
+    parser.add_argument('--db', type=str, default=str(DEFAULT_STORE_PATH), help='结果库路径')
+
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_filters(sub):
+        sub.add_argument('--provider', type=str, default=None, help='按服务商过滤')
+        sub.add_argument('--model', type=str, default=None, help='按模型过滤')
+        sub.add_argument('--prompt', type=str, default=None, help='按提示词原文过滤')
+        sub.add_argument('--since', type=str, default=None, help='起始时间（ISO 格式，例如 2025-02-01）')
+        sub.add_argument('--until', type=str, default=None, help='结束时间（ISO 格式，不含）')
+
+    query_parser = subparsers.add_parser('query', help='查询原始结果')
+    add_filters(query_parser)
+    query_parser.add_argument('--limit', type=int, default=50, help='最多显示的行数（默认：50）')
+    query_parser.add_argument('--run-id', type=str, default=None, help='只显示指定运行的结果')
+
+    summary_parser = subparsers.add_parser('summary', help='按服务商或模型聚合')
+    add_filters(summary_parser)
+    summary_parser.add_argument('--by', choices=['provider', 'model'], default='provider', help='分组字段')
+    summary_parser.add_argument('--bucket', choices=list(_BUCKETS), default=None, help='按时间分桶')
+
+    return parser.parse_args()
+
+def main():
+    """命令行入口"""
+    from tabulate import tabulate
+
+    args = parse_args()
+    store = ResultStore(args.db)
+    filters = dict(
+        provider=args.provider,
+        model=args.model,
+        prompt=args.prompt,
+        since=parse_time(args.since) if args.since else None,
+        until=parse_time(args.until) if args.until else None
+    )
+
+    try:
+        if args.command == 'query':
+            rows = store.query(limit=args.limit, run_id=args.run_id, **filters)
+            columns = ['recorded_at', 'run_id', 'provider', 'model', 'first_token_time', 'tokens_per_second', 'total_tokens', 'total_time']
+        else:
+            rows = store.aggregate(group_by=args.by, bucket=args.bucket, **filters)
+            columns = [args.by] + (['bucket'] if args.bucket else []) + [
+                'samples', 'ttft_mean', 'ttft_min', 'ttft_max', 'tps_mean', 'tps_min', 'tps_max', 'first_seen', 'last_seen'
+            ]
+    finally:
+        store.close()
+
+    if not rows:
+        print("没有符合条件的结果")
+        return
+
+    print(tabulate(_format_rows(rows, columns), headers=columns, tablefmt='grid'))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,540 @@
+import argparse
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+from daemon import METRIC_PREFIX, QUANTILES, RollingWindow, _format_value, _labels
+from providers import BaseProvider
+from tester import APITester, TestResult, abort_stream, percentile
+from tokens import count_message_tokens
+
+@dataclass
+class RouterConfig:
+    """对冲请求路由配置"""
+    hedge_percentile: float = 90.0        # 首选服务商等待首 token 超过其首 token 时间的该分位数时发出对冲请求
+    default_hedge_delay: float = 2.0      # 样本不足 min_samples 时的对冲等待时间（秒）
+    min_hedge_delay: float = 0.05         # 对冲等待时间下限（秒）
+    min_samples: int = 10                 # 按分位数计算对冲等待时间所需的最少样本数
+    max_hedge_ratio: float = 0.2          # 对冲预算：被对冲的请求最多占全部请求的比例
+    max_error_rate: float = 0.5           # 滚动窗口内错误率超过该值的服务商排在最后
+    window: float = 600.0                 # 延迟模型的滚动窗口长度（秒）
+    max_window_samples: int = 1000        # 每个滚动窗口最多保留的样本数
+    timeout: float = 120.0                # 等待首 token 的截止时间（秒），从首选请求发出时算起，同时作为 SDK 的读超时
+    raw_sse: bool = False                 # 直接解析 SSE 字节流，跳过 SDK 对象构造
+
+def _has_token(chunk) -> bool:
+    """分块是否带有输出（推理或正文），与 APITester 的首 token 判定一致"""
+    if not getattr(chunk, 'choices', None):
+        return False
+    delta = chunk.choices[0].delta
+    return bool(getattr(delta, 'reasoning_content', "") or getattr(delta, 'content', ""))
+
+class LatencyModel:
+    """单个服务商的滚动延迟模型：首 token 时间和错误率"""
+
+    def __init__(self, window: float, maxlen: int):
+        self.ttft = RollingWindow(window, maxlen)
+        self.errors = RollingWindow(window, maxlen)
+
+    def record(self, ttft: Optional[float], ok: bool, now: float):
+        self.errors.add(0.0 if ok else 1.0, now)
+        if ok and ttft is not None:
+            self.ttft.add(ttft, now)
+
+    def error_rate(self, now: float) -> float:
+        values = self.errors.values(now)
+        return sum(values) / len(values) if values else 0.0
+
+    def tail_mean(self, above: float, now: float) -> Optional[float]:
+        """超过 above 的样本的均值，即已知等待超过 above 时首 token 时间的条件期望；没有这样的样本时返回 None"""
+        tail = [value for value in self.ttft.values(now) if value > above]
+        return sum(tail) / len(tail) if tail else None
+
+class RouterMetrics:
+    """对冲效果和额外成本的累计指标"""
+
+    def __init__(self, config: RouterConfig):
+        self.requests = 0             # 路由的请求数
+        self.errors = 0               # 所有服务商都失败的请求数
+        self.hedged = 0               # 发出了对冲请求的请求数
+        self.hedge_wins = 0           # 对冲请求先到首 token 的次数
+        self.failovers = 0            # 服务商出错后改发下一个服务商的次数
+        self.extra_requests = 0       # 被取消的请求数，即额外发送的请求
+        self.extra_prompt_tokens = 0  # 被取消请求的估算输入 tokens；服务商通常按已接收的请求计费
+        self.ttft_saved = 0.0         # 对冲请求胜出时估算节省的首 token 时间之和（秒）
+        self.wins: Dict[str, int] = {}
+        # 实际首 token 时间，以及不对冲时首选服务商的估算首 token 时间
+        self.routed_ttft = RollingWindow(config.window, config.max_window_samples)
+        self.unhedged_ttft = RollingWindow(config.window, config.max_window_samples)
+
+class _Attempt:
+    """在后台线程中向一个服务商发送请求，读到第一个带输出的分块后通知路由器"""
+
+    def __init__(self, provider: BaseProvider, messages: List[dict], max_tokens: Optional[int],
+                 config: RouterConfig, events: queue.Queue):
+        self.provider = provider
+        self.started = time.perf_counter()
+        self.stream = None
+        self.chunks = []      # 首个带输出的分块及其之前的分块（如只有 role 的分块），交给调用方时先重放
+        self.ttft: Optional[float] = None
+        self.error: Optional[Exception] = None
+        self.done = False
+        self.cancelled = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, args=(messages, max_tokens, config, events), daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, messages, max_tokens, config: RouterConfig, events: queue.Queue):
+        try:
+            if config.raw_sse:
+                stream = self.provider.create_completion_raw(messages, timeout=config.timeout, max_tokens=max_tokens)
+            else:
+                stream = self.provider.create_completion(messages, timeout=config.timeout, max_tokens=max_tokens)
+            with self._lock:
+                self.stream = stream
+                if self.cancelled:
+                    abort_stream(stream)
+                    return
+            for chunk in stream:
+                self.chunks.append(chunk)
+                if _has_token(chunk):
+                    self.ttft = time.perf_counter() - self.started
+                    break
+            else:
+                raise RuntimeError("流在输出任何 token 之前结束")
+        except Exception as e:
+            if self.cancelled:
+                return
+            self.error = e
+        self.done = True
+        events.put(self)
+
+    def cancel(self):
+        """取消请求；已建立的流从外部关闭，尚未返回响应头的请求在返回后立即关闭"""
+        with self._lock:
+            self.cancelled = True
+            stream = self.stream
+        if stream is not None:
+            abort_stream(stream)
+
+class RoutedStream:
+    """
+    路由器返回的流，按原样迭代胜出服务商的分块
+
+    属性 provider、ttft、provider_ttft、hedged 在返回时即已确定。ttft 是调用方看到的
+    首 token 时间，从首选请求发出时算起；provider_ttft 是胜出请求自身的首 token 时间，
+    对冲或改发时不含此前等待首选服务商的时间。迭代到末尾或调用 close()
+    时释放连接；首 token 之后的错误不会改发其他服务商，直接抛给调用方。
+    """
+
+    def __init__(self, router: 'HedgedRouter', attempt: _Attempt, hedged: bool, ttft: float):
+        self.provider = attempt.provider.name
+        self.ttft = ttft
+        self.provider_ttft = attempt.ttft
+        self.hedged = hedged
+        self._router = router
+        self._attempt = attempt
+        self._finished = False
+        self._chunks = self._iterate()
+
+    def _iterate(self):
+        yield from self._attempt.chunks
+        try:
+            yield from self._attempt.stream
+        except Exception:
+            self._router.observe(self.provider, None, ok=False)
+            raise
+        self._finished = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._chunks)
+
+    def close(self):
+        """提前结束时关闭连接；已读完的流的连接已归还连接池，不能再关闭"""
+        self._chunks.close()
+        if not self._finished:
+            abort_stream(self._attempt.stream)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class HedgedRouter:
+    """
+    按实时排名选择服务商并对慢请求发出对冲请求
+
+    每个服务商维护一个滚动延迟模型，由实际请求、后台探测和历史运行结果共同更新。
+    请求先发给首 token 时间中位数最低的健康服务商；等待首 token 超过该服务商首 token
+    时间的 hedge_percentile 分位数后，再向排名第二的服务商发出一次对冲请求，先输出首个
+    token 的一方胜出，另一方的流被立即关闭。服务商在首 token 之前出错时改发下一个服务商。
+
+    被取消的请求只知道首 token 时间不短于取消时的等待时间，按该下限计入模型，
+    避免一直输掉对冲的服务商在模型中显得比实际更快。
+    """
+
+    def __init__(self, providers: List[BaseProvider], config: RouterConfig = None):
+        self.config = config or RouterConfig()
+        # SDK 内部重试会把 429 的退避时间计入首 token 时间；失败时由路由器改发其他服务商。
+        # 使用关闭重试的副本，不改变调用方的服务商实例
+        self.providers = [p.without_retries() for p in providers if p.is_available()]
+        if not self.providers:
+            raise ValueError("没有可用的服务商")
+
+        # 客户端在首次使用时才创建，这里提前创建，避免计入第一个请求的首 token 时间
+        for provider in self.providers:
+            provider.client
+
+        self.models = {
+            p.name: LatencyModel(self.config.window, self.config.max_window_samples)
+            for p in self.providers
+        }
+        self.metrics = RouterMetrics(self.config)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._probes: List[threading.Thread] = []
+
+    def observe(self, provider: str, ttft: Optional[float], ok: bool = True):
+        """把一次首 token 时间（或失败）计入服务商的延迟模型；未知的服务商被忽略"""
+        model = self.models.get(provider)
+        if model is None:
+            return
+        with self._lock:
+            model.record(ttft, ok, time.monotonic())
+
+    def observe_result(self, provider: str, result: Optional[TestResult]):
+        """把一个 APITester 结果计入延迟模型，None 或被中断的结果计为失败"""
+        ok = result is not None and result.status == 'ok' and result.first_token_time is not None
+        self.observe(provider, result.first_token_time if ok else None, ok)
+
+    def seed(self, rows: Iterable[dict]) -> int:
+        """
+        用历史运行的结果行初始化延迟模型，例如 compare.load_run() 的返回值
+
+        样本按当前时间计入，随滚动窗口逐渐淘汰。
+
+        Returns:
+            int: 计入的结果数
+        """
+        count = 0
+        for row in rows:
+            if row.get('provider') not in self.models:
+                continue
+            ttft = row.get('first_token_time')
+            ok = row.get('status', 'ok') == 'ok' and ttft is not None
+            self.observe(row['provider'], ttft if ok else None, ok)
+            count += 1
+        return count
+
+    def ranking(self) -> List[BaseProvider]:
+        """
+        当前排名：健康且有样本的服务商按首 token 时间中位数升序，其后为没有样本的服务商，
+        错误率超过 max_error_rate 的服务商排在最后；同等条件下保持构造时的顺序
+        """
+        now = time.monotonic()
+        with self._lock:
+            def key(provider):
+                model = self.models[provider.name]
+                median = percentile(model.ttft.values(now), 50)
+                return (model.error_rate(now) > self.config.max_error_rate, median is None, median or 0.0)
+
+            return sorted(self.providers, key=key)
+
+    def hedge_delay(self, provider: BaseProvider) -> float:
+        """向该服务商发出请求后，等待多久没有首 token 就发出对冲请求"""
+        with self._lock:
+            values = self.models[provider.name].ttft.values(time.monotonic())
+        if len(values) < self.config.min_samples:
+            return self.config.default_hedge_delay
+        return max(self.config.min_hedge_delay, percentile(values, self.config.hedge_percentile))
+
+    def stream(self, messages: List[dict], max_tokens: Optional[int] = None) -> RoutedStream:
+        """
+        发送一个流式请求，返回胜出服务商的流
+
+        Raises:
+            TimeoutError: 超过 timeout 仍没有服务商输出首 token
+            Exception: 所有服务商都在首 token 之前失败时，抛出最后一个错误
+        """
+        ranked = self.ranking()
+        pending = list(ranked)
+        events = queue.Queue()
+        attempts: List[_Attempt] = []
+        with self._lock:
+            self.metrics.requests += 1
+
+        def launch():
+            provider = pending.pop(0)
+            attempts.append(_Attempt(provider, messages, max_tokens, self.config, events))
+
+        launch()
+        primary = attempts[0]
+        hedge_at = primary.started + self.hedge_delay(primary.provider) if pending else None
+        # SDK 的超时只限制每次读取，服务端持续发送空分块时不会触发；整体等待以截止时间为上限
+        deadline = primary.started + self.config.timeout if self.config.timeout else None
+        hedged = False
+        winner = None
+        last_error = None
+
+        while winner is None:
+            now = time.perf_counter()
+            waits = [at - now for at in (hedge_at, deadline) if at is not None]
+            try:
+                attempt = events.get(timeout=max(0.0, min(waits)) if waits else None)
+            except queue.Empty:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    last_error = TimeoutError(f"{self.config.timeout:g} 秒内没有服务商输出首 token")
+                    break
+                # 首选服务商超过对冲等待时间仍无首 token。对冲预算按已路由的请求数计算，
+                # 并允许一次突发；在发出时检查并占用，避免并发调用方同时通过检查而超出预算
+                hedge_at = None
+                with self._lock:
+                    hedged = self.metrics.hedged < self.config.max_hedge_ratio * self.metrics.requests + 1
+                    if hedged:
+                        self.metrics.hedged += 1
+                if hedged:
+                    launch()
+                continue
+
+            if attempt.error is None:
+                winner = attempt
+                break
+
+            last_error = attempt.error
+            self.observe(attempt.provider.name, None, ok=False)
+            if not any(not a.done for a in attempts):
+                if not pending:
+                    break
+                with self._lock:
+                    self.metrics.failovers += 1
+                launch()
+                # 首选服务商出错后不再对冲，改发的请求即为新的首选
+                hedge_at = None
+
+        # 关闭其余请求：仍在等待首 token 的按取消时的等待时间下限计入模型，
+        # 同时到达首 token 的按实际值计入；超时时没有胜出请求，被关闭的请求不算额外请求
+        now = time.perf_counter()
+        prompt_tokens = None
+        for attempt in attempts:
+            if attempt is winner or attempt.error is not None:
+                continue
+            attempt.cancel()
+            self.observe(attempt.provider.name, attempt.ttft if attempt.done else now - attempt.started)
+            if winner is None:
+                continue
+            if prompt_tokens is None:
+                prompt_tokens = count_message_tokens(messages)
+            with self._lock:
+                self.metrics.extra_requests += 1
+                self.metrics.extra_prompt_tokens += prompt_tokens
+
+        if winner is None:
+            with self._lock:
+                self.metrics.errors += 1
+            raise last_error
+
+        routed = self._record_win(winner, primary, hedged, now)
+        return RoutedStream(self, winner, hedged, routed)
+
+    def _record_win(self, winner: _Attempt, primary: _Attempt, hedged: bool, now: float) -> float:
+        """记录胜出请求，并估算不对冲时的首 token 时间；返回调用方看到的首 token 时间"""
+        # 调用方看到的首 token 时间从首选请求发出时算起
+        routed = winner.started + winner.ttft - primary.started
+        unhedged = routed
+        saved = 0.0
+        if winner is not primary and primary.error is None and hedged:
+            # 首选服务商在 routed 时仍无首 token，按其模型中超过该值的样本估算它本来的首 token 时间
+            with self._lock:
+                tail = self.models[primary.provider.name].tail_mean(routed, time.monotonic())
+            unhedged = tail if tail is not None else routed
+            saved = unhedged - routed
+
+        self.observe(winner.provider.name, winner.ttft)
+        timestamp = time.monotonic()
+        with self._lock:
+            metrics = self.metrics
+            if hedged and winner is not primary:
+                metrics.hedge_wins += 1
+            metrics.ttft_saved += saved
+            metrics.wins[winner.provider.name] = metrics.wins.get(winner.provider.name, 0) + 1
+            metrics.routed_ttft.add(routed, timestamp)
+            metrics.unhedged_ttft.add(unhedged, timestamp)
+        return routed
+
+    def start_probes(self, messages: List[dict], interval: float = 60.0, max_tokens: Optional[int] = None):
+        """为每个服务商启动后台探测线程，按固定间隔发送请求并更新延迟模型，直到 close()"""
+        for index, provider in enumerate(self.providers):
+            thread = threading.Thread(
+                target=self._probe_loop,
+                args=(provider, messages, interval, index * interval / len(self.providers), max_tokens),
+                daemon=True
+            )
+            thread.start()
+            self._probes.append(thread)
+
+    def _probe_loop(self, provider: BaseProvider, messages: List[dict], interval: float, offset: float,
+                    max_tokens: Optional[int]):
+        tester = APITester(
+            buffer_output=True,
+            verbose=False,
+            metrics_only=True,
+            raw_sse=self.config.raw_sse,
+            timeout=self.config.timeout
+        )
+        next_run = time.monotonic() + offset
+        while not self._stop.wait(max(0.0, next_run - time.monotonic())):
+            self.observe_result(provider.name, tester.test_provider(provider, messages, max_tokens=max_tokens))
+            next_run = max(next_run + interval, time.monotonic())
+
+    def close(self):
+        """停止后台探测"""
+        self._stop.set()
+        for thread in self._probes:
+            thread.join()
+        self._probes = []
+
+    def snapshot(self) -> dict:
+        """当前指标：对冲比例、胜出次数、尾延迟节省和额外成本"""
+        now = time.monotonic()
+        with self._lock:
+            metrics = self.metrics
+            routed = metrics.routed_ttft.values(now)
+            unhedged = metrics.unhedged_ttft.values(now)
+            tail = {}
+            for quantile in QUANTILES:
+                actual, estimate = percentile(routed, quantile * 100), percentile(unhedged, quantile * 100)
+                tail[quantile] = {
+                    'routed': actual,
+                    'unhedged': estimate,
+                    'saved': estimate - actual if routed else None,
+                }
+            return {
+                'requests': metrics.requests,
+                'errors': metrics.errors,
+                'hedged': metrics.hedged,
+                'hedge_wins': metrics.hedge_wins,
+                'failovers': metrics.failovers,
+                'hedge_ratio': metrics.hedged / metrics.requests if metrics.requests else 0.0,
+                'extra_requests': metrics.extra_requests,
+                'extra_request_ratio': metrics.extra_requests / metrics.requests if metrics.requests else 0.0,
+                'extra_prompt_tokens': metrics.extra_prompt_tokens,
+                'ttft_saved_seconds': metrics.ttft_saved,
+                'wins': dict(metrics.wins),
+                'ttft': tail,
+            }
+
+    def render(self) -> str:
+        """生成 Prometheus 文本格式，可直接交给 daemon.MetricsServer 暴露"""
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {METRIC_PREFIX}_router_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_router_{name} {kind}")
+            for labels, value in samples:
+                if value is not None:
+                    lines.append(f"{METRIC_PREFIX}_router_{name}{_labels(**labels) if labels else ''} {_format_value(value)}")
+
+        for name, help_text in (
+            ('requests', 'Requests routed.'),
+            ('errors', 'Requests for which every provider failed before the first token.'),
+            ('hedged', 'Requests that sent a hedge request.'),
+            ('hedge_wins', 'Hedge requests that produced the first token before the primary.'),
+            ('failovers', 'Retries on the next provider after an error before the first token.'),
+            ('extra_requests', 'Cancelled requests, i.e. requests sent in addition to the winners.'),
+            ('extra_prompt_tokens', 'Estimated input tokens of cancelled requests.'),
+            ('ttft_saved_seconds', 'Estimated time to first token saved by winning hedges.'),
+        ):
+            metric(f'{name}_total', 'counter', help_text, [({}, snapshot[name])])
+        metric('wins_total', 'counter', 'Winning requests by provider.',
+               [({'provider': provider}, count) for provider, count in sorted(snapshot['wins'].items())])
+        window = f'over the last {self.config.window:g} seconds'
+        for series, help_text in (
+            ('routed', f'Time to first token seen by callers, quantiles {window}.'),
+            ('unhedged', f'Estimated time to first token without hedging, quantiles {window}.'),
+        ):
+            metric(f'{series}_ttft_seconds', 'gauge', help_text,
+                   [({'quantile': quantile}, values[series]) for quantile, values in snapshot['ttft'].items()])
+        return '\n'.join(lines) + '\n'
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='通过对冲请求路由器发送请求，打印每个请求的胜出服务商和对冲指标')
+    parser.add_argument('--providers', type=str, default=None, help='参与路由的服务商，与 basetest.py 相同（默认：全部）')
+    parser.add_argument('--models', type=str, default=None, help='只使用模型名匹配的组合，支持 * 通配符')
+    parser.add_argument('--registry', type=str, default=None, help='服务商注册表（TOML）路径')
+    parser.add_argument('--requests', type=int, default=20, help='发送的请求数（默认：20）')
+    parser.add_argument('--prompt', type=str, default="给我写一首七言绝句，赞叹祖国的大好河山", help='请求的提示词')
+    parser.add_argument('--max-tokens', type=int, default=None, help='每个请求的输出 token 上限')
+    parser.add_argument('--hedge-percentile', type=float, default=90.0, help='首 token 等待超过该分位数时发出对冲请求（默认：90）')
+    parser.add_argument('--max-hedge-ratio', type=float, default=0.2, help='被对冲的请求最多占全部请求的比例（默认：0.2）')
+    parser.add_argument('--seed', type=str, default=None, help='用历史运行初始化延迟模型：结果文件、报告路径、latest/previous 或 run_id')
+    parser.add_argument('--probe-interval', type=float, default=None, help='后台探测间隔（秒）（默认：不探测）')
+    parser.add_argument('--metrics-port', type=int, default=None, help='在该端口暴露 /metrics（默认：不暴露）')
+    parser.add_argument('--timeout', type=float, default=120, help='单个请求的截止时间（秒）（默认：120）')
+    parser.add_argument('--raw-sse', action='store_true', help='直接解析 SSE 字节流，跳过 SDK 对象构造')
+    return parser.parse_args()
+
+def main():
+    """命令行入口"""
+    from basetest import initialize_providers
+    from daemon import MetricsServer
+
+    args = parse_args()
+    providers = initialize_providers(args.providers, args.models, args.registry)
+    router = HedgedRouter(providers, RouterConfig(
+        hedge_percentile=args.hedge_percentile,
+        max_hedge_ratio=args.max_hedge_ratio,
+        timeout=args.timeout,
+        raw_sse=args.raw_sse
+    ))
+    messages = [{'role': 'user', 'content': args.prompt}]
+
+    if args.seed:
+        from compare import load_run
+        name, rows = load_run(args.seed)
+        print(f"已用运行 {name} 的 {router.seed(rows)} 个结果初始化延迟模型")
+    if args.probe_interval:
+        router.start_probes(messages, args.probe_interval, args.max_tokens)
+    server = None
+    if args.metrics_port is not None:
+        server = MetricsServer(router, '127.0.0.1', args.metrics_port)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"指标端点已启动：{server.url}")
+
+    try:
+        for index in range(args.requests):
+            try:
+                with router.stream(messages, args.max_tokens) as stream:
+                    for _ in stream:
+                        pass
+                note = "，对冲" if stream.hedged else ""
+                print(f"请求 {index + 1}/{args.requests}：{stream.provider}，首 token {stream.ttft:.3f} 秒{note}")
+            except Exception as e:
+                print(f"请求 {index + 1}/{args.requests} 失败：{e}")
+    finally:
+        router.close()
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    snapshot = router.snapshot()
+    print(f"\n请求 {snapshot['requests']} 个，对冲 {snapshot['hedged']} 个（对冲胜出 {snapshot['hedge_wins']} 个），"
+          f"改发 {snapshot['failovers']} 次，失败 {snapshot['errors']} 个")
+    print(f"额外请求 {snapshot['extra_requests']} 个（{snapshot['extra_request_ratio']:.1%}），"
+          f"估算额外输入 {snapshot['extra_prompt_tokens']} tokens")
+    for quantile, values in snapshot['ttft'].items():
+        if values['routed'] is not None:
+            print(f"首 token 时间 P{quantile * 100:g}：{values['routed']:.3f} 秒，"
+                  f"不对冲估算 {values['unhedged']:.3f} 秒，节省 {values['saved']:.3f} 秒")
+    print("胜出次数：" + "，".join(f"{name} {count}" for name, count in sorted(snapshot['wins'].items())))
+
+if __name__ == "__main__":
+    main()
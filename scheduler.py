@@ -0,0 +1,319 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from dataclasses import dataclass, field
+from tester import APITester, TestResult, percentile
+from providers import BaseProvider
+
+@dataclass
+class SchedulerConfig:
+    """自适应并发调度配置"""
+    max_concurrency: int = 32             # 并发上限
+    initial_concurrency: int = 1          # 起始并发数
+    increase_step: int = 1                # 健康窗口后并发数的加性增量
+    backoff_factor: float = 0.5           # 退化窗口后并发数的乘性减小系数
+    window: float = 20.0                  # 每个并发等级的测量窗口（秒）
+    max_windows: int = 20                 # 每个服务商最多测量的窗口数
+    max_backoffs: int = 3                 # 退避达到该次数后结束探测
+    rate_limit: Optional[float] = None    # 每个服务商的请求配额（请求/秒），None 表示不限制
+    burst: Optional[int] = None           # 令牌桶容量，默认等于一秒的配额
+    latency_tolerance: float = 1.5        # 首 token 时间中位数超过基线的倍数时视为延迟退化
+    max_error_rate: float = 0.1           # 错误率超过该值时视为退化
+    default_retry_after: float = 1.0      # 限流响应未给出 Retry-After 时的暂停时间（秒）
+    timeout: Optional[float] = None       # 单个请求的截止时间（秒）
+    stall_timeout: Optional[float] = None # 开始输出后两个分块之间允许的最长间隔（秒）
+    raw_sse: bool = False                 # 直接解析 SSE 字节流，跳过 SDK 对象构造
+
+@dataclass
+class WindowResult:
+    """单个并发等级窗口的测量结果"""
+    concurrency: int
+    elapsed: float
+    completed: int
+    throttled: int
+    errors: int
+    ttft_p50: Optional[float]
+    throughput: float             # 窗口内总输出 tokens / 窗口时长
+    decision: str = ''            # increase、backoff 或 stop
+
+    @property
+    def requests_per_second(self) -> float:
+        return self.completed / self.elapsed if self.elapsed > 0 else 0
+
+    @property
+    def error_rate(self) -> float:
+        attempts = self.completed + self.throttled + self.errors
+        return (self.throttled + self.errors) / attempts if attempts else 0
+
+@dataclass
+class SchedulerResult:
+    """单个服务商的自适应并发探测结果"""
+    provider: str
+    windows: List[WindowResult] = field(default_factory=list)
+    best: Optional[WindowResult] = None  # 吞吐量最高的健康窗口，即最大可持续并发
+
+    @property
+    def throttled(self) -> int:
+        return sum(w.throttled for w in self.windows)
+
+    @property
+    def errors(self) -> int:
+        return sum(w.errors for w in self.windows)
+
+def retry_after_seconds(error) -> Optional[float]:
+    """从限流错误的响应头中读取 Retry-After（秒），没有则返回 None"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    value = headers.get('retry-after-ms')
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if value is not None:
+        try:
+            return float(value)
+        except ValueError:
+            # HTTP 日期格式
+            from email.utils import parsedate_to_datetime
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+    return None
+
+def is_rate_limited(error) -> bool:
+    """判断错误是否为限流（HTTP 429）"""
+    return getattr(error, 'status_code', None) == 429
+
+class TokenBucket:
+    """
+    服务商级别的令牌桶
+
+    每个请求发送前取一个令牌；收到限流响应后按 Retry-After 暂停发放。
+    rate 为 None 时只执行暂停，不限制速率。
+    """
+
+    def __init__(self, rate: Optional[float] = None, capacity: Optional[int] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate or 1))
+        self.tokens = float(self.capacity)
+        self.updated = time.perf_counter()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """阻塞直到取得一个令牌"""
+        while True:
+            with self._lock:
+                now = time.perf_counter()
+                wait = self.paused_until - now
+                if wait <= 0:
+                    if self.rate is None:
+                        return
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """在接下来的 seconds 秒内停止发放令牌"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.perf_counter() + seconds)
+            self.tokens = 0.0
+            self.updated = self.paused_until
+
+class _WindowSamples:
+    """单个窗口内收集到的样本"""
+
+    def __init__(self):
+        self.results: List[TestResult] = []
+        self.throttled = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+class AdaptiveScheduler:
+    """
+    自适应并发调度器（AIMD）
+
+    对每个服务商按窗口逐步提高并发：窗口内无限流、错误率和首 token 时间
+    未退化时加性增加并发，否则乘性减小；收到 429 时按 Retry-After 暂停
+    该服务商的令牌桶。最终报告吞吐量最高的健康窗口作为最大可持续并发。
+    """
+
+    def __init__(self, config: SchedulerConfig = None):
+        self.config = config or SchedulerConfig()
+        self._print_lock = threading.Lock()
+
+    def test_providers(self, providers: List[BaseProvider], messages: List[dict]) -> List[SchedulerResult]:
+        """
+        对多个提供商同时进行自适应并发探测
+
+        Args:
+            providers: 提供商实例列表
+            messages: 测试消息列表
+
+        Returns:
+            list: 每个服务商的探测结果
+        """
+        active_providers = [p for p in providers if p.is_available()]
+
+        if not active_providers:
+            print("没有可用的服务商")
+            return []
+
+        # SDK 内部重试会吞掉 429 并把退避时间计入请求耗时，探测时由调度器自己处理限流；
+        # 使用关闭重试的副本，不改变调用方的服务商实例
+        active_providers = [provider.without_retries() for provider in active_providers]
+
+        results = {provider.name: SchedulerResult(provider=provider.name) for provider in active_providers}
+        threads = [
+            threading.Thread(
+                target=self._probe,
+                args=(provider, messages, results[provider.name]),
+                daemon=True
+            )
+            for provider in active_providers
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return [results[name] for name in sorted(results)]
+
+    def _log(self, message: str):
+        with self._print_lock:
+            print(message)
+
+    def _probe(self, provider: BaseProvider, messages: List[dict], result: SchedulerResult):
+        """对单个服务商执行 AIMD 探测（在独立线程中运行）"""
+        config = self.config
+        bucket = TokenBucket(config.rate_limit, config.burst)
+        concurrency = max(1, min(config.initial_concurrency, config.max_concurrency))
+        baseline_ttft = None
+        backoffs = 0
+
+        with ThreadPoolExecutor(max_workers=config.max_concurrency) as executor:
+            for _ in range(config.max_windows):
+                self._log(f"\n服务商 {provider.name} 开始测量窗口：并发 {concurrency}，持续 {config.window} 秒")
+                window = self._run_window(provider, messages, concurrency, bucket, executor)
+                result.windows.append(window)
+
+                degraded = self._degradation(window, baseline_ttft)
+                if degraded is None:
+                    if window.ttft_p50 is not None:
+                        baseline_ttft = window.ttft_p50 if baseline_ttft is None else min(baseline_ttft, window.ttft_p50)
+                    if result.best is None or window.throughput > result.best.throughput:
+                        result.best = window
+                    if concurrency >= config.max_concurrency:
+                        window.decision = 'stop'
+                        self._log(f"服务商 {provider.name} 在并发上限 {concurrency} 下仍然健康，结束探测")
+                        break
+                    window.decision = 'increase'
+                    concurrency = min(config.max_concurrency, concurrency + config.increase_step)
+                else:
+                    backoffs += 1
+                    window.decision = 'backoff'
+                    previous = concurrency
+                    concurrency = max(1, int(concurrency * config.backoff_factor))
+                    self._log(f"服务商 {provider.name} 在并发 {previous} 下{degraded}，并发降至 {concurrency}")
+                    if backoffs >= config.max_backoffs:
+                        window.decision = 'stop'
+                        self._log(f"服务商 {provider.name} 已退避 {backoffs} 次，结束探测")
+                        break
+
+        if result.best:
+            self._log(
+                f"\n服务商 {provider.name} 最大可持续并发：{result.best.concurrency}，"
+                f"吞吐量 {result.best.throughput:.2f} tokens/s"
+            )
+        else:
+            self._log(f"\n服务商 {provider.name} 没有健康的测量窗口")
+
+    def _degradation(self, window: WindowResult, baseline_ttft: Optional[float]) -> Optional[str]:
+        """判断窗口是否退化，返回原因；健康时返回 None"""
+        if window.throttled:
+            return f"被限流 {window.throttled} 次"
+        if window.completed == 0 or window.error_rate > self.config.max_error_rate:
+            return f"错误率 {window.error_rate:.1%}"
+        if (baseline_ttft is not None and window.ttft_p50 is not None
+                and window.ttft_p50 > baseline_ttft * self.config.latency_tolerance):
+            return f"首 token 时间中位数升至 {window.ttft_p50:.2f} 秒（基线 {baseline_ttft:.2f} 秒）"
+        return None
+
+    def _run_window(
+        self,
+        provider: BaseProvider,
+        messages: List[dict],
+        concurrency: int,
+        bucket: TokenBucket,
+        executor: ThreadPoolExecutor
+    ) -> WindowResult:
+        """以固定并发闭环发送请求直到窗口结束，并等待在途请求完成"""
+        samples = _WindowSamples()
+        start = time.perf_counter()
+        window_end = start + self.config.window
+
+        futures = [
+            executor.submit(self._run_slot, provider, messages, bucket, window_end, samples)
+            for _ in range(concurrency)
+        ]
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - start
+
+        ttfts = [r.first_token_time for r in samples.results if r.first_token_time is not None]
+        output_tokens = sum(r.reasoning_tokens + r.content_tokens for r in samples.results)
+        return WindowResult(
+            concurrency=concurrency,
+            elapsed=elapsed,
+            completed=len(samples.results),
+            throttled=samples.throttled,
+            errors=samples.errors,
+            ttft_p50=percentile(ttfts, 50),
+            throughput=output_tokens / elapsed if elapsed > 0 else 0
+        )
+
+    def _run_slot(
+        self,
+        provider: BaseProvider,
+        messages: List[dict],
+        bucket: TokenBucket,
+        window_end: float,
+        samples: _WindowSamples
+    ):
+        """单个并发槽：窗口结束前依次发送请求"""
+        tester = APITester(
+            buffer_output=True,
+            verbose=False,
+            metrics_only=True,
+            raw_sse=self.config.raw_sse,
+            timeout=self.config.timeout,
+            stall_timeout=self.config.stall_timeout
+        )
+        while True:
+            bucket.acquire()
+            if time.perf_counter() >= window_end:
+                return
+
+            result = tester.test_provider(provider, messages)
+
+            with samples.lock:
+                if result and result.status == 'ok':
+                    samples.results.append(result)
+                elif tester.last_error is not None and is_rate_limited(tester.last_error):
+                    samples.throttled += 1
+                else:
+                    samples.errors += 1
+
+            if tester.last_error is not None and is_rate_limited(tester.last_error):
+                wait = retry_after_seconds(tester.last_error)
+                bucket.pause(wait if wait is not None else self.config.default_retry_after)
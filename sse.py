@@ -0,0 +1,191 @@
+"""
+Low-overhead Server-Sent Events parser for chat completion streams
+
+Parses the raw byte stream directly and extracts only the fields APITester
+reads (delta content/reasoning_content and usage), instead of building full
+pydantic ChatCompletionChunk objects for every chunk. The lightweight objects
+expose the same attribute names, so the regular chunk processing works on both.
+"""
+import json
+from typing import AsyncIterator, Iterator, Optional
+
+class RawCompletionTokensDetails:
+    __slots__ = ('reasoning_tokens',)
+
+    def __init__(self, data: dict):
+        self.reasoning_tokens = data.get('reasoning_tokens') or 0
+
+    def __repr__(self):
+        return f"RawCompletionTokensDetails(reasoning_tokens={self.reasoning_tokens})"
+
+class RawUsage:
+    __slots__ = ('prompt_tokens', 'completion_tokens', 'total_tokens', 'completion_tokens_details', 'raw')
+
+    def __init__(self, data: dict):
+        self.prompt_tokens = data.get('prompt_tokens') or 0
+        self.completion_tokens = data.get('completion_tokens') or 0
+        self.total_tokens = data.get('total_tokens') or 0
+        details = data.get('completion_tokens_details')
+        self.completion_tokens_details = RawCompletionTokensDetails(details) if details else None
+        self.raw = data
+
+    def __repr__(self):
+        return f"RawUsage({self.raw})"
+
+class RawDelta:
+    __slots__ = ('content', 'reasoning_content')
+
+    def __init__(self, data: dict):
+        self.content = data.get('content')
+        self.reasoning_content = data.get('reasoning_content')
+
+class RawChoice:
+    __slots__ = ('delta',)
+
+    def __init__(self, data: dict):
+        self.delta = RawDelta(data.get('delta') or {})
+
+class RawChunk:
+    __slots__ = ('choices', 'usage')
+
+    def __init__(self, data: dict):
+        choices = data.get('choices')
+        self.choices = [RawChoice(choices[0])] if choices else []
+        usage = data.get('usage')
+        self.usage = RawUsage(usage) if usage else None
+
+class SSEStreamError(RuntimeError):
+    """Error event received in the middle of a stream"""
+
+def parse_event(payload: bytes) -> Optional[RawChunk]:
+    """
+    Parse the data payload of a single SSE event
+
+    Returns:
+        RawChunk, or None for the terminating [DONE] event
+    """
+    if payload == b'[DONE]':
+        return None
+    data = json.loads(payload)
+    if 'error' in data:
+        error = data['error']
+        message = error.get('message', error) if isinstance(error, dict) else error
+        raise SSEStreamError(f"服务端在流中返回错误：{message}")
+    return RawChunk(data)
+
+class _LineSplitter:
+    """Split arbitrary byte chunks into SSE data payloads"""
+
+    def __init__(self):
+        self._pending = b''
+
+    def feed(self, data: bytes):
+        buffer = self._pending + data if self._pending else data
+        lines = buffer.split(b'\n')
+        self._pending = lines.pop()
+        for line in lines:
+            if line.startswith(b'data:'):
+                yield line[5:].strip()
+
+    def finish(self):
+        line, self._pending = self._pending, b''
+        if line.startswith(b'data:'):
+            yield line[5:].strip()
+
+def iter_raw_chunks(byte_chunks: Iterator[bytes]) -> Iterator[RawChunk]:
+    """
+    Yield RawChunks from an iterator of raw response bytes
+
+    The body is read to the end after [DONE], as the SDK does, so that the
+    connection goes back to the pool instead of being closed with unread data.
+    """
+    splitter = _LineSplitter()
+    for data in byte_chunks:
+        for payload in splitter.feed(data):
+            chunk = parse_event(payload)
+            if chunk is None:
+                for _ in byte_chunks:
+                    pass
+                return
+            yield chunk
+    for payload in splitter.finish():
+        chunk = parse_event(payload)
+        if chunk is None:
+            return
+        yield chunk
+
+async def aiter_raw_chunks(byte_chunks: AsyncIterator[bytes]) -> AsyncIterator[RawChunk]:
+    """Yield RawChunks from an async iterator of raw response bytes, reading the body to the end after [DONE]"""
+    splitter = _LineSplitter()
+    async for data in byte_chunks:
+        for payload in splitter.feed(data):
+            chunk = parse_event(payload)
+            if chunk is None:
+                async for _ in byte_chunks:
+                    pass
+                return
+            yield chunk
+    for payload in splitter.finish():
+        chunk = parse_event(payload)
+        if chunk is None:
+            return
+        yield chunk
+
+class RawChunkStream:
+    """
+    Synchronous stream of RawChunks over an SDK streaming-response context
+
+    The request is sent on construction; close() releases the connection and
+    may be called from another thread to abort a blocked read.
+    """
+
+    def __init__(self, response_context):
+        self._context = response_context
+        response = response_context.__enter__()
+        self.response = response.http_response
+        self._chunks = iter_raw_chunks(response.iter_bytes())
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> RawChunk:
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._context.__exit__(None, None, None)
+
+class AsyncRawChunkStream:
+    """Async counterpart of RawChunkStream; create with AsyncRawChunkStream.open()"""
+
+    def __init__(self, response_context, response):
+        self._context = response_context
+        self.response = response.http_response
+        self._chunks = aiter_raw_chunks(response.iter_bytes())
+        self._closed = False
+
+    @classmethod
+    async def open(cls, response_context) -> 'AsyncRawChunkStream':
+        response = await response_context.__aenter__()
+        return cls(response_context, response)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> RawChunk:
+        try:
+            return await self._chunks.__anext__()
+        except StopAsyncIteration:
+            await self.close()
+            raise
+
+    async def close(self):
+        if not self._closed:
+            self._closed = True
+            await self._context.__aexit__(None, None, None)
@@ -0,0 +1,224 @@
+import math
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Dict, Tuple
+import numpy as np
+
+# 排名可选指标：名称（同 ProviderAggregate 的属性名）-> (从 TestResult 取值的函数, 是否越大越好)
+RANK_METRICS = {
+    'tokens_per_second': (lambda r: r.output_tokens_per_second, True),
+    'ttft': (lambda r: r.first_token_time, False),
+}
+
+@dataclass
+class MetricSummary:
+    """单个指标在多次试验上的汇总"""
+    n: int
+    mean: float
+    median: float
+    ci_low: Optional[float]    # 均值的 bootstrap 置信区间下界（样本数不足时为 None）
+    ci_high: Optional[float]
+
+@dataclass
+class ProviderAggregate:
+    """单个服务商在多次试验上的汇总结果"""
+    provider: str
+    trials: int                               # 计划的正式试验次数
+    successes: int                            # 成功返回结果的次数
+    ttft: Optional[MetricSummary]             # 已预热连接上的首 token 时间（没有预热样本时为全部样本）
+    tokens_per_second: Optional[MetricSummary]
+    itl_p99: Optional[MetricSummary] = None
+    cold_ttft: Optional[MetricSummary] = None # 需要新建连接（DNS/TCP/TLS）时的首 token 时间
+    rank: Optional[int] = None
+    tied_with_previous: bool = False          # 与上一名的差异在统计上不显著
+
+    @property
+    def error_rate(self) -> float:
+        return 1 - self.successes / self.trials if self.trials else 0
+
+def bootstrap_means(values: np.ndarray, rng: np.random.Generator, resamples: int) -> np.ndarray:
+    """对样本有放回重采样，返回每次重采样的均值"""
+    indices = rng.integers(0, len(values), size=(resamples, len(values)))
+    return values[indices].mean(axis=1)
+
+def summarize(
+    values: Sequence[float],
+    confidence: float = 0.95,
+    resamples: int = 2000,
+    rng: Optional[np.random.Generator] = None
+) -> Optional[MetricSummary]:
+    """
+    计算均值、中位数以及均值的 bootstrap 置信区间
+
+    Args:
+        values: 样本值
+        confidence: 置信水平
+        resamples: bootstrap 重采样次数
+        rng: 随机数生成器（默认使用固定种子，保证报告可复现）
+
+    Returns:
+        MetricSummary，没有样本时返回 None
+    """
+    data = np.asarray([v for v in values if v is not None], dtype=float)
+    if data.size == 0:
+        return None
+
+    ci_low = ci_high = None
+    if data.size > 1:
+        rng = rng or np.random.default_rng(0)
+        means = bootstrap_means(data, rng, resamples)
+        alpha = (1 - confidence) / 2 * 100
+        ci_low, ci_high = np.percentile(means, [alpha, 100 - alpha])
+
+    return MetricSummary(
+        n=int(data.size),
+        mean=float(data.mean()),
+        median=float(np.median(data)),
+        ci_low=None if ci_low is None else float(ci_low),
+        ci_high=None if ci_high is None else float(ci_high)
+    )
+
+def difference_ci(
+    a: Sequence[float],
+    b: Sequence[float],
+    confidence: float = 0.95,
+    resamples: int = 2000,
+    rng: Optional[np.random.Generator] = None
+) -> Optional[Tuple[float, float]]:
+    """
+    均值差 mean(a) - mean(b) 的 bootstrap 置信区间
+
+    Returns:
+        (下界, 上界)，任一组少于 2 个样本时返回 None
+    """
+    a = np.asarray([v for v in a if v is not None], dtype=float)
+    b = np.asarray([v for v in b if v is not None], dtype=float)
+    if a.size < 2 or b.size < 2:
+        return None
+
+    rng = rng or np.random.default_rng(0)
+    diffs = bootstrap_means(a, rng, resamples) - bootstrap_means(b, rng, resamples)
+    alpha = (1 - confidence) / 2 * 100
+    low, high = np.percentile(diffs, [alpha, 100 - alpha])
+    return float(low), float(high)
+
+def significantly_different(
+    a: Sequence[float],
+    b: Sequence[float],
+    confidence: float = 0.95,
+    resamples: int = 2000,
+    rng: Optional[np.random.Generator] = None
+) -> bool:
+    """
+    两组样本的均值差异是否显著：均值差的 bootstrap 置信区间不包含 0
+
+    任一组少于 2 个样本时无法判断，视为不显著。
+    """
+    interval = difference_ci(a, b, confidence, resamples, rng)
+    return interval is not None and (interval[0] > 0 or interval[1] < 0)
+
+def rate_increase_p_value(failures_a: int, n_a: int, failures_b: int, n_b: int) -> float:
+    """
+    单侧 Fisher 精确检验：b 组失败比例高于 a 组的 p 值
+
+    在两组失败总数固定的条件下，b 组出现不少于 failures_b 次失败的超几何概率。
+    """
+    failures = failures_a + failures_b
+    if n_a == 0 or n_b == 0 or failures == 0:
+        return 1.0
+    tail = sum(
+        math.comb(n_b, k) * math.comb(n_a, failures - k)
+        for k in range(failures_b, min(n_b, failures) + 1)
+    )
+    return tail / math.comb(n_a + n_b, failures)
+
+def aggregate_results(
+    results: List,
+    trials: int,
+    providers: Sequence[str] = (),
+    rank_by: str = 'tokens_per_second',
+    confidence: float = 0.95
+) -> List[ProviderAggregate]:
+    """
+    按服务商汇总多次试验结果并排名
+
+    Args:
+        results: TestResult 列表（同一服务商可出现多次）
+        trials: 每个服务商计划的正式试验次数，用于计算错误率
+        providers: 参与测试的服务商名称，全部试验失败的服务商也会出现在结果中
+        rank_by: 排名指标，见 RANK_METRICS
+        confidence: 置信水平
+
+    Returns:
+        按排名排序的 ProviderAggregate 列表；与上一名差异不显著的标记 tied_with_previous
+    """
+    metric, higher_is_better = RANK_METRICS[rank_by]
+
+    # 被截止时间或停顿中断的部分结果计为失败，不参与指标统计
+    grouped: Dict[str, List] = {name: [] for name in providers}
+    for result in results:
+        if result and result.status == 'ok':
+            grouped.setdefault(result.provider, []).append(result)
+
+    samples = {}
+    aggregates = []
+    for provider, provider_results in grouped.items():
+        # 首 token 时间只用已预热连接的样本，避免把握手时间算作模型服务延迟
+        warm_results = [r for r in provider_results if r.connection != 'cold'] or provider_results
+        samples[provider] = [metric(r) for r in (warm_results if rank_by == 'ttft' else provider_results)]
+        aggregates.append(ProviderAggregate(
+            provider=provider,
+            trials=max(trials, len(provider_results)),
+            successes=len(provider_results),
+            ttft=summarize([r.first_token_time for r in warm_results], confidence),
+            cold_ttft=summarize([r.first_token_time for r in provider_results if r.connection == 'cold'], confidence),
+            tokens_per_second=summarize([RANK_METRICS['tokens_per_second'][0](r) for r in provider_results], confidence),
+            itl_p99=summarize([r.itl_p99 for r in provider_results], confidence)
+        ))
+
+    def sort_key(aggregate):
+        summary = getattr(aggregate, rank_by)
+        if summary is None:
+            return (1, 0)
+        return (0, -summary.mean if higher_is_better else summary.mean)
+
+    aggregates.sort(key=sort_key)
+    ranked = [a for a in aggregates if getattr(a, rank_by) is not None]
+    for index, aggregate in enumerate(ranked):
+        aggregate.rank = index + 1
+        if index > 0:
+            previous = ranked[index - 1]
+            aggregate.tied_with_previous = not significantly_different(
+                samples[previous.provider], samples[aggregate.provider], confidence
+            )
+
+    return aggregates
+
+@dataclass
+class LinearFit:
+    """最小二乘直线 y = intercept + slope * x"""
+    slope: float
+    intercept: float
+    r_squared: Optional[float]
+
+def linear_fit(xs: Sequence[float], ys: Sequence[float]) -> Optional[LinearFit]:
+    """
+    最小二乘拟合直线，用于估计首 token 时间随输入 token 数的增长（预填充速度）
+
+    Returns:
+        LinearFit，有效样本少于 2 个或 x 全部相同时返回 None
+    """
+    pairs = [(x, y) for x, y in zip(xs, ys) if x is not None and y is not None]
+    if len(pairs) < 2:
+        return None
+    x = np.asarray([p[0] for p in pairs], dtype=float)
+    y = np.asarray([p[1] for p in pairs], dtype=float)
+    if np.ptp(x) == 0:
+        return None
+    slope, intercept = np.polyfit(x, y, 1)
+    residual = float(np.sum((y - (intercept + slope * x)) ** 2))
+    total = float(np.sum((y - y.mean()) ** 2))
+    return LinearFit(
+        slope=float(slope),
+        intercept=float(intercept),
+        r_squared=1 - residual / total if total > 0 else None
+    )
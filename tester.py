@@ -1,6 +1,229 @@
+import itertools
+import math
+import re
+import socket
+import threading
 import time
-from dataclasses import dataclass
-from typing import Optional, Dict, Any
+from array import array
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict, Any, Sequence, Tuple
+from tokens import TokenEstimator, count_message_tokens, estimator_name, get_encoder
+import http_pool
+import profiling
+import timeline
+import traces
+
+def percentile(values: Sequence[float], q: float, presorted: bool = False) -> Optional[float]:
+    """
+    Linear-interpolated percentile of a sequence
+    
+    Args:
+        values: Sample values (need not be sorted)
+        q: Percentile in the range [0, 100]
+        presorted: values are already in ascending order; skips the sort when
+            several percentiles are taken from the same samples
+    
+    Returns:
+        float: Percentile value, or None for an empty sequence
+    """
+    if not values:
+        return None
+    ordered = values if presorted else sorted(values)
+    rank = (len(ordered) - 1) * q / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+def cache_tokens(usage) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Prompt cache hit and miss token counts from a usage payload
+    
+    DeepSeek reports prompt_cache_hit_tokens and prompt_cache_miss_tokens;
+    OpenAI-style APIs report prompt_tokens_details.cached_tokens, in which case
+    the misses are the rest of the prompt. Works on raw SSE and SDK usage objects.
+    
+    Returns:
+        (hit, miss), None where the provider does not report it
+    """
+    raw = getattr(usage, 'raw', None)
+    
+    def get(source, name):
+        return source.get(name) if isinstance(source, dict) else getattr(source, name, None)
+    
+    source = raw if raw is not None else usage
+    hit = get(source, 'prompt_cache_hit_tokens')
+    miss = get(source, 'prompt_cache_miss_tokens')
+    if hit is None:
+        details = get(source, 'prompt_tokens_details')
+        hit = get(details, 'cached_tokens') if details is not None else None
+        prompt_tokens = get(source, 'prompt_tokens')
+        if hit is not None and miss is None and prompt_tokens is not None:
+            miss = prompt_tokens - hit
+    return hit, miss
+
+class LatencyHistogram:
+    """
+    Fixed-size log-bucketed histogram for latency samples
+    
+    Memory stays constant regardless of the number of samples; percentiles
+    are accurate to within one bucket (about 5% relative error).
+    """
+    
+    MIN_VALUE = 1e-4   # 0.1 ms
+    MAX_VALUE = 600.0  # 10 minutes
+    GROWTH = 1.05
+    
+    def __init__(self):
+        self._log_growth = math.log(self.GROWTH)
+        size = int(math.log(self.MAX_VALUE / self.MIN_VALUE) / self._log_growth) + 2
+        self.counts = array('L', bytes(array('L').itemsize * size))
+        self.count = 0
+        self.max = None
+    
+    def add(self, value: float):
+        """Record a single sample"""
+        if value <= self.MIN_VALUE:
+            index = 0
+        else:
+            index = min(int(math.log(value / self.MIN_VALUE) / self._log_growth) + 1, len(self.counts) - 1)
+        self.counts[index] += 1
+        self.count += 1
+        if self.max is None or value > self.max:
+            self.max = value
+    
+    def extend(self, values):
+        """Record many samples; same result as add() for each, with less overhead per sample"""
+        if not values:
+            return
+        counts, last = self.counts, len(self.counts) - 1
+        log, minimum, log_growth = math.log, self.MIN_VALUE, self._log_growth
+        for value in values:
+            counts[0 if value <= minimum else min(int(log(value / minimum) / log_growth) + 1, last)] += 1
+        self.count += len(values)
+        largest = max(values)
+        if self.max is None or largest > self.max:
+            self.max = largest
+    
+    def percentile(self, q: float) -> Optional[float]:
+        """Approximate percentile, reported as the geometric midpoint of the matching bucket"""
+        if not self.count:
+            return None
+        target = max(1, math.ceil(self.count * q / 100.0))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                if index == 0:
+                    return min(self.MIN_VALUE, self.max)
+                lower = self.MIN_VALUE * self.GROWTH ** (index - 1)
+                return min(lower * math.sqrt(self.GROWTH), self.max)
+        return self.max
+
+class ChunkedTextSink:
+    """Stream generated text to a file in fixed-size chunks instead of keeping it in memory"""
+    
+    _counter = itertools.count(1)
+    
+    def __init__(self, directory, provider_name: str, chunk_size: int = 64 * 1024):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        safe_name = re.sub(r'[^\w.-]+', '_', provider_name)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.path = directory / f"{safe_name}_{timestamp}_{next(self._counter)}.txt"
+        self.chunk_size = chunk_size
+        self._file = open(self.path, 'w', encoding='utf-8')
+        self._pending = []
+        self._pending_size = 0
+        self._phase = None
+    
+    def write(self, phase: str, text: str):
+        """Append text for the given phase ('reasoning' or 'content')"""
+        if phase != self._phase:
+            self._phase = phase
+            self._append(f"\n【{phase}】\n")
+        self._append(text)
+    
+    def _append(self, text: str):
+        self._pending.append(text)
+        self._pending_size += len(text)
+        if self._pending_size >= self.chunk_size:
+            self.flush()
+    
+    def flush(self):
+        """Write pending text to disk"""
+        if self._pending:
+            self._file.write(''.join(self._pending))
+            self._pending = []
+            self._pending_size = 0
+    
+    def close(self):
+        """Flush and close the underlying file"""
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+def abort_stream(response):
+    """
+    Close a streaming response, possibly from another thread
+    
+    Closing the response alone does not wake a read blocked in another thread,
+    so the socket is shut down first. Errors from an already broken stream are ignored.
+    
+    Args:
+        response: SDK Stream or sse.RawChunkStream
+    """
+    try:
+        network_stream = response.response.extensions['network_stream']
+        network_stream.get_extra_info('socket').shutdown(socket.SHUT_RDWR)
+    except Exception:
+        pass
+    try:
+        response.close()
+    except Exception:
+        pass
+
+class StreamWatchdog:
+    """
+    Background thread that enforces deadlines on synchronous streams
+    
+    A blocked read cannot be interrupted from the reading thread, so the
+    watchdog closes the response from outside once a tester's deadline or
+    stall timeout passes; the tester then returns its partial result.
+    """
+    
+    POLL_INTERVAL = 0.05
+    
+    def __init__(self):
+        self._testers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+    
+    def watch(self, tester):
+        with self._lock:
+            self._testers.add(tester)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+    
+    def unwatch(self, tester):
+        with self._lock:
+            self._testers.discard(tester)
+    
+    def _run(self):
+        while True:
+            time.sleep(self.POLL_INTERVAL)
+            with self._lock:
+                if not self._testers:
+                    self._thread = None
+                    return
+                testers = list(self._testers)
+            now = time.perf_counter()
+            for tester in testers:
+                tester._enforce_deadline(now)
+
+_watchdog = StreamWatchdog()
 
 @dataclass
 class TestResult:
@@ -13,39 +236,143 @@ class TestResult:
     content_time: float
     total_tokens: int
     total_time: float
+    itl_p50: Optional[float] = None   # Inter-token latency percentiles (seconds)
+    itl_p90: Optional[float] = None
+    itl_p99: Optional[float] = None
+    itl_max: Optional[float] = None
+    tpot: Optional[float] = None      # Time per output token after the first (seconds)
+    model: Optional[str] = None
+    connection: Optional[str] = None  # 'cold' if the request opened a new pooled connection, 'warm' if it reused one
+    status: str = 'ok'                # 'ok', or 'timeout'/'stalled' for a stream cut off with partial metrics
+    prompt_tokens: Optional[int] = None  # Input tokens reported by the provider
+    prompt_cache_hit_tokens: Optional[int] = None   # Input tokens served from the provider's prefix cache, if reported
+    prompt_cache_miss_tokens: Optional[int] = None  # Input tokens not in the prefix cache, if reported
+    workload_id: Optional[str] = None    # Workload item this result belongs to
+    tags: Optional[str] = None           # Comma-separated workload tags
+    token_source: str = 'reported'       # 'reported', 'estimated' (no usage chunk) or 'split' (reported total, estimated reasoning/content split)
+    started_at: Optional[float] = None   # Unix time the request started; distributed runs correct it to the coordinator's clock
+    worker: Optional[str] = None         # Distributed worker that ran the request
+    harness_time: Optional[float] = None       # --instrument: seconds the harness spent handling chunks
+    harness_chunk_p99: Optional[float] = None  # --instrument: P99 time to handle one chunk (seconds)
+    harness_parse_cpu: Optional[float] = None  # --instrument: CPU seconds inside the stream iterator, i.e. SDK/SSE parsing (sync only)
+    harness_blocked: Optional[float] = None    # --instrument: seconds chunk handling was runnable but not running (GIL/lock waits), or event loop lag (async)
+    timeline: Optional[Any] = field(default=None, repr=False, compare=False)  # timeline.StreamTimeline for the HTML charts; not written to result files
+    
+    @property
+    def output_tokens_per_second(self) -> Optional[float]:
+        """Generated (reasoning + content) tokens per second of total time; prompt tokens are not throughput"""
+        return (self.reasoning_tokens + self.content_tokens) / self.total_time if self.total_time > 0 else None
 
 class APITester:
     """API testing class for different providers"""
     
-    def __init__(self, buffer_output=True):
-        self.reset_metrics()
+    # Clock for all timing metrics; replay.py substitutes the recorded times
+    clock = staticmethod(time.perf_counter)
+    
+    def __init__(self, buffer_output=True, verbose=True, metrics_only=False, sink_dir=None, raw_sse=False,
+                 timeout=None, stall_timeout=None):
+        """
+        Args:
+            buffer_output: Buffer console output and print it once the test finishes
+            verbose: Print progress and results at all
+            metrics_only: Keep only counters and character lengths, never the generated text,
+                so memory stays constant regardless of output length
+            sink_dir: Optional directory to stream generated text to, one file per test
+            raw_sse: Parse the SSE byte stream directly instead of building SDK chunk objects
+            timeout: Per-request deadline in seconds; the stream is closed when it passes
+            stall_timeout: Maximum gap in seconds between chunks once streaming has started
+        """
         self.buffer_output = buffer_output
+        self.verbose = verbose
+        self.metrics_only = metrics_only
+        self.sink_dir = sink_dir
+        self.raw_sse = raw_sse
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+        self._sink = None
+        self.reset_metrics()
         self._output_buffer = []
+        # Load the tokenizer (import and vocabulary) now rather than inside the first timed stream
+        get_encoder()
     
     def reset_metrics(self):
         """Reset all metrics for a new test"""
+        self.last_error = None
         self.prompt_tokens = 0
+        self.prompt_cache_hit_tokens = None
+        self.prompt_cache_miss_tokens = None
         self.completion_tokens = 0
         self.reasoning_tokens = 0
         self.content_tokens = 0
         self.total_tokens = 0
         
-        self.reasoning_text = ""
-        self.content_text = ""
+        self._reasoning_parts = []
+        self._content_parts = []
+        self.reasoning_chars = 0
+        self.content_chars = 0
         
         self.start_time = None
+        self.started_at = None
         self.first_token_time = None
         
+        # Deadline state; status is set when the stream is cut off
+        self.deadline_at = None
+        self.last_activity = None
+        self.status = None
+        self._response = None
+        
         self.reasoning_start_time = None
         self.reasoning_end_time = None
         self.content_start_time = None
         self.content_end_time = None
         
+        # Arrival time of every token-bearing chunk, relative to start_time.
+        # In metrics-only mode only the gaps are kept, in a fixed-size histogram.
+        self.chunk_times = array('d')
+        self.chunk_gaps = LatencyHistogram() if self.metrics_only else None
+        self.chunk_count = 0
+        self.reasoning_chunks = 0
+        self.content_chunks = 0
+        self.first_chunk_time = None
+        self.last_chunk_time = None
+        
         self.usage_content = ""
+        self.token_estimator = TokenEstimator()
+        self.token_source = None
+        self._messages = None
+        self._chunk_timer = profiling.chunk_timer()
+        self._trace = None
+        self._timeline = None
+        self.connection = None
+        self._opened_connections = None
         self._output_buffer = []
     
+    @property
+    def reasoning_text(self) -> str:
+        """Reasoning text received so far (empty in metrics-only mode)"""
+        return ''.join(self._reasoning_parts)
+    
+    @property
+    def content_text(self) -> str:
+        """Content text received so far (empty in metrics-only mode)"""
+        return ''.join(self._content_parts)
+    
+    def _open_sink(self, provider):
+        """Open the text sink for this test, if configured"""
+        self._close_sink()
+        if self.sink_dir:
+            self._sink = ChunkedTextSink(self.sink_dir, provider.name)
+    
+    def _close_sink(self):
+        """Close the text sink, if open"""
+        if self._sink is not None:
+            self._sink.close()
+            self._sink = None
+    
     def _buffer_print(self, text, end='\n'):
         """Buffer or directly print text based on settings"""
+        if not self.verbose:
+            return
         if self.buffer_output:
             self._output_buffer.append(text + (end if end else ""))
         else:
@@ -57,66 +384,287 @@ class APITester:
             print(''.join(self._output_buffer), end='')
             self._output_buffer = []
     
-    def test_provider(self, provider, messages) -> Optional[TestResult]:
+    def test_provider(self, provider, messages, deadline_at=None, max_tokens=None) -> Optional[TestResult]:
         """
         Test a specific provider with given messages
         
         Args:
             provider: Provider instance
             messages: List of message dictionaries
+            deadline_at: Optional absolute time.perf_counter() deadline, e.g. for a whole run
+            max_tokens: Optional output token limit for this request
         
         Returns:
-            TestResult object if successful, None if failed
+            TestResult object if successful or cut off by a deadline (partial, with
+            status 'timeout' or 'stalled'), None if failed
         """
-        self._buffer_print(f"\n---------------------------")
-        self._buffer_print(f"开始测试服务商：{provider.name}")
-        self._buffer_print(f"---------------------------\n")
+        self._print_header(provider)
         
         try:
-            self.reset_metrics()
-            self.start_time = time.time()
+            # Clients are built on first use; build it before the clock starts
+            provider.client
+            self._start(provider, deadline_at, messages)
+            if self._time_left() == 0:
+                self.status = 'timeout'
+                return self._finish(provider)
+            
+            _watchdog.watch(self)
             
             # Create streaming completion
-            response = provider.create_completion(messages)
+            if self.raw_sse:
+                self._response = provider.create_completion_raw(messages, timeout=self._time_left(), max_tokens=max_tokens)
+            else:
+                self._response = provider.create_completion(messages, timeout=self._time_left(), max_tokens=max_tokens)
             
             # Process each chunk
-            for chunk in response:
-                self._process_usage(chunk)
-                self._process_content(chunk)
-            
-            # Calculate final metrics
-            total_time = time.time() - self.start_time
-            reasoning_time = (self.reasoning_end_time - self.reasoning_start_time) if (self.reasoning_start_time and self.reasoning_end_time) else 0
-            content_time = (self.content_end_time - self.content_start_time) if (self.content_start_time and self.content_end_time) else 0
+            chunks = self._chunk_timer.iterate(self._response) if self._chunk_timer else self._response
+            for chunk in chunks:
+                self._on_chunk(chunk)
+                if self.status is None and self.deadline_at is not None and self.last_activity >= self.deadline_at:
+                    self.status = 'timeout'
+                if self.status is not None:
+                    break
             
-            # Print results
-            self._print_results(provider.name, total_time, reasoning_time, content_time)
-            
-            # Flush the buffer
-            self._flush_buffer()
-            
-            # Return test results
-            return TestResult(
-                provider=provider.name,
-                first_token_time=self.first_token_time,
-                reasoning_tokens=self.reasoning_tokens,
-                reasoning_time=reasoning_time,
-                content_tokens=self.content_tokens,
-                content_time=content_time,
-                total_tokens=self.total_tokens,
-                total_time=total_time
-            )
+            return self._finish(provider)
             
         except Exception as e:
-            self._buffer_print(f"服务商 {provider.name} 测试过程中发生错误：{e}")
-            self._buffer_print("\n---------------------------\n")
-            self._flush_buffer()
+            if self.status is None and self._time_left() == 0:
+                # The request-level timeout fired before the watchdog did
+                self.status = 'timeout'
+            if self.status is not None:
+                return self._finish(provider)
+            return self._handle_error(provider, e)
+        
+        finally:
+            _watchdog.unwatch(self)
+            if self.status is not None:
+                self._close_response()
+            self._response = None
+    
+    def _start(self, provider, deadline_at=None, messages=None):
+        """Reset state and start the clock for a new test"""
+        self.reset_metrics()
+        self._messages = messages
+        self._trace = traces.stream_trace()
+        self._timeline = timeline.recorder()
+        self._open_sink(provider)
+        self._opened_connections = http_pool.track_connections()
+        self.started_at = time.time()
+        self.start_time = self.clock()
+        self.last_activity = self.start_time
+        
+        deadlines = [d for d in (deadline_at, self.start_time + self.timeout if self.timeout else None) if d is not None]
+        self.deadline_at = min(deadlines) if deadlines else None
+    
+    def _time_left(self) -> Optional[float]:
+        """Seconds until the deadline (0 once passed), or None without a deadline"""
+        if self.deadline_at is None:
             return None
+        return max(0.0, self.deadline_at - time.perf_counter())
+    
+    def _check_deadline(self, now: float) -> Optional[str]:
+        """Status the stream should be cut off with at time now, if any"""
+        if self.deadline_at is not None and now >= self.deadline_at:
+            return 'timeout'
+        if self.stall_timeout and self.chunk_count and now - self.last_activity >= self.stall_timeout:
+            return 'stalled'
+        return None
+    
+    def _next_wait(self, now: float) -> Optional[float]:
+        """Longest time the next chunk may take before a deadline is hit, or None"""
+        waits = []
+        if self.deadline_at is not None:
+            waits.append(self.deadline_at - now)
+        if self.stall_timeout and self.chunk_count:
+            waits.append(self.stall_timeout - (now - self.last_activity))
+        return max(0.0, min(waits)) if waits else None
+    
+    def _enforce_deadline(self, now: float):
+        """Called by the watchdog thread: close the stream once a deadline passes"""
+        if self.status is None:
+            status = self._check_deadline(now)
+            if status is not None:
+                self.status = status
+                self._close_response()
+    
+    def _resolve_connection(self):
+        """Label the request by whether the pool had to open a connection for it (replay sets the label itself)"""
+        if self.connection is None and self._opened_connections is not None:
+            self.connection = 'cold' if self._opened_connections else 'warm'
+    
+    def _close_response(self):
+        """Close the current response, ignoring errors from an already broken stream"""
+        if self._response is not None:
+            abort_stream(self._response)
+    
+    def _on_chunk(self, chunk):
+        """Process a single streamed chunk"""
+        self.last_activity = self.clock()
+        if self._chunk_timer is not None:
+            self._chunk_timer.start()
+        self._process_usage(chunk)
+        self._process_content(chunk)
+        if self._chunk_timer is not None:
+            self._chunk_timer.stop()
+    
+    def _print_header(self, provider):
+        """Print the banner shown before each provider test"""
+        self._buffer_print(f"\n---------------------------")
+        self._buffer_print(f"开始测试服务商：{provider.name}")
+        self._buffer_print(f"---------------------------\n")
+    
+    def _finish(self, provider) -> TestResult:
+        """Calculate final metrics, print them and build the TestResult"""
+        self._close_sink()
+        status = self.status or 'ok'
+        
+        # Stop the clock before estimating token counts, which may tokenize the whole output
+        total_time = self.clock() - self.start_time
+        self.token_source = self._resolve_token_counts()
+        self._resolve_connection()
+        if self._trace is not None:
+            self._trace.finish(provider, status, self.connection, total_time, self._messages, self._estimated_tokens())
+            self._trace = None
+        reasoning_time = (self.reasoning_end_time - self.reasoning_start_time) if (self.reasoning_start_time and self.reasoning_end_time) else 0
+        content_time = (self.content_end_time - self.content_start_time) if (self.content_start_time and self.content_end_time) else 0
+        
+        latency = self._latency_stats()
+        stream_timeline = None
+        if self._timeline is not None:
+            stream_timeline = self._timeline.finish(self.reasoning_tokens, self.content_tokens, self._gap_histogram())
+            self._timeline = None
+        
+        # Print results
+        if status != 'ok':
+            reason = "超过截止时间" if status == 'timeout' else f"超过 {self.stall_timeout} 秒未收到新分块"
+            self._buffer_print(f"\n\n测试被中断（{reason}），以下为已收集的部分结果")
+        self._print_results(provider.name, total_time, reasoning_time, content_time)
+        self._print_latency(latency)
+        
+        # Flush the buffer
+        self._flush_buffer()
+        
+        # Return test results
+        return TestResult(
+            provider=provider.name,
+            first_token_time=self.first_token_time,
+            reasoning_tokens=self.reasoning_tokens,
+            reasoning_time=reasoning_time,
+            content_tokens=self.content_tokens,
+            content_time=content_time,
+            total_tokens=self.total_tokens,
+            total_time=total_time,
+            model=provider.model,
+            connection=self.connection,
+            status=status,
+            prompt_tokens=self.prompt_tokens or None,
+            prompt_cache_hit_tokens=self.prompt_cache_hit_tokens,
+            prompt_cache_miss_tokens=self.prompt_cache_miss_tokens,
+            token_source=self.token_source,
+            started_at=self.started_at,
+            timeline=stream_timeline,
+            **latency,
+            **(self._chunk_timer.result_fields() if self._chunk_timer else {})
+        )
+    
+    def _resolve_token_counts(self) -> str:
+        """
+        Fill in token counts the provider did not report, from the streamed deltas
+        
+        Covers providers that ignore include_usage, streams cut off before the
+        usage chunk, and usage without completion_tokens_details.
+        
+        Returns:
+            'reported', 'split' if only the reasoning/content split is estimated, or 'estimated'
+        """
+        if not self.usage_content:
+            self.reasoning_tokens = self.token_estimator.count('reasoning')
+            self.content_tokens = self.token_estimator.count('content')
+            self.completion_tokens = self.reasoning_tokens + self.content_tokens
+            if not self.prompt_tokens and self._messages:
+                self.prompt_tokens = count_message_tokens(self._messages)
+            self.total_tokens = self.prompt_tokens + self.completion_tokens
+            return 'estimated'
+        
+        if self.usage_content.completion_tokens_details is None and self.reasoning_chunks and self.completion_tokens:
+            # Reported total without a breakdown: split it in proportion to the estimated phases
+            estimated = self.token_estimator.count()
+            if estimated:
+                self.reasoning_tokens = round(self.completion_tokens * self.token_estimator.count('reasoning') / estimated)
+                self.content_tokens = self.completion_tokens - self.reasoning_tokens
+                return 'split'
+        return 'reported'
+    
+    def _estimated_tokens(self) -> Optional[Dict[str, Any]]:
+        """Token counts for the trace when any were estimated, so replay does not depend on the tokenizer"""
+        if self.token_source == 'reported':
+            return None
+        return {
+            'token_source': self.token_source,
+            'reasoning_tokens': self.reasoning_tokens,
+            'content_tokens': self.content_tokens,
+            'completion_tokens': self.completion_tokens,
+            'prompt_tokens': self.prompt_tokens,
+            'total_tokens': self.total_tokens,
+        }
+    
+    def _latency_stats(self) -> Dict[str, Optional[float]]:
+        """Compute inter-token latency percentiles and time per output token from chunk arrivals"""
+        if self.chunk_count < 2:
+            return {'itl_p50': None, 'itl_p90': None, 'itl_p99': None, 'itl_max': None, 'tpot': None}
+        
+        # Prefer reported token counts; fall back to chunk count when usage is missing
+        output_tokens = self.completion_tokens or self.chunk_count
+        decode_time = self.last_chunk_time - self.first_chunk_time
+        tpot = decode_time / (output_tokens - 1) if output_tokens > 1 else None
+        
+        if self.chunk_gaps is not None:
+            return {
+                'itl_p50': self.chunk_gaps.percentile(50),
+                'itl_p90': self.chunk_gaps.percentile(90),
+                'itl_p99': self.chunk_gaps.percentile(99),
+                'itl_max': self.chunk_gaps.max,
+                'tpot': tpot,
+            }
+        
+        times = self.chunk_times
+        gaps = sorted(times[i] - times[i - 1] for i in range(1, len(times)))
+        return {
+            'itl_p50': percentile(gaps, 50, presorted=True),
+            'itl_p90': percentile(gaps, 90, presorted=True),
+            'itl_p99': percentile(gaps, 99, presorted=True),
+            'itl_max': gaps[-1],
+            'tpot': tpot,
+        }
+    
+    def _gap_histogram(self) -> LatencyHistogram:
+        """Inter-token gaps as a LatencyHistogram, built from the chunk times unless already kept as one"""
+        if self.chunk_gaps is not None:
+            return self.chunk_gaps
+        histogram = LatencyHistogram()
+        times = self.chunk_times
+        histogram.extend([later - earlier for earlier, later in zip(times, times[1:])])
+        return histogram
+    
+    def _handle_error(self, provider, error) -> None:
+        """Report a failed test and flush whatever output was collected"""
+        self.last_error = error
+        self._close_sink()
+        self._resolve_connection()
+        if self._trace is not None and self.start_time is not None:
+            self._trace.finish(provider, 'error', self.connection, self.clock() - self.start_time, self._messages)
+            self._trace = None
+        self._buffer_print(f"服务商 {provider.name} 测试过程中发生错误：{error}")
+        self._buffer_print("\n---------------------------\n")
+        self._flush_buffer()
+        return None
     
     def _process_usage(self, chunk):
         """Process usage information from chunk"""
         if chunk.usage:
             self.usage_content = chunk.usage
+            if self._trace is not None:
+                self._trace.usage_chunk(self.last_activity - self.start_time, chunk.usage)
             
             # Update token counts
             if chunk.usage.completion_tokens_details is None:
@@ -125,6 +673,7 @@ class APITester:
                 self.reasoning_tokens = chunk.usage.completion_tokens_details.reasoning_tokens
             
             self.prompt_tokens = chunk.usage.prompt_tokens
+            self.prompt_cache_hit_tokens, self.prompt_cache_miss_tokens = cache_tokens(chunk.usage)
             self.completion_tokens = chunk.usage.completion_tokens
             self.content_tokens = self.completion_tokens - self.reasoning_tokens
             self.total_tokens = chunk.usage.total_tokens
@@ -138,25 +687,59 @@ class APITester:
         reasoning_piece = getattr(delta, 'reasoning_content', "")
         content_piece = getattr(delta, 'content', "")
         
+        if not (reasoning_piece or content_piece):
+            return
+        
+        now = self.clock()
+        self._record_chunk(now - self.start_time)
+        
         # Record first token time
-        if self.first_token_time is None and (reasoning_piece or content_piece):
-            self.first_token_time = time.time() - self.start_time
+        if self.first_token_time is None:
+            self.first_token_time = now - self.start_time
         
         # Process reasoning content
         if reasoning_piece:
             if self.reasoning_start_time is None:
-                self.reasoning_start_time = time.time()
-            self.reasoning_text += reasoning_piece
-            self.reasoning_end_time = time.time()
-            self._buffer_print(reasoning_piece, end='')
+                self.reasoning_start_time = now
+            self.reasoning_end_time = now
+            self.reasoning_chunks += 1
+            self._record_text('reasoning', reasoning_piece, self._reasoning_parts)
+            self.reasoning_chars += len(reasoning_piece)
         
         # Process main content
         elif content_piece:
             if self.content_start_time is None:
-                self.content_start_time = time.time()
-            self.content_text += content_piece
-            self.content_end_time = time.time()
-            self._buffer_print(content_piece, end='')
+                self.content_start_time = now
+            self.content_end_time = now
+            self.content_chunks += 1
+            self._record_text('content', content_piece, self._content_parts)
+            self.content_chars += len(content_piece)
+    
+    def _record_chunk(self, elapsed: float):
+        """Record the arrival of a token-bearing chunk"""
+        if self.chunk_gaps is not None:
+            if self.last_chunk_time is not None:
+                self.chunk_gaps.add(elapsed - self.last_chunk_time)
+        else:
+            self.chunk_times.append(elapsed)
+        
+        if self.first_chunk_time is None:
+            self.first_chunk_time = elapsed
+        self.last_chunk_time = elapsed
+        self.chunk_count += 1
+    
+    def _record_text(self, phase: str, piece: str, parts: list):
+        """Keep, echo and/or sink a piece of generated text depending on the mode"""
+        self.token_estimator.add(phase, piece)
+        if self._trace is not None:
+            self._trace.delta(phase, self.last_chunk_time, piece)
+        if self._timeline is not None:
+            self._timeline.add(self.last_chunk_time, phase)
+        if self._sink is not None:
+            self._sink.write(phase, piece)
+        if not self.metrics_only:
+            parts.append(piece)
+            self._buffer_print(piece, end='')
     
     def _print_results(self, provider_name: str, total_time: float, reasoning_time: float, content_time: float):
         """Print test results"""
@@ -167,25 +750,45 @@ class APITester:
         self._buffer_print(f"\n\n【{provider_name}】")
         
         if self.first_token_time is not None:
-            self._buffer_print(f"首 token 响应时间：{self.first_token_time:.2f} 秒")
+            connection = "冷启动" if self.connection == 'cold' else "已预热连接"
+            self._buffer_print(f"首 token 响应时间：{self.first_token_time:.2f} 秒（{connection}）")
         else:
             self._buffer_print("未收到 token 响应。")
         
+        if self.prompt_cache_hit_tokens is not None:
+            self._buffer_print(f"提示词缓存：命中 {self.prompt_cache_hit_tokens} tokens，未命中 {self.prompt_cache_miss_tokens} tokens")
+        
         if self.reasoning_tokens > 0:
             self._buffer_print(
-                f"Reasoning 部分：{len(self.reasoning_text)} 字符，{self.reasoning_tokens} tokens, "
+                f"Reasoning 部分：{self.reasoning_chars} 字符，{self.reasoning_tokens} tokens, "
                 f"用时：{reasoning_time:.2f} 秒, "
                 f"生成速度：{self.reasoning_tokens / reasoning_time if reasoning_time > 0 else 0:.2f} tokens/s"
             )
             self._buffer_print(
-                f"Content 部分：{len(self.content_text)} 字符，{self.content_tokens} tokens, "
+                f"Content 部分：{self.content_chars} 字符，{self.content_tokens} tokens, "
                 f"用时：{content_time:.2f} 秒, "
                 f"生成速度：{self.content_tokens / content_time if content_time > 0 else 0:.2f} tokens/s"
             )
         
         self._buffer_print(
-            f"内容生成：{len(self.reasoning_text + self.content_text)} 字符，{self.completion_tokens} tokens, "
+            f"内容生成：{self.reasoning_chars + self.content_chars} 字符，{self.completion_tokens} tokens, "
             f"总用时：{total_time:.2f} 秒, "
             f"生成速度：{self.completion_tokens / total_time if total_time > 0 else 0:.2f} tokens/s"
         )
+        if self.token_source == 'estimated':
+            self._buffer_print(f"服务商未返回 usage，token 数为客户端估算（{estimator_name()}）")
+        elif self.token_source == 'split':
+            self._buffer_print(f"服务商未返回 reasoning tokens，Reasoning/Content 的划分为客户端估算（{estimator_name()}）")
+    
+    def _print_latency(self, latency: Dict[str, Optional[float]]):
+        """Print inter-token latency percentiles and close the result block"""
+        if latency['itl_p50'] is not None:
+            self._buffer_print(
+                f"Token 间隔：P50 {latency['itl_p50'] * 1000:.1f} ms, "
+                f"P90 {latency['itl_p90'] * 1000:.1f} ms, "
+                f"P99 {latency['itl_p99'] * 1000:.1f} ms, "
+                f"最大 {latency['itl_max'] * 1000:.1f} ms"
+            )
+        if latency['tpot'] is not None:
+            self._buffer_print(f"每输出 token 用时（TPOT）：{latency['tpot'] * 1000:.1f} ms")
         self._buffer_print("\n***************************\n")
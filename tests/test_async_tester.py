@@ -0,0 +1,54 @@
+import asyncio
+import time
+import httpx
+from async_tester import AsyncAPITester
+from sse import RawChunk
+
+class _Stream:
+    """先输出一个分块，第二个分块阻塞到截止时间之后，再以读超时结束"""
+
+    def __init__(self, deadline):
+        self._deadline = deadline
+        self._sent = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._sent:
+            self._sent = True
+            return RawChunk({'choices': [{'delta': {'content': 'hello'}}]})
+        # 阻塞事件循环，使读超时先于 wait_for 被处理
+        time.sleep(max(0.0, self._deadline - time.perf_counter()) + 0.01)
+        raise httpx.ReadTimeout('read timed out')
+
+    async def close(self):
+        pass
+
+class _Provider:
+    name = 'Fake'
+    model = 'fake'
+    async_client = object()
+
+    def __init__(self, error=None):
+        self.error = error
+        self.deadline = None
+
+    async def create_completion_async(self, messages, timeout=None, max_tokens=None):
+        if self.error is not None:
+            raise self.error
+        self.deadline = time.perf_counter() + timeout
+        return _Stream(self.deadline)
+
+def _run(provider, timeout):
+    tester = AsyncAPITester(buffer_output=True, verbose=False, timeout=timeout)
+    return asyncio.run(tester.test_provider(provider, [{'role': 'user', 'content': 'hi'}]))
+
+def test_sdk_timeout_at_deadline_returns_partial_result():
+    result = _run(_Provider(), timeout=0.05)
+    assert result is not None
+    assert result.status == 'timeout'
+    assert result.first_token_time is not None
+
+def test_error_before_deadline_is_a_failure():
+    assert _run(_Provider(error=httpx.ConnectError('refused')), timeout=10) is None
@@ -0,0 +1,116 @@
+import json
+import pytest
+from compare import RegressionThresholds, compare_provider, compare_runs, load_run
+from stats import rate_increase_p_value
+
+def _rows(ttfts, total_time=2.0, output_tokens=200, status='ok', connection='warm'):
+    # 100 个输入 tokens 计入 total_tokens，但不计入生成速度
+    return [
+        {'provider': 'A', 'first_token_time': ttft, 'total_time': total_time,
+         'reasoning_tokens': 50, 'content_tokens': output_tokens - 50, 'total_tokens': output_tokens + 100,
+         'status': status, 'connection': connection}
+        for ttft in ttfts
+    ]
+
+def _errors(count):
+    return [{'provider': 'A', 'status': 'error'} for _ in range(count)]
+
+def test_rate_increase_p_value_known_values():
+    # 0/10 对 5/10：C(10,5) / C(20,5)
+    assert rate_increase_p_value(0, 10, 5, 10) == pytest.approx(252 / 15504)
+    # 1/10 对 1/10：(C(10,1)² + C(10,2)) / C(20,2)
+    assert rate_increase_p_value(1, 10, 1, 10) == pytest.approx(145 / 190)
+    # 失败全部出现在 a 组时 b 组不可能更差
+    assert rate_increase_p_value(5, 10, 0, 10) == pytest.approx(1.0)
+
+def test_rate_increase_p_value_degenerate():
+    assert rate_increase_p_value(0, 10, 0, 10) == 1.0
+    assert rate_increase_p_value(0, 0, 3, 10) == 1.0
+    assert rate_increase_p_value(3, 10, 0, 0) == 1.0
+
+def test_compare_provider_ttft_regressed():
+    baseline = _rows([0.50, 0.52, 0.48, 0.51, 0.49] * 4)
+    candidate = _rows([0.80, 0.82, 0.78, 0.81, 0.79] * 4)
+    comparison = compare_provider('A', baseline, candidate, RegressionThresholds())
+    assert comparison.regressions == ['ttft']
+    assert comparison.ttft.regressed and comparison.ttft.significant
+    assert comparison.ttft.change == pytest.approx(0.6)
+    assert not comparison.tokens_per_second.regressed
+    assert comparison.error_rate.change == 0
+
+def test_compare_provider_change_not_significant():
+    # 均值增加 20%，但两个样本的波动远大于差异
+    baseline = _rows([0.5, 1.5])
+    candidate = _rows([0.4, 2.0])
+    comparison = compare_provider('A', baseline, candidate, RegressionThresholds())
+    assert comparison.ttft.change == pytest.approx(0.2)
+    assert comparison.ttft.significant is False
+    assert comparison.regressions == []
+
+    # 不要求显著性时仅按阈值判定
+    comparison = compare_provider('A', baseline, candidate, RegressionThresholds(require_significance=False))
+    assert comparison.regressions == ['ttft']
+
+def test_compare_provider_too_few_samples():
+    comparison = compare_provider('A', _rows([0.5]), _rows([1.0]), RegressionThresholds())
+    assert comparison.ttft.significant is None
+    assert comparison.regressions == []
+
+def test_compare_provider_error_rate_regressed():
+    baseline = _rows([0.5] * 20)
+    candidate = _rows([0.5] * 10) + _errors(5) + _rows([3.0] * 5, status='timeout')
+    comparison = compare_provider('A', baseline, candidate, RegressionThresholds())
+    assert comparison.error_rate.baseline == 0
+    assert comparison.error_rate.candidate == pytest.approx(0.5)
+    assert comparison.error_rate.significant
+    # 被中断的结果只计入错误率，不影响首 token 时间
+    assert comparison.ttft.change == 0
+    assert comparison.regressions == ['error_rate']
+
+def test_compare_provider_only_warm_ttft():
+    # 候选运行的冷启动样本更多，只比较已预热连接的样本
+    baseline = _rows([2.0], connection='cold') + _rows([0.5, 0.5, 0.5])
+    candidate = _rows([2.0] * 3, connection='cold') + _rows([0.5, 0.5, 0.5])
+    comparison = compare_provider('A', baseline, candidate, RegressionThresholds())
+    assert comparison.ttft.change == 0
+    assert comparison.regressions == []
+
+def test_compare_provider_missing():
+    rows = _rows([0.5] * 3)
+    comparison = compare_provider('A', rows, [], RegressionThresholds())
+    assert comparison.missing == 'candidate'
+    assert comparison.ttft is None and comparison.regressions == []
+
+    comparison = compare_provider('A', rows, [], RegressionThresholds(fail_on_missing=True))
+    assert comparison.regressions == ['missing']
+
+    # 新增的服务商不算退化
+    comparison = compare_provider('A', [], rows, RegressionThresholds(fail_on_missing=True))
+    assert comparison.missing == 'baseline'
+    assert comparison.regressions == []
+
+def test_compare_runs_groups_by_provider():
+    baseline = _rows([0.5] * 3) + [dict(row, provider='B') for row in _rows([0.5] * 3)]
+    candidate = _rows([0.5] * 3)
+    comparisons = compare_runs(baseline, candidate)
+    assert [c.provider for c in comparisons] == ['A', 'B']
+    assert comparisons[0].missing is None
+    assert comparisons[1].missing == 'candidate'
+    assert comparisons[0].tokens_per_second.baseline == pytest.approx(100.0)
+
+def test_load_run_latest_and_previous_by_timestamp(tmp_path):
+    # 按完整文件名排序时 test_report_ 总在 replay_report_ 之后
+    for name, ttft in (('test_report_20250201_120000', 1.0),
+                       ('replay_report_20250202_120000', 2.0),
+                       ('sweep_report_20250203_120000', 3.0)):
+        (tmp_path / f'{name}_results.jsonl').write_text(json.dumps(_rows([ttft])[0]) + '\n', encoding='utf-8')
+
+    name, rows = load_run('latest', report_dir=tmp_path)
+    assert name == 'sweep_report_20250203_120000' and rows[0]['first_token_time'] == 3.0
+    name, rows = load_run('previous', report_dir=tmp_path)
+    assert name == 'replay_report_20250202_120000' and rows[0]['first_token_time'] == 2.0
+
+def test_load_run_latest_needs_enough_runs(tmp_path):
+    (tmp_path / 'test_report_20250201_120000_results.jsonl').write_text('', encoding='utf-8')
+    with pytest.raises(ValueError):
+        load_run('previous', report_dir=tmp_path)
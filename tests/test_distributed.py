@@ -0,0 +1,43 @@
+import json
+from array import array
+import tester
+from distributed import Coordinator, DistributedConfig, result_from_dict, result_to_dict
+from timeline import StreamTimeline
+
+def _result(**kwargs):
+    values = dict(provider='p', first_token_time=0.2, reasoning_tokens=30, reasoning_time=1.0,
+                  content_tokens=20, content_time=0.5, total_tokens=150, total_time=1.7,
+                  itl_p50=0.01, connection='warm', token_source='split', started_at=1700000000.5, worker='w1')
+    values.update(kwargs)
+    return tester.TestResult(**values)
+
+def test_result_round_trip_through_json():
+    stream_timeline = StreamTimeline(array('d', [0.2, 1.2, 1.7]), array('d', [1, 30, 50]), 1.2, 1.25, {3: 10, 17: 2})
+    result = _result(timeline=stream_timeline)
+    restored = result_from_dict(json.loads(json.dumps(result_to_dict(result))))
+    assert restored == result
+    assert list(restored.timeline.times) == [0.2, 1.2, 1.7]
+    assert list(restored.timeline.tokens) == [1, 30, 50]
+    assert (restored.timeline.reasoning_end, restored.timeline.content_start) == (1.2, 1.25)
+    # JSON 把桶序号变成字符串，读回时恢复为整数
+    assert restored.timeline.itl_buckets == {3: 10, 17: 2}
+
+def test_result_round_trip_without_timeline():
+    result = _result(status='timeout', first_token_time=None)
+    assert result_from_dict(json.loads(json.dumps(result_to_dict(result)))) == result
+
+def test_read_results_keeps_partial_line(tmp_path):
+    coordinator = Coordinator(DistributedConfig(queue_dir=str(tmp_path)), {})
+    coordinator._prepare([])
+    path = tmp_path / 'results' / 'w1.jsonl'
+    first, second = json.dumps({'id': 1}), json.dumps({'id': 2})
+
+    path.write_bytes(f'{first}\n{second[:5]}'.encode())
+    assert coordinator._read_results() == [{'id': 1}]
+    assert coordinator._read_results() == []
+
+    # 工作进程写完剩下的部分后，半行与新内容拼接成完整记录
+    with open(path, 'ab') as f:
+        f.write(f'{second[5:]}\n'.encode())
+    assert coordinator._read_results() == [{'id': 2}]
+    assert coordinator._read_results() == []
@@ -0,0 +1,69 @@
+import pytest
+import tester
+from goodput import GoodputConfig, GoodputLevel, GoodputSweep, meets_slo, parse_levels
+from mock_server import MockProvider
+
+def _result(ttft, tpot, status='ok'):
+    return tester.TestResult(provider='A', first_token_time=ttft, reasoning_tokens=0, reasoning_time=0,
+                             content_tokens=10, content_time=1.0, total_tokens=10, total_time=1.0,
+                             tpot=tpot, status=status)
+
+def _level(concurrency, attainment, rate):
+    """并发 concurrency 下每秒完成 rate 个请求，其中 attainment 比例满足 SLO"""
+    sent = 100
+    return GoodputLevel(concurrency=concurrency, elapsed=sent / rate, sent=sent, completed=sent,
+                        good=round(sent * attainment), good_tokens=0, ttft_p50=None, ttft_p90=None,
+                        tpot_p50=None, tpot_p90=None, throughput=0)
+
+def _sweep(monkeypatch, curve, **config):
+    """用合成的 (满足率, 请求速率) 曲线代替真实测量"""
+    sweep = GoodputSweep(GoodputConfig(levels=sorted(curve), **config))
+    measured = []
+
+    def run_level(provider, messages, concurrency, max_tokens):
+        measured.append(concurrency)
+        return _level(concurrency, *curve[concurrency])
+
+    monkeypatch.setattr(sweep, '_warmup', lambda provider, connections: None)
+    monkeypatch.setattr(sweep, '_run_level', run_level)
+    provider = MockProvider('http://127.0.0.1:1/v1', name='A')
+    [result] = sweep.test_providers([provider], [{'role': 'user', 'content': 'hi'}])
+    return result, measured, provider
+
+def test_parse_levels():
+    assert parse_levels('4, 1,2,2') == [1, 2, 4]
+    for value in ('', '0,1', 'a'):
+        with pytest.raises(ValueError):
+            parse_levels(value)
+
+def test_meets_slo():
+    assert meets_slo(_result(1.0, 0.05), 2.0, 0.1)
+    assert meets_slo(_result(1.0, None), 2.0, 0.1)
+    assert not meets_slo(_result(3.0, 0.05), 2.0, 0.1)
+    assert not meets_slo(_result(1.0, 0.2), 2.0, 0.1)
+    assert not meets_slo(_result(1.0, 0.05, status='timeout'), 2.0, 0.1)
+    assert not meets_slo(None, 2.0, 0.1)
+
+def test_knee_on_synthetic_curve(monkeypatch):
+    # 吞吐随并发上升，并发 8 时满足率跌破 90%
+    curve = {1: (1.0, 2.0), 2: (1.0, 4.0), 4: (0.95, 7.0), 8: (0.6, 9.0), 16: (0.2, 9.5)}
+    result, measured, provider = _sweep(monkeypatch, curve)
+    assert result.knee.concurrency == 8
+    assert result.best.concurrency == 4
+    assert result.sustainable_goodput == pytest.approx(7.0 * 0.95)
+    assert measured == [1, 2, 4, 8]
+    # 调用方的服务商实例保留 SDK 重试
+    assert provider.max_retries is None
+
+def test_measures_all_levels_without_stop_at_knee(monkeypatch):
+    # 拐点之后的等级即使满足率回升也不计入最佳等级
+    curve = {1: (1.0, 2.0), 2: (0.5, 3.0), 4: (1.0, 8.0)}
+    result, measured, _ = _sweep(monkeypatch, curve, stop_at_knee=False)
+    assert measured == [1, 2, 4]
+    assert result.knee.concurrency == 2
+    assert result.best.concurrency == 1
+
+def test_no_level_meets_target(monkeypatch):
+    result, _, _ = _sweep(monkeypatch, {1: (0.5, 2.0), 2: (0.4, 3.0)})
+    assert result.knee.concurrency == 1
+    assert result.best is None and result.sustainable_goodput == 0
@@ -0,0 +1,51 @@
+import random
+import pytest
+from load_tester import LoadAPITester, LoadStage, LoadTestConfig, _InFlightCounter, parse_stages
+from mock_server import MockProvider, MockServerConfig, MockSSEServer
+
+MESSAGES = [{'role': 'user', 'content': 'hi'}]
+
+def test_parse_stages():
+    assert parse_stages('1:30, 2.5:60,') == [LoadStage(1.0, 30.0), LoadStage(2.5, 60.0)]
+    for spec in ('', '1', '1:2:3', 'a:b'):
+        with pytest.raises(ValueError):
+            parse_stages(spec)
+
+def test_in_flight_counter():
+    counter = _InFlightCounter(2)
+    assert counter.try_acquire() and counter.try_acquire()
+    assert not counter.try_acquire()
+    counter.release()
+    assert counter.in_flight == 1 and counter.peak == 2
+    counter.reset_peak()
+    assert counter.peak == 1
+
+def test_poisson_intervals_are_reproducible():
+    tester = LoadAPITester(LoadTestConfig(stages=[LoadStage(10, 1)]))
+    first = tester._intervals(random.Random(7), 10)
+    second = tester._intervals(random.Random(7), 10)
+    intervals = [next(first) for _ in range(2000)]
+    assert intervals[:5] == [next(second) for _ in range(5)]
+    assert sum(intervals) / len(intervals) == pytest.approx(0.1, rel=0.1)
+
+def test_constant_arrivals_are_open_loop():
+    # 请求耗时远长于到达间隔，开环模式仍按目标速率发送
+    config = MockServerConfig(ttft=0.3, tokens_per_second=1000, reasoning_tokens=2, content_tokens=2)
+    with MockSSEServer(config) as server:
+        stages = [LoadStage(rps=20, duration=0.5), LoadStage(rps=0, duration=0.2)]
+        tester = LoadAPITester(LoadTestConfig(stages=stages, arrival='constant', max_in_flight=32))
+        first, idle = tester.test_providers([MockProvider(server.url)], MESSAGES)
+    assert first.sent == 10 and first.dropped == 0
+    assert first.completed == 10 and first.errors == 0
+    assert first.peak_in_flight > 1
+    assert first.achieved_rps == pytest.approx(20)
+    assert first.tokens_per_second is not None
+    assert idle.sent == 0
+
+def test_arrivals_beyond_max_in_flight_are_dropped():
+    config = MockServerConfig(ttft=0.5, tokens_per_second=1000, reasoning_tokens=2, content_tokens=2)
+    with MockSSEServer(config) as server:
+        tester = LoadAPITester(LoadTestConfig(stages=[LoadStage(rps=20, duration=0.3)], arrival='constant', max_in_flight=2))
+        [stage] = tester.test_providers([MockProvider(server.url)], MESSAGES)
+    assert stage.sent == 2 and stage.dropped == 4
+    assert stage.peak_in_flight == 2
@@ -0,0 +1,49 @@
+import dataclasses
+import pytest
+import tokens
+import traces
+from mock_server import MockProvider, MockServerConfig, MockSSEServer
+from replay import ReplayTester
+from tester import APITester
+
+MESSAGES = [{'role': 'user', 'content': 'Write a seven-character quatrain 赞叹祖国的大好河山'}]
+
+def _record(tmp_path, config):
+    """对模拟服务端发送一个请求并录制轨迹，返回 (TestResult, 轨迹文件)"""
+    with MockSSEServer(config) as server, traces.TraceRecorder(tmp_path):
+        result = APITester(buffer_output=True, verbose=False).test_provider(MockProvider(server.url), MESSAGES)
+    [path] = traces.trace_files(tmp_path)
+    return result, path
+
+def _replay(path):
+    with traces.Trace(path) as trace:
+        return ReplayTester().replay(trace)
+
+def _comparable(result):
+    return dataclasses.replace(result, started_at=None)
+
+@pytest.mark.parametrize('include_usage, usage_details, token_source', [
+    (True, True, 'reported'),
+    (True, False, 'split'),
+    (False, True, 'estimated'),
+])
+def test_record_replay_round_trip(tmp_path, include_usage, usage_details, token_source):
+    config = MockServerConfig(ttft=0.01, tokens_per_second=2000, reasoning_tokens=20, content_tokens=10,
+                              include_usage=include_usage, usage_details=usage_details, seed=1)
+    recorded, path = _record(tmp_path, config)
+    assert recorded.token_source == token_source
+    assert _comparable(_replay(path)) == _comparable(recorded)
+
+def test_replay_uses_recorded_estimates(tmp_path, monkeypatch):
+    config = MockServerConfig(ttft=0.01, tokens_per_second=2000, reasoning_tokens=20, content_tokens=10,
+                              include_usage=False, seed=1)
+    recorded, path = _record(tmp_path, config)
+    with traces.Trace(path) as trace:
+        assert trace.meta['tokens']['token_source'] == 'estimated'
+
+    # 回放时的分词器与录制时不同（例如之后才安装了 tiktoken），占位文本会得到不同的 token 数
+    monkeypatch.setattr(tokens, 'count_tokens', lambda text: 7 * len(text))
+    replayed = _replay(path)
+    assert (replayed.reasoning_tokens, replayed.content_tokens, replayed.prompt_tokens) == \
+        (recorded.reasoning_tokens, recorded.content_tokens, recorded.prompt_tokens)
+    assert replayed.token_source == 'estimated'
@@ -0,0 +1,72 @@
+import sqlite3
+import pytest
+import tester
+from results_store import ResultStore
+
+def _result(provider='A', ttft=0.5, output_tokens=100, total_time=2.0, status='ok', model='m1'):
+    return tester.TestResult(
+        provider=provider, first_token_time=ttft, reasoning_tokens=40, reasoning_time=0.5,
+        content_tokens=output_tokens - 40, content_time=1.0, total_tokens=output_tokens + 1000,
+        total_time=total_time, model=model, status=status, prompt_tokens=1000
+    )
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultStore(tmp_path / 'results.db')
+    yield store
+    store.close()
+
+def test_append_and_query(store):
+    assert store.append([_result(), None, _result('B', ttft=1.0)], 'hello', run_id='run1', mode='seq', recorded_at=100) == 2
+    rows = store.query(run_id='run1')
+    assert sorted(row['provider'] for row in rows) == ['A', 'B']
+    row = store.query(provider='A')[0]
+    assert row['prompt'] == 'hello' and row['mode'] == 'seq' and row['status'] == 'ok'
+    # 生成速度不含 1000 个输入 tokens
+    assert row['tokens_per_second'] == pytest.approx(50.0)
+    assert store.query(prompt='other') == []
+    assert store.query(since=101) == []
+
+def test_aggregate_excludes_interrupted_results(store):
+    store.append([_result(ttft=0.4), _result(ttft=0.6), _result(ttft=3.0, output_tokens=10, status='timeout'),
+                  _result(ttft=2.0, status='stalled'), _result('B', ttft=1.0)], 'hello', recorded_at=100)
+    # query 仍返回部分结果
+    assert len(store.query(provider='A')) == 4
+    by_provider = {row['provider']: row for row in store.aggregate()}
+    assert by_provider['A']['samples'] == 2
+    assert by_provider['A']['ttft_mean'] == pytest.approx(0.5)
+    assert by_provider['A']['tps_min'] == pytest.approx(50.0)
+    assert by_provider['B']['samples'] == 1
+
+def test_aggregate_by_model_and_bucket(store):
+    store.append([_result(model='m1'), _result('B', model='m2')], 'hello', recorded_at=0)
+    store.append([_result(model='m1', ttft=1.5)], 'hello', recorded_at=10 * 86400)
+    rows = store.aggregate(group_by='model', bucket='day')
+    assert [(row['model'], row['samples']) for row in rows] == [('m1', 1), ('m1', 1), ('m2', 1)]
+    with pytest.raises(ValueError):
+        store.aggregate(group_by='worker')
+
+def test_legacy_rows(tmp_path):
+    # 旧版本：没有 status 列，生成速度按 total_tokens 计算
+    path = tmp_path / 'results.db'
+    conn = sqlite3.connect(str(path))
+    conn.execute("""
+        CREATE TABLE results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, run_id TEXT NOT NULL, recorded_at REAL NOT NULL,
+            mode TEXT, prompt_hash TEXT, provider TEXT NOT NULL, tokens_per_second REAL,
+            first_token_time REAL, reasoning_tokens INTEGER, content_tokens INTEGER,
+            total_tokens INTEGER, total_time REAL
+        )
+    """)
+    conn.execute("INSERT INTO results (run_id, recorded_at, provider, tokens_per_second, first_token_time, "
+                 "reasoning_tokens, content_tokens, total_tokens, total_time) VALUES ('old', 0, 'A', 550, 0.5, 40, 60, 1100, 2.0)")
+    conn.commit()
+    conn.close()
+
+    store = ResultStore(path)
+    try:
+        [row] = store.aggregate()
+        assert row['samples'] == 1
+        assert row['tps_mean'] == pytest.approx(50.0)
+    finally:
+        store.close()
@@ -0,0 +1,95 @@
+import threading
+import time
+import pytest
+from mock_server import MockProvider, MockServerConfig, MockSSEServer
+from router import HedgedRouter, RouterConfig
+from sse import RawChunk
+
+MESSAGES = [{'role': 'user', 'content': 'hi'}]
+
+def _server(**config):
+    return MockSSEServer(MockServerConfig(tokens_per_second=2000, reasoning_tokens=5, content_tokens=5, seed=1, **config))
+
+def _seed(router, name, ttft, samples=20):
+    for _ in range(samples):
+        router.observe(name, ttft)
+
+def test_hedge_wins_when_primary_is_slow():
+    with _server(ttft=1.0) as slow, _server(ttft=0.05) as fast:
+        providers = [MockProvider(slow.url, name='Slow'), MockProvider(fast.url, name='Fast')]
+        router = HedgedRouter(providers, RouterConfig(max_hedge_ratio=1.0, timeout=10))
+        # 模型认为 Slow 更快，首选 Slow，等待超过其 P90（0.1 秒）后对冲
+        _seed(router, 'Slow', 0.1)
+        _seed(router, 'Fast', 0.2)
+        assert [p.name for p in router.ranking()] == ['Slow', 'Fast']
+
+        with router.stream(MESSAGES) as stream:
+            chunks = list(stream)
+        assert stream.provider == 'Fast' and stream.hedged
+        assert len(chunks) > 1
+        # 调用方看到的首 token 时间包含等待首选服务商的时间
+        assert stream.ttft >= stream.provider_ttft + 0.09
+        assert stream.ttft < 0.8
+
+        snapshot = router.snapshot()
+        assert snapshot['hedged'] == 1 and snapshot['hedge_wins'] == 1
+        assert snapshot['extra_requests'] == 1
+        assert snapshot['ttft_saved_seconds'] >= 0
+        router.close()
+    # 调用方的服务商实例保留 SDK 重试
+    assert all(p.max_retries is None for p in providers)
+
+def test_no_hedge_when_primary_is_fast():
+    with _server(ttft=0.05) as fast, _server(ttft=0.05) as other:
+        router = HedgedRouter([MockProvider(fast.url, name='A'), MockProvider(other.url, name='B')],
+                              RouterConfig(default_hedge_delay=2.0, timeout=10))
+        with router.stream(MESSAGES) as stream:
+            list(stream)
+        assert not stream.hedged
+        assert stream.ttft == stream.provider_ttft
+        assert router.snapshot()['extra_requests'] == 0
+
+def test_failover_when_primary_errors():
+    with _server(ttft=0.05, error_rate=1.0) as broken, _server(ttft=0.05) as fast:
+        router = HedgedRouter([MockProvider(broken.url, name='Broken'), MockProvider(fast.url, name='Fast')],
+                              RouterConfig(timeout=10))
+        _seed(router, 'Broken', 0.01)
+        with router.stream(MESSAGES) as stream:
+            list(stream)
+        assert stream.provider == 'Fast' and not stream.hedged
+        assert router.snapshot()['failovers'] == 1
+
+def test_all_providers_fail():
+    with _server(ttft=0.05, error_rate=1.0) as broken:
+        router = HedgedRouter([MockProvider(broken.url, name='Broken')], RouterConfig(timeout=10))
+        with pytest.raises(Exception):
+            router.stream(MESSAGES)
+        assert router.snapshot()['errors'] == 1
+
+class _TrickleStream:
+    """只发送不带 token 的分块，每次读取都不会触发 SDK 的读超时"""
+
+    def __init__(self):
+        self._closed = threading.Event()
+
+    def __iter__(self):
+        while not self._closed.wait(0.02):
+            yield RawChunk({'choices': [{'delta': {'content': ''}}]})
+
+    def close(self):
+        self._closed.set()
+
+class _TrickleProvider(MockProvider):
+    def create_completion(self, messages, stream=True, timeout=None, max_tokens=None):
+        return _TrickleStream()
+
+def test_deadline_when_no_provider_outputs_a_token():
+    providers = [_TrickleProvider('http://127.0.0.1:1/v1', name='A'), _TrickleProvider('http://127.0.0.1:1/v1', name='B')]
+    router = HedgedRouter(providers, RouterConfig(default_hedge_delay=0.05, max_hedge_ratio=1.0, timeout=0.3))
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        router.stream(MESSAGES)
+    assert time.perf_counter() - start < 1.0
+    snapshot = router.snapshot()
+    assert snapshot['errors'] == 1 and snapshot['hedged'] == 1
+    assert snapshot['extra_requests'] == 0
@@ -0,0 +1,81 @@
+import email.utils
+import types
+import pytest
+from openai import DEFAULT_MAX_RETRIES
+import scheduler
+from mock_server import MockProvider
+from scheduler import TokenBucket, is_rate_limited, retry_after_seconds
+
+class _Clock:
+    """替代 scheduler 中的 time 模块：sleep 直接推进时间"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def perf_counter(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(scheduler, 'time', clock)
+    return clock
+
+def _error(headers, status_code=429):
+    return types.SimpleNamespace(status_code=status_code, response=types.SimpleNamespace(headers=headers))
+
+def test_retry_after_seconds(clock):
+    assert retry_after_seconds(_error({'retry-after-ms': '1500', 'retry-after': '9'})) == pytest.approx(1.5)
+    assert retry_after_seconds(_error({'retry-after': '2'})) == pytest.approx(2.0)
+    date = email.utils.formatdate(clock.now + 30, usegmt=True)
+    assert retry_after_seconds(_error({'retry-after': date})) == pytest.approx(30.0)
+    assert retry_after_seconds(_error({'retry-after': 'soon'})) is None
+    assert retry_after_seconds(_error({})) is None
+    assert retry_after_seconds(ValueError('no response')) is None
+
+def test_is_rate_limited():
+    assert is_rate_limited(_error({}, 429))
+    assert not is_rate_limited(_error({}, 500))
+    assert not is_rate_limited(ValueError())
+
+def test_token_bucket_rate(clock):
+    bucket = TokenBucket(rate=2.0, capacity=2)
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.slept == []
+    bucket.acquire()
+    assert sum(clock.slept) == pytest.approx(0.5)
+
+def test_token_bucket_pause(clock):
+    bucket = TokenBucket(rate=2.0, capacity=2)
+    bucket.pause(3.0)
+    start = clock.now
+    bucket.acquire()
+    # 暂停结束后桶为空，再等一个令牌
+    assert clock.now - start == pytest.approx(3.5)
+
+def test_token_bucket_without_rate_only_pauses(clock):
+    bucket = TokenBucket()
+    for _ in range(100):
+        bucket.acquire()
+    assert clock.slept == []
+    bucket.pause(1.0)
+    bucket.acquire()
+    assert sum(clock.slept) == pytest.approx(1.0)
+
+def test_without_retries_leaves_provider_unchanged():
+    provider = MockProvider('http://127.0.0.1:1/v1')
+    provider.client
+    copy = provider.without_retries()
+    assert copy.name == provider.name
+    assert copy.client.max_retries == 0
+    assert provider.max_retries is None
+    assert provider.client.max_retries == DEFAULT_MAX_RETRIES
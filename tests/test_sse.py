@@ -0,0 +1,67 @@
+import dataclasses
+import itertools
+import pytest
+from mock_server import MockProvider, MockServerConfig, MockSSEServer
+from sse import SSEStreamError, _LineSplitter, iter_raw_chunks, parse_event
+from tester import APITester
+
+def _split(pieces):
+    splitter = _LineSplitter()
+    payloads = [payload for piece in pieces for payload in splitter.feed(piece)]
+    return payloads + list(splitter.finish())
+
+def test_line_splitter_joins_events_across_chunks():
+    assert _split([b'data: {"a"', b': 1}\n\nda', b'ta: [DONE]\n\n']) == [b'{"a": 1}', b'[DONE]']
+
+def test_line_splitter_trailing_line_without_newline():
+    assert _split([b'data: {"a": 1}\n\n', b'data: [DONE]']) == [b'{"a": 1}', b'[DONE]']
+
+def test_line_splitter_with_and_without_space():
+    payloads = _split([b'data:{"a": 1}\r\n', b': keep-alive\n', b'event: message\n', b'data: {"b": 2}\n'])
+    assert payloads == [b'{"a": 1}', b'{"b": 2}']
+
+def test_parse_event():
+    assert parse_event(b'[DONE]') is None
+    chunk = parse_event(b'{"choices": [{"delta": {"reasoning_content": "r"}}], "usage": null}')
+    assert chunk.choices[0].delta.reasoning_content == 'r'
+    assert chunk.choices[0].delta.content is None
+    assert chunk.usage is None
+
+def test_parse_event_error_payload():
+    with pytest.raises(SSEStreamError, match='overloaded'):
+        parse_event(b'{"error": {"message": "overloaded", "code": 529}}')
+    with pytest.raises(SSEStreamError, match='bad'):
+        parse_event(b'{"error": "bad"}')
+
+def test_iter_raw_chunks_drains_after_done():
+    pieces = iter([b'data: {"choices": []}\n\ndata: [DONE]\n\n', b'\r\n0\r\n', b''])
+    assert len(list(iter_raw_chunks(pieces))) == 1
+    assert next(pieces, None) is None
+
+class _StepTester(APITester):
+    """时钟每次调用前进固定步长，使两种解析路径的计时结果可以逐字段比较"""
+
+    def __init__(self, **kwargs):
+        super().__init__(buffer_output=True, verbose=False, **kwargs)
+        self._ticks = itertools.count()
+
+    def clock(self) -> float:
+        return next(self._ticks) * 0.01
+
+@pytest.mark.parametrize('include_usage', [True, False])
+@pytest.mark.parametrize('metrics_only', [False, True])
+def test_raw_sse_matches_sdk(include_usage, metrics_only):
+    config = MockServerConfig(ttft=0, tokens_per_second=5000, reasoning_tokens=30, content_tokens=20,
+                              tokens_per_chunk=3, include_usage=include_usage, seed=1)
+    messages = [{'role': 'user', 'content': '给我写一首七言绝句'}]
+    with MockSSEServer(config) as server:
+        provider = MockProvider(server.url)
+        results = [
+            _StepTester(raw_sse=raw_sse, metrics_only=metrics_only).test_provider(provider, messages)
+            for raw_sse in (False, True)
+        ]
+
+    sdk, raw = [dataclasses.replace(r, started_at=None, connection=None) for r in results]
+    assert sdk.token_source == ('reported' if include_usage else 'estimated')
+    assert sdk.content_tokens > 0 and sdk.first_token_time is not None
+    assert raw == sdk
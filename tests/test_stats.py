@@ -0,0 +1,18 @@
+import pytest
+from stats import aggregate_results
+import tester
+
+def _result(provider, prompt_tokens, output_tokens, total_time=2.0):
+    return tester.TestResult(
+        provider=provider, first_token_time=0.5, reasoning_tokens=0, reasoning_time=0,
+        content_tokens=output_tokens, content_time=total_time, total_tokens=prompt_tokens + output_tokens,
+        total_time=total_time, prompt_tokens=prompt_tokens
+    )
+
+def test_tokens_per_second_counts_only_generated_tokens():
+    # B 的输入很长，但生成速度更慢
+    results = [_result('A', 10, 200), _result('A', 10, 200), _result('B', 5000, 100), _result('B', 5000, 100)]
+    ranked = aggregate_results(results, trials=2)
+    assert [a.provider for a in ranked] == ['A', 'B']
+    assert ranked[0].tokens_per_second.mean == pytest.approx(100.0)
+    assert ranked[1].tokens_per_second.mean == pytest.approx(50.0)
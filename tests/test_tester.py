@@ -0,0 +1,94 @@
+import math
+import pytest
+from mock_server import MockProvider, MockServerConfig, MockSSEServer
+from tester import APITester, ChunkedTextSink, LatencyHistogram, percentile
+
+def test_percentile_interpolates():
+    values = [4.0, 1.0, 3.0, 2.0, 5.0]
+    assert percentile(values, 0) == 1.0
+    assert percentile(values, 50) == 3.0
+    assert percentile(values, 100) == 5.0
+    assert percentile(values, 90) == pytest.approx(4.6)
+    assert percentile([2.0], 99) == 2.0
+    assert percentile([], 50) is None
+
+def test_percentile_presorted_matches_sorted():
+    values = [0.3, 0.01, 0.2, 0.05, 0.5, 0.07]
+    ordered = sorted(values)
+    for q in (0, 10, 50, 90, 99, 100):
+        assert percentile(ordered, q, presorted=True) == percentile(values, q)
+
+def test_histogram_percentiles_within_one_bucket():
+    # 1 ms 到 1000 ms 各一个样本：第 q 百分位的精确值为 q * 10 ms
+    values = [i / 1000 for i in range(1, 1001)]
+    histogram = LatencyHistogram()
+    histogram.extend(values)
+    assert histogram.count == 1000 and histogram.max == 1.0
+    for q in (1, 50, 90, 99):
+        exact = values[math.ceil(len(values) * q / 100) - 1]
+        assert histogram.percentile(q) == pytest.approx(exact, rel=LatencyHistogram.GROWTH - 1)
+    assert histogram.percentile(100) == pytest.approx(1.0, rel=LatencyHistogram.GROWTH - 1)
+
+def test_histogram_add_matches_extend():
+    values = [0.00005, 0.001, 0.02, 0.02, 3.0, 1000.0]
+    added, extended = LatencyHistogram(), LatencyHistogram()
+    for value in values:
+        added.add(value)
+    extended.extend(values)
+    assert list(added.counts) == list(extended.counts)
+    assert added.max == extended.max == 1000.0
+
+def test_histogram_edges():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(50) is None
+    histogram.add(0.00001)
+    # 低于最小桶的样本报告为样本本身，不超过最大值
+    assert histogram.percentile(50) == 0.00001
+    # 超过 MAX_VALUE 的样本落在最后一个桶，max 仍为精确值
+    histogram.add(5000.0)
+    assert histogram.max == 5000.0
+    assert histogram.percentile(100) <= 5000.0
+
+def _run(**kwargs):
+    config = MockServerConfig(ttft=0, tokens_per_second=5000, reasoning_tokens=30, content_tokens=20,
+                              tokens_per_chunk=2, seed=1)
+    messages = [{'role': 'user', 'content': '给我写一首七言绝句'}]
+    tester = APITester(buffer_output=True, verbose=False, **kwargs)
+    with MockSSEServer(config) as server:
+        result = tester.test_provider(MockProvider(server.url, name='mock/a b'), messages)
+    return tester, result
+
+def test_metrics_only_keeps_counters_not_text():
+    full, full_result = _run()
+    lean, lean_result = _run(metrics_only=True)
+
+    assert full.reasoning_text and full.content_text
+    assert lean.reasoning_text == '' and lean.content_text == ''
+    assert (lean.reasoning_chars, lean.content_chars) == (len(full.reasoning_text), len(full.content_text))
+
+    # 只保留间隔直方图，不保留逐块到达时间
+    assert len(lean.chunk_times) == 0
+    assert lean.chunk_gaps.count == lean.chunk_count - 1
+    assert full.chunk_gaps is None and len(full.chunk_times) == full.chunk_count
+    assert lean.chunk_count == full.chunk_count
+    assert lean_result.content_tokens == full_result.content_tokens
+    assert lean_result.itl_max is not None and lean_result.itl_p50 <= lean_result.itl_max
+
+def test_sink_dir_streams_text_to_file(tmp_path):
+    tester, result = _run(metrics_only=True, sink_dir=tmp_path)
+    [path] = tmp_path.iterdir()
+    assert path.name.startswith('mock_a_b_')
+    text = path.read_text(encoding='utf-8')
+    assert '【reasoning】' in text and '【content】' in text
+    assert len(text) > tester.reasoning_chars + tester.content_chars
+
+def test_chunked_text_sink_flushes_by_size(tmp_path):
+    sink = ChunkedTextSink(tmp_path, 'p', chunk_size=32)
+    sink.write('content', 'abc')
+    assert sink._pending_size == len('\n【content】\nabc')
+    sink.write('content', 'x' * 20)
+    # 达到块大小后整块写出，缓冲清空
+    assert sink._pending == [] and sink._pending_size == 0
+    sink.write('reasoning', 'r')
+    sink.close()
+    assert sink.path.read_text(encoding='utf-8') == '\n【content】\nabc' + 'x' * 20 + '\n【reasoning】\nr'
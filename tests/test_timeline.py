@@ -0,0 +1,27 @@
+import math
+from timeline import lttb
+
+def test_lttb_keeps_endpoints_and_threshold():
+    xs = [i * 0.01 for i in range(1000)]
+    ys = [math.sin(x * 7) for x in xs]
+    for threshold in (3, 10, 100, 999):
+        sampled_x, sampled_y = lttb(xs, ys, threshold)
+        assert len(sampled_x) == len(sampled_y) == threshold
+        assert (sampled_x[0], sampled_y[0]) == (xs[0], ys[0])
+        assert (sampled_x[-1], sampled_y[-1]) == (xs[-1], ys[-1])
+        # 保留的是原始点，且按时间顺序
+        assert sampled_x == sorted(sampled_x)
+        assert all(ys[round(x * 100)] == y for x, y in zip(sampled_x, sampled_y))
+
+def test_lttb_keeps_spike():
+    xs = list(range(100))
+    ys = [0.0] * 100
+    ys[37] = 5.0
+    sampled_x, sampled_y = lttb(xs, ys, 10)
+    assert 37 in sampled_x and max(sampled_y) == 5.0
+
+def test_lttb_passthrough():
+    xs, ys = [0.0, 1.0, 2.0], [1.0, 3.0, 2.0]
+    assert lttb(xs, ys, 3) == (xs, ys)
+    assert lttb(xs, ys, 10) == (xs, ys)
+    assert lttb(xs, ys, 2) == (xs, ys)
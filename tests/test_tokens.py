@@ -0,0 +1,43 @@
+import pytest
+import tokens
+from tokens import TokenEstimator, count_message_tokens, count_tokens
+
+@pytest.fixture
+def heuristic(monkeypatch):
+    """不论是否安装了 tiktoken，都使用按字符估算的规则"""
+    monkeypatch.setattr(tokens, 'get_encoder', lambda name=tokens.ENCODING: None)
+
+def test_count_tokens_heuristic(heuristic):
+    assert tokens.estimator_name() == 'heuristic'
+    assert count_tokens('') == 0
+    assert count_tokens('a') == 1
+    assert count_tokens('a' * 10) == 3
+    assert count_tokens('中' * 10) == 6
+    assert count_tokens('ab' * 5 + '中' * 10) == 9
+
+def test_count_message_tokens(heuristic):
+    messages = [
+        {'role': 'system', 'content': 'a' * 10},
+        {'role': 'user', 'content': [{'type': 'text', 'text': '中' * 10}, {'type': 'image_url'}]},
+    ]
+    assert count_message_tokens(messages) == 3 + 6
+
+def test_estimator_counts_phases(heuristic):
+    estimator = TokenEstimator()
+    estimator.add('reasoning', 'a' * 5)
+    estimator.add('reasoning', 'a' * 5)
+    estimator.add('content', '中' * 10)
+    assert estimator.count('reasoning') == 3
+    assert estimator.count('content') == 6
+    assert estimator.count() == 9
+
+def test_estimator_extrapolates_overflow(heuristic, monkeypatch):
+    monkeypatch.setattr(tokens, 'BUFFER_CHARS', 20)
+    estimator = TokenEstimator()
+    for _ in range(10):
+        estimator.add('content', '中' * 10)
+    # 只缓冲前 20 个字符（12 tokens），其余 80 个字符按同样的比例外推
+    assert sum(map(len, estimator._parts['content'])) == 20
+    assert estimator._overflow_chars['content'] == 80
+    assert estimator.count('content') == 12 + 48
+    assert estimator.count('reasoning') == 0
@@ -0,0 +1,193 @@
+"""
+Per-stream token timelines for the HTML report charts
+
+When enabled (reporting modes only), every APITester keeps the arrival time
+and phase of its token-bearing chunks in a ChunkTimeline. Memory is bounded:
+once MAX_POINTS points are held, every other point is dropped and only every
+second chunk is sampled from then on. When the test finishes the samples
+are converted to cumulative tokens and downsampled with LTTB
+(Largest-Triangle-Three-Buckets), which keeps the visual shape of the curve,
+to at most POINTS points. The result is a small StreamTimeline on the TestResult.
+
+Providers report token counts once per stream, not per chunk, so each
+phase's reported tokens are spread evenly over that phase's chunks.
+"""
+from array import array
+from itertools import accumulate
+from typing import Dict, List, Optional, Sequence, Tuple
+
+MAX_POINTS = 4096  # Raw samples kept per stream before decimation
+POINTS = 256       # Points kept per stream after LTTB
+
+_enabled = False
+
+def enable(enabled: bool = True):
+    """Turn timeline collection on or off for testers started from now on"""
+    global _enabled
+    _enabled = enabled
+
+def recorder() -> Optional['ChunkTimeline']:
+    """A ChunkTimeline for a new test if collection is on, else None"""
+    return ChunkTimeline() if _enabled else None
+
+def lttb(xs: Sequence[float], ys: Sequence[float], threshold: int) -> Tuple[List[float], List[float]]:
+    """
+    Downsample a series to threshold points with Largest-Triangle-Three-Buckets
+
+    The first and last points are kept; from each bucket in between, the point
+    forming the largest triangle with the previously kept point and the mean of
+    the next bucket is kept.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(xs), list(ys)
+
+    # Prefix sums give each bucket's mean in constant time
+    sum_x = [0.0, *accumulate(xs)]
+    sum_y = [0.0, *accumulate(ys)]
+    sampled_x, sampled_y = [xs[0]], [ys[0]]
+    every = (n - 2) / (threshold - 2)
+    ax, ay = xs[0], ys[0]
+    end = 1
+    for i in range(threshold - 2):
+        start = end
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        span = next_end - end
+        mean_x = (sum_x[next_end] - sum_x[end]) / span
+        mean_y = (sum_y[next_end] - sum_y[end]) / span
+
+        # Point of the current bucket with the largest triangle area
+        dx, dy = ax - mean_x, mean_y - ay
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs(dx * (ys[j] - ay) - (ax - xs[j]) * dy)
+            if area > best_area:
+                best, best_area = j, area
+        ax, ay = xs[best], ys[best]
+        sampled_x.append(ax)
+        sampled_y.append(ay)
+
+    sampled_x.append(xs[-1])
+    sampled_y.append(ys[-1])
+    return sampled_x, sampled_y
+
+class StreamTimeline:
+    """
+    Downsampled token timeline of one stream
+
+    Attributes:
+        times: Seconds since the request started
+        tokens: Cumulative output tokens at each time
+        reasoning_end: Time of the last reasoning chunk, or None without reasoning
+        content_start: Time of the first content chunk, or None without content
+        itl_buckets: Inter-token gaps as {LatencyHistogram bucket index: count}
+    """
+
+    __slots__ = ('times', 'tokens', 'reasoning_end', 'content_start', 'itl_buckets')
+
+    def __init__(self, times, tokens, reasoning_end, content_start, itl_buckets):
+        self.times = times
+        self.tokens = tokens
+        self.reasoning_end = reasoning_end
+        self.content_start = content_start
+        self.itl_buckets = itl_buckets
+
+    def __repr__(self):
+        return f"StreamTimeline({len(self.times)} points)"
+
+    def to_dict(self) -> dict:
+        """JSON-serializable form, e.g. for sending results between processes"""
+        return {
+            'times': list(self.times),
+            'tokens': list(self.tokens),
+            'reasoning_end': self.reasoning_end,
+            'content_start': self.content_start,
+            'itl_buckets': self.itl_buckets,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'StreamTimeline':
+        """Inverse of to_dict(); JSON turns the bucket indices into strings"""
+        return cls(
+            array('d', data['times']),
+            array('d', data['tokens']),
+            data['reasoning_end'],
+            data['content_start'],
+            {int(index): count for index, count in data['itl_buckets'].items()},
+        )
+
+class ChunkTimeline:
+    """Bounded sample of chunk arrivals of one stream"""
+
+    def __init__(self):
+        self.times = array('d')
+        # Chunk number within its phase, 1-based: negative for reasoning, positive for content
+        self.positions = array('l')
+        self.reasoning_chunks = 0
+        self.content_chunks = 0
+        self.reasoning_end = None
+        self.content_start = None
+        self._stride = 1
+        self._skip = 1
+        self._last_time = None
+        self._last_position = 0
+
+    def add(self, elapsed: float, phase: str):
+        """Record a token-bearing chunk of the given phase"""
+        if phase == 'reasoning':
+            self.reasoning_chunks += 1
+            position = -self.reasoning_chunks
+            self.reasoning_end = elapsed
+        else:
+            self.content_chunks += 1
+            position = self.content_chunks
+            if self.content_start is None:
+                self.content_start = elapsed
+        self._last_time = elapsed
+        self._last_position = position
+
+        # Sample every stride-th chunk; halve the samples and double the stride when full
+        self._skip -= 1
+        if self._skip:
+            return
+        self._skip = self._stride
+        self.times.append(elapsed)
+        self.positions.append(position)
+        if len(self.times) >= MAX_POINTS:
+            self.times = self.times[::2]
+            self.positions = self.positions[::2]
+            self._stride *= 2
+
+    def finish(self, reasoning_tokens: int, content_tokens: int, gaps=None) -> Optional[StreamTimeline]:
+        """
+        Build the StreamTimeline
+
+        Args:
+            reasoning_tokens: Final reasoning token count
+            content_tokens: Final content token count
+            gaps: LatencyHistogram of the inter-token gaps, if any
+
+        Returns:
+            StreamTimeline, or None if no token-bearing chunk arrived
+        """
+        if self._last_time is None:
+            return None
+        times, positions = list(self.times), list(self.positions)
+        if positions[-1] != self._last_position:
+            times.append(self._last_time)
+            positions.append(self._last_position)
+
+        per_reasoning_chunk = reasoning_tokens / self.reasoning_chunks if self.reasoning_chunks else 0
+        per_content_chunk = content_tokens / self.content_chunks if self.content_chunks else 0
+        tokens = [
+            -position * per_reasoning_chunk if position < 0
+            else reasoning_tokens + position * per_content_chunk
+            for position in positions
+        ]
+
+        times, tokens = lttb(times, tokens, POINTS)
+        buckets: Dict[int, int] = {}
+        if gaps is not None:
+            buckets = {index: count for index, count in enumerate(gaps.counts) if count}
+        return StreamTimeline(array('d', times), array('d', tokens), self.reasoning_end, self.content_start, buckets)
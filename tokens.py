@@ -0,0 +1,105 @@
+"""
+Client-side token estimation for providers that omit streaming usage
+
+APITester relies on the final usage chunk for token counts. Some providers
+ignore stream_options={"include_usage": True} or leave out
+completion_tokens_details, so the counts (and tokens/s) would be missing.
+TokenEstimator counts the streamed deltas per phase instead, so those
+results can still be ranked; they are flagged as estimated.
+
+With tiktoken installed the counts come from a local BPE tokenizer, loaded
+once per process when the first APITester is created, outside any timed
+request. This is not the providers' own tokenizer, so counts are
+close but not exact. Without tiktoken a character-based rule of thumb is
+used (about 0.3 tokens per ASCII character and 0.6 per Chinese character,
+as published by DeepSeek).
+"""
+import functools
+from typing import List, Optional
+
+ENCODING = 'cl100k_base'
+ASCII_TOKENS_PER_CHAR = 0.3
+WIDE_TOKENS_PER_CHAR = 0.6
+BUFFER_CHARS = 1 << 16  # Text kept per phase for tokenizing after the stream; longer streams are extrapolated
+
+@functools.lru_cache(maxsize=None)
+def get_encoder(name: str = ENCODING):
+    """
+    Return the tiktoken encoding, loaded once per process
+
+    Returns:
+        The encoding, or None if tiktoken is not installed or its vocabulary
+        cannot be loaded (it is downloaded and cached on first use)
+    """
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(name)
+    except Exception:
+        return None
+
+def estimator_name() -> str:
+    """Name of the counting method in use, for reports"""
+    return f"tiktoken:{ENCODING}" if get_encoder() is not None else "heuristic"
+
+def count_tokens(text: str) -> int:
+    """Estimate the number of tokens in text"""
+    if not text:
+        return 0
+    encoder = get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    # CJK characters take 3 bytes in UTF-8, so the byte surplus gives the wide character count
+    wide = (len(text.encode('utf-8')) - len(text)) // 2
+    return max(1, round((len(text) - wide) * ASCII_TOKENS_PER_CHAR + wide * WIDE_TOKENS_PER_CHAR))
+
+def count_message_tokens(messages: List[dict]) -> int:
+    """Estimate prompt tokens of a chat request from the text content of its messages"""
+    total = 0
+    for message in messages:
+        content = message.get('content')
+        if isinstance(content, str):
+            total += count_tokens(content)
+        elif isinstance(content, list):
+            total += sum(count_tokens(part.get('text', '')) for part in content if isinstance(part, dict))
+    return total
+
+class TokenEstimator:
+    """
+    Token counter for the reasoning and content phases
+
+    add() only keeps references to the streamed deltas, so providers that do
+    report usage pay nothing inside the timed loop; the text is tokenized once,
+    in count(), after the stream has ended. Memory is bounded: beyond
+    BUFFER_CHARS per phase only the character count is kept, and the
+    overflow is estimated at the tokens-per-character rate of the buffered text.
+    """
+
+    PHASES = ('reasoning', 'content')
+
+    def __init__(self):
+        self._parts = {phase: [] for phase in self.PHASES}
+        self._buffered_chars = dict.fromkeys(self.PHASES, 0)
+        self._overflow_chars = dict.fromkeys(self.PHASES, 0)
+        self._counts = {}
+
+    def add(self, phase: str, text: str):
+        """Record a streamed delta of the given phase"""
+        if self._buffered_chars[phase] < BUFFER_CHARS:
+            self._parts[phase].append(text)
+            self._buffered_chars[phase] += len(text)
+        else:
+            self._overflow_chars[phase] += len(text)
+
+    def _count_phase(self, phase: str) -> int:
+        if phase not in self._counts:
+            tokens = count_tokens(''.join(self._parts[phase]))
+            if self._overflow_chars[phase]:
+                tokens += round(self._overflow_chars[phase] * tokens / self._buffered_chars[phase])
+            self._parts[phase] = []
+            self._counts[phase] = tokens
+        return self._counts[phase]
+
+    def count(self, phase: Optional[str] = None) -> int:
+        """Estimated tokens of one phase, or of both when phase is None; call once the stream has ended"""
+        phases = self.PHASES if phase is None else (phase,)
+        return sum(self._count_phase(name) for name in phases)
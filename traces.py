@@ -0,0 +1,198 @@
+"""
+Compact binary traces of streamed responses, for offline replay
+
+While a TraceRecorder is active every APITester writes one file per stream
+with the arrival time, phase and size of each delta and the usage payloads.
+The generated text itself is not stored. replay.py feeds the traces back
+through APITester, so TestResults and reports can be recomputed after a
+metric or report change without calling the APIs again.
+
+File layout (little-endian):
+
+    HEADER  magic b'APITRACE', version u16, flags u16, event count u32, meta length u32
+    META    UTF-8 JSON of meta length bytes, zero-padded to a multiple of 8
+    EVENTS  event count records of EVENT: time f64, value u32, size u32, kind u8
+
+Event time is seconds since the request started. For DELTA_* events value is
+the length in characters and size the length in UTF-8 bytes; for USAGE value
+indexes meta['usage']. The event array is fixed-size, so readers can mmap the
+file and walk it without parsing.
+
+Token counts the tester had to estimate (no usage chunk, or no reasoning
+breakdown) are stored in meta['tokens']: the text is not kept, so replay could
+not reproduce a tokenizer-based estimate from the event sizes alone.
+"""
+import itertools
+import json
+import mmap
+import os
+import re
+import struct
+import time
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+MAGIC = b'APITRACE'
+VERSION = 1
+HEADER = struct.Struct('<8sHHII')
+EVENT = struct.Struct('<dIIB')
+SUFFIX = '.trace'
+
+DELTA_REASONING = 1
+DELTA_CONTENT = 2
+USAGE = 3
+KINDS = {'reasoning': DELTA_REASONING, 'content': DELTA_CONTENT}
+
+_active: Optional['TraceRecorder'] = None
+
+def stream_trace() -> Optional['StreamTrace']:
+    """A StreamTrace for a new test if a recorder is active, else None"""
+    if _active is None:
+        return None
+    return _active.new_trace()
+
+def text_size(text: str) -> Tuple[int, int]:
+    """(characters, UTF-8 bytes) of text"""
+    return len(text), len(text.encode('utf-8'))
+
+def _usage_payload(usage) -> dict:
+    """The usage of a chunk as a plain dict, from raw SSE or SDK objects"""
+    raw = getattr(usage, 'raw', None)
+    if raw is not None:
+        return raw
+    if hasattr(usage, 'model_dump'):
+        return usage.model_dump(exclude_none=True)
+    return dict(vars(usage))
+
+class StreamTrace:
+    """Events of one stream, buffered in memory and written when the test finishes"""
+
+    def __init__(self, directory: Path, context: dict):
+        self.directory = directory
+        self.path = None
+        self.meta = dict(context)
+        self.usage: List[dict] = []
+        self._events = bytearray()
+        self._count = 0
+
+    def delta(self, phase: str, elapsed: float, text: str):
+        """Record a reasoning or content delta arriving elapsed seconds after the start"""
+        chars, size = text_size(text)
+        self._events += EVENT.pack(elapsed, chars, size, KINDS[phase])
+        self._count += 1
+
+    def usage_chunk(self, elapsed: float, usage):
+        """Record a usage payload"""
+        self._events += EVENT.pack(elapsed, len(self.usage), 0, USAGE)
+        self.usage.append(_usage_payload(usage))
+        self._count += 1
+
+    def finish(self, provider, status: str, connection: str, total_time: float, messages=None, tokens=None):
+        """
+        Write the trace file; a temporary name is used so readers never see a partial file
+
+        Args:
+            tokens: Estimated token counts and token_source, if the counts were not all reported
+        """
+        if tokens:
+            self.meta['tokens'] = tokens
+        self.meta.update(
+            provider=provider.name,
+            model=provider.model,
+            status=status,
+            connection=connection,
+            total_time=total_time,
+            usage=self.usage,
+            prompt=[list(text_size(m['content'])) for m in messages or () if isinstance(m.get('content'), str)],
+        )
+        self.path = self.directory / f"{self.meta['sequence']:06d}_{safe_name(provider.name)}{SUFFIX}"
+        meta = json.dumps(self.meta, ensure_ascii=False).encode('utf-8')
+        padding = -len(meta) % 8
+        temporary = self.path.with_name(self.path.name + '.tmp')
+        with open(temporary, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, self._count, len(meta)))
+            f.write(meta)
+            f.write(b'\0' * padding)
+            f.write(self._events)
+        os.replace(temporary, self.path)
+
+class TraceRecorder:
+    """
+    Run-level trace recording, active between start() and stop()
+
+    Args:
+        directory: Directory for the trace files, created if missing
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.context = {}
+        self._sequence = itertools.count()
+
+    def new_trace(self) -> StreamTrace:
+        sequence = next(self._sequence)
+        context = dict(self.context, sequence=sequence, recorded_at=time.time())
+        return StreamTrace(self.directory, context)
+
+    def start(self):
+        global _active
+        self.directory.mkdir(parents=True, exist_ok=True)
+        _active = self
+        return self
+
+    def stop(self):
+        global _active
+        if _active is self:
+            _active = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+def set_context(**fields):
+    """Attach fields (e.g. workload_id) to the meta of traces started from now on; None removes a field"""
+    if _active is None:
+        return
+    context = dict(_active.context, **fields)
+    _active.context = {key: value for key, value in context.items() if value is not None}
+
+class Trace:
+    """A trace file opened with mmap"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.count, meta_length = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{self.path} is not a version {VERSION} trace file")
+        self.meta = json.loads(self._mmap[HEADER.size:HEADER.size + meta_length])
+        self._offset = HEADER.size + meta_length + (-meta_length % 8)
+
+    def events(self) -> Iterator[Tuple[float, int, int, int]]:
+        """(time, value, size, kind) of each event, read straight from the mapping"""
+        for index in range(self.count):
+            yield EVENT.unpack_from(self._mmap, self._offset + index * EVENT.size)
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def trace_files(*paths) -> List[Path]:
+    """Trace files in the given files or directories (searched recursively), in recording order"""
+    files = []
+    for path in map(Path, paths):
+        files.extend(sorted(path.rglob(f'*{SUFFIX}')) if path.is_dir() else [path])
+    return files
+
+def safe_name(name: str) -> str:
+    """A provider name usable in file names"""
+    return re.sub(r'[^\w.-]+', '_', name).strip('_') or 'provider'
@@ -0,0 +1,173 @@
+import json
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence
+
+# 长度扫描使用的填充文本；按约 4 字符/token 估算目标长度，实际输入 token 数以服务商返回的 usage 为准
+_FILLER = (
+    "The quick brown fox jumps over the lazy dog while the river keeps flowing past the old mill. "
+    "Engineers measure latency carefully, because small delays add up across many requests. "
+)
+_CHARS_PER_TOKEN = 4
+
+@dataclass
+class WorkloadItem:
+    """工作负载中的单条请求"""
+    id: str
+    messages: List[dict]
+    max_tokens: Optional[int] = None
+    tags: List[str] = field(default_factory=list)
+    wait: float = 0.0   # 发送前等待的秒数，例如等服务商建立前缀缓存
+    salts: Optional[dict] = field(default=None, repr=False)  # 按服务商加盐时为 {服务商名称: 盐}，同一轮的请求共用
+
+    def messages_for(self, provider: str) -> List[dict]:
+        """
+        发给指定服务商的消息
+
+        按服务商加盐时在第一条消息开头加上该服务商本轮的随机标识，使共用同一后端的服务商
+        （例如同一服务商的 V3 和 R1 组合）不会共享前缀缓存；同一轮中同一服务商的请求使用同一标识。
+        """
+        if self.salts is None:
+            return self.messages
+        salt = self.salts.setdefault(provider, uuid.uuid4().hex)
+        first, *rest = self.messages
+        return [{**first, 'content': f"[{salt}]\n{first['content']}"}, *rest]
+
+    @property
+    def prompt(self) -> str:
+        """最后一条用户消息的文本，用于报告和结果库"""
+        for message in reversed(self.messages):
+            if message.get('role') == 'user' and isinstance(message.get('content'), str):
+                return message['content']
+        return json.dumps(self.messages, ensure_ascii=False)
+
+def _parse_item(data: dict, index: int, prompt_field: str, max_tokens: Optional[int]) -> WorkloadItem:
+    """把一行 JSON 转为 WorkloadItem"""
+    if 'messages' in data:
+        messages = data['messages']
+    elif prompt_field in data:
+        messages = [{'role': 'user', 'content': str(data[prompt_field])}]
+    else:
+        raise ValueError(f"缺少 '{prompt_field}' 或 'messages' 字段")
+
+    tags = data.get('tags') or []
+    if isinstance(tags, str):
+        tags = [tags]
+
+    return WorkloadItem(
+        id=str(data.get('id') or data.get('request_id') or index),
+        messages=messages,
+        max_tokens=data.get('max_tokens', max_tokens),
+        tags=[str(tag) for tag in tags]
+    )
+
+def iter_workload(
+    path,
+    prompt_field: str = 'prompt',
+    tags: Optional[Sequence[str]] = None,
+    limit: Optional[int] = None,
+    max_tokens: Optional[int] = None
+) -> Iterator[WorkloadItem]:
+    """
+    逐行读取 JSONL 工作负载，不把整个语料加载到内存
+
+    每行一个 JSON 对象：messages（消息列表）或 prompt_field 指定的文本字段二选一，
+    可选 id、max_tokens 和 tags。空行和以 # 开头的行会被跳过。
+
+    Args:
+        path: JSONL 文件路径
+        prompt_field: 提示词文本所在的字段名
+        tags: 只保留带有其中任一标签的请求
+        limit: 最多读取的请求数
+        max_tokens: 行内未指定时使用的默认 max_tokens
+
+    Yields:
+        WorkloadItem
+    """
+    wanted = set(tags) if tags else None
+    count = 0
+    with open(Path(path), encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if limit is not None and count >= limit:
+                return
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                item = _parse_item(json.loads(line), line_number, prompt_field, max_tokens)
+            except (json.JSONDecodeError, ValueError) as e:
+                raise ValueError(f"工作负载 {path} 第 {line_number} 行无效：{e}") from e
+            if wanted is not None and not wanted.intersection(item.tags):
+                continue
+            count += 1
+            yield item
+
+def parse_lengths(value: str) -> List[int]:
+    """解析长度扫描参数，例如 "128,512,2048,8192" """
+    lengths = [int(part) for part in value.split(',') if part.strip()]
+    if not lengths or any(length <= 0 for length in lengths):
+        raise ValueError(f"无效的输入长度列表：{value}")
+    return sorted(lengths)
+
+def sweep_prompt(input_tokens: int) -> str:
+    """
+    构造约 input_tokens 个 token 的提示词
+
+    开头放随机标识，使每个提示词前缀都不同，避免服务商的前缀缓存让长提示词的首 token 时间失真。
+    """
+    instruction = "Summarize the following text in one sentence.\n\n"
+    nonce = f"[{uuid.uuid4().hex}]\n"
+    target_chars = max(0, input_tokens * _CHARS_PER_TOKEN - len(instruction) - len(nonce))
+    repeats = target_chars // len(_FILLER) + 1
+    return nonce + instruction + (_FILLER * repeats)[:target_chars]
+
+def length_sweep(lengths: Sequence[int], max_tokens: Optional[int] = 64) -> Iterator[WorkloadItem]:
+    """
+    按输入长度从短到长生成请求，用于绘制首 token 时间随输入 token 数的变化
+
+    输出长度默认限制为 64 tokens，测试时间主要花在预填充上。
+    """
+    for length in sorted(lengths):
+        yield WorkloadItem(
+            id=f"sweep-{length}",
+            messages=[{'role': 'user', 'content': sweep_prompt(length)}],
+            max_tokens=max_tokens,
+            tags=['sweep']
+        )
+
+# 缓存测试中预热请求依次追加的问题；共享前缀之后只有这一段不同，模拟多轮对话中重复发送的上下文
+_CACHE_QUESTIONS = (
+    "Summarize the text above in one sentence.",
+    "List three keywords from the text above.",
+    "What is the main subject of the text above?",
+    "Rewrite the first sentence of the text above more formally.",
+    "Give the text above a short title.",
+)
+
+def cache_prompts(prefix_tokens: int, warm: int = 3, wait: float = 5.0, max_tokens: Optional[int] = 64) -> Iterator[WorkloadItem]:
+    """
+    前缀缓存测试：先发送一次带新共享前缀的请求（冷，缓存未命中），再发送 warm 次前缀相同、结尾问题不同的请求（热）
+
+    每轮试验生成新的随机前缀，冷请求不会命中之前的缓存；前缀再按服务商加盐（见 WorkloadItem.messages_for），
+    共用同一后端的服务商也不会命中彼此的缓存。服务商建立缓存需要时间（DeepSeek 为秒级），
+    第一个热请求发送前等待 wait 秒。
+
+    Args:
+        prefix_tokens: 共享前缀的目标 token 数
+        warm: 热请求数
+        wait: 冷请求完成后、第一个热请求发送前的等待时间（秒）
+        max_tokens: 输出上限，默认 64，测试时间主要花在预填充上
+    """
+    prefix = sweep_prompt(prefix_tokens)
+    salts = {}
+    for index in range(warm + 1):
+        question = _CACHE_QUESTIONS[index % len(_CACHE_QUESTIONS)]
+        yield WorkloadItem(
+            id='cache-cold' if index == 0 else f'cache-warm-{index}',
+            messages=[{'role': 'user', 'content': f"{prefix}\n\n{question}"}],
+            max_tokens=max_tokens,
+            tags=['cache', 'warm' if index else 'cold'],
+            wait=wait if index == 1 else 0.0,
+            salts=salts
+        )